@@ -1,6 +1,9 @@
 import io
 import contextlib
 import builtins
+import importlib
+import threading
+import time
 from typing import Dict, Any
 
 from agent.models import ToolResult
@@ -21,10 +24,85 @@ SAFE_BUILTINS = {
 }
 
 
+# Bound in every execution namespace, imported once per process
+PRELOADED_MODULES = {
+    "pd": "pandas",
+    "np": "numpy",
+    "plt": "matplotlib.pyplot",
+    "px": "plotly.express",
+    "sns": "seaborn",
+}
+# Rarely used heavy modules, imported on first attribute access
+LAZY_MODULES = {
+    "ydata_profiling": "ydata_profiling",
+    "scipy": "scipy",
+    "stats": "scipy.stats",
+}
+
+import_timings: Dict[str, float] = {}  # module -> seconds spent importing it in this process
+
+
+def _timed_import(name: str):
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_timings.setdefault(name, round(time.perf_counter() - start, 3))
+    return module
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported when code first uses it."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = _timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+_warm_namespace: Dict[str, Any] = {}
+_warm_lock = threading.Lock()
+
+
+def warm_namespace() -> Dict[str, Any]:
+    """
+    Build the preloaded execution namespace once per process.
+
+    Import times are recorded in `import_timings` and logged, so the
+    cold-start cost of a process is visible.
+    """
+    if _warm_namespace:
+        return _warm_namespace
+    with _warm_lock:
+        if not _warm_namespace:
+            start = time.perf_counter()
+            namespace = {}
+            for alias, name in PRELOADED_MODULES.items():
+                try:
+                    namespace[alias] = _timed_import(name)
+                except ImportError as e:
+                    logger.warning(f"Sandbox preload of {name} failed: {e}")
+            for alias, name in LAZY_MODULES.items():
+                namespace[alias] = LazyModule(name)
+            _warm_namespace.update(namespace)
+            logger.info(f"Sandbox namespace warmed in {time.perf_counter() - start:.2f}s, import timings: {import_timings}")
+    return _warm_namespace
+
+
 def get_safe_globals() -> Dict[str, Any]:
-    return {"__builtins__": SAFE_BUILTINS}
+    return {"__builtins__": SAFE_BUILTINS, **warm_namespace()}
 
 import os
+import shutil
 import tempfile
 import glob
 from core.logger import logger
@@ -36,7 +114,15 @@ try:
 except ImportError:
     pass
 
-def run_code_capture(code: str, initial_locals: Dict[str, Any] = None) -> ToolResult:
+def run_code_capture(code: str, initial_locals: Dict[str, Any] = None, output_dir: str = None) -> ToolResult:
+    """
+    Execute validated code and capture stdout, locals and artifacts.
+
+    Artifacts are written by the code straight into `output_dir` (normally an
+    ArtifactService staging directory) and returned as paths inside it; they
+    are not copied. Without `output_dir` a temporary directory is created,
+    which the caller owns once it holds artifacts.
+    """
     errors = validate_code(code)
     if errors:
         return ToolResult(
@@ -49,54 +135,49 @@ def run_code_capture(code: str, initial_locals: Dict[str, Any] = None) -> ToolRe
     stdout = io.StringIO()
     locals_dict = initial_locals.copy() if initial_locals else {}
     
-    # Use TemporaryDirectory context manager for automatic cleanup
-    with tempfile.TemporaryDirectory(prefix="agent_artifacts_") as artifact_dir:
-        locals_dict["output_dir"] = artifact_dir
-        
-        safe_globals = get_safe_globals()
-
-        try:
-            with contextlib.redirect_stdout(stdout):
-                exec(code, safe_globals, locals_dict)
-            
-            # Scan for artifacts and copy them to a persistent location
-            # before the temp directory is cleaned up
-            artifacts = []
-            persistent_dir = tempfile.mkdtemp(prefix="agent_artifacts_persist_")
-            
-            # Log artifact scanning
-            all_files = glob.glob(os.path.join(artifact_dir, "*"))
-            logger.info(f"[ARTIFACT LIFECYCLE] Scanning artifact_dir={artifact_dir}, found {len(all_files)} items: {all_files}")
-            
-            for file_path in all_files:
-                if os.path.isfile(file_path):
-                    file_size = os.path.getsize(file_path)
-                    logger.info(f"[ARTIFACT LIFECYCLE] Found artifact file: {file_path} (size={file_size} bytes)")
-                    # Copy to persistent location
-                    dest = os.path.join(persistent_dir, os.path.basename(file_path))
-                    import shutil
-                    shutil.copy2(file_path, dest)
-                    logger.info(f"[ARTIFACT LIFECYCLE] Copied to persistent location: {dest}")
-                    artifacts.append(dest)
-                else:
-                    logger.info(f"[ARTIFACT LIFECYCLE] Skipping non-file item: {file_path}")
-            
-            logger.info(f"[ARTIFACT LIFECYCLE] Final artifacts list: {artifacts}")
-            
-            return ToolResult(
-                stdout=stdout.getvalue(),
-                error=None,
-                locals=sanitize_locals(locals_dict),
-                artifacts=artifacts
-            )
-        except Exception as e:
-            return ToolResult(
-                stdout=stdout.getvalue(),
-                error=str(e),
-                locals={},
-                artifacts=[]
-            )
+    owns_dir = output_dir is None
+    artifact_dir = output_dir or tempfile.mkdtemp(prefix="agent_artifacts_")
+    locals_dict["output_dir"] = artifact_dir
+    
+    safe_globals = get_safe_globals()
 
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(code, safe_globals, locals_dict)
+        
+        # Log artifact scanning
+        all_files = glob.glob(os.path.join(artifact_dir, "*"))
+        logger.info(f"[ARTIFACT LIFECYCLE] Scanning artifact_dir={artifact_dir}, found {len(all_files)} items: {all_files}")
+        
+        artifacts = []
+        for file_path in all_files:
+            if os.path.isfile(file_path):
+                file_size = os.path.getsize(file_path)
+                logger.info(f"[ARTIFACT LIFECYCLE] Found artifact file: {file_path} (size={file_size} bytes)")
+                artifacts.append(file_path)
+            else:
+                logger.info(f"[ARTIFACT LIFECYCLE] Skipping non-file item: {file_path}")
+        
+        logger.info(f"[ARTIFACT LIFECYCLE] Final artifacts list: {artifacts}")
+        if owns_dir and not artifacts:
+            shutil.rmtree(artifact_dir, ignore_errors=True)
+        
+        return ToolResult(
+            stdout=stdout.getvalue(),
+            error=None,
+            # Injected context is already known to the model; only report what the code produced
+            locals=sanitize_locals(locals_dict, skip={**(initial_locals or {}), "output_dir": artifact_dir}),
+            artifacts=artifacts
+        )
+    except Exception as e:
+        if owns_dir:
+            shutil.rmtree(artifact_dir, ignore_errors=True)
+        return ToolResult(
+            stdout=stdout.getvalue(),
+            error=str(e),
+            locals={},
+            artifacts=[]
+        )
 
 TOOLS = [
     {
@@ -113,5 +194,17 @@ TOOLS = [
                 "additionalProperties": False
             }
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "generate_profile_report",
+            "description": "Get the full ydata_profiling EDA report of `df` (HTML for the user, JSON summary for you). Built once per dataset in the background and cached.",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "additionalProperties": False
+            }
+        }
     }
 ]
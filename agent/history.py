@@ -0,0 +1,221 @@
+"""
+History Manager - Token-budgeted conversation replay.
+
+Stored messages can hold large HTML, code blocks and tool output, so replaying
+all of them makes every LLM request grow with the conversation. The manager
+keeps the most recent turns that fit a token budget and folds everything older
+into a compact extractive summary.
+
+Key features:
+- Token counts via tiktoken when installed, otherwise a chars/4 estimate
+- Replies stored with structured parts are replayed as compact assistant/tool
+  messages rather than their rendered markup
+- Recent turns are kept whole, starting at a user message
+- Older turns are summarized one line per message; the summary is extended
+  incrementally and cached on the conversation (see SessionManager.get_agent)
+- `is_complete` tells callers loading newest-first pages when older rows can
+  no longer change the result, so long conversations are not read in full
+"""
+
+import hashlib
+import html
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from agent.message_parts import replay_messages
+from core.config import settings
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or encoding files unavailable offline
+    _encoding = None
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_LINE_CHARS = 200
+SUMMARY_HEADER = "Summary of earlier conversation (older messages omitted):"
+MIN_SUMMARY_LINE_TOKENS = 3  # "- Role: " plus the joining newline
+DIGEST_CACHE_SIZE = 4096
+
+_DETAILS_RE = re.compile(r"<details>.*?</details>", re.DOTALL)
+_CODE_RE = re.compile(r"```.*?```", re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+
+class DigestCache:
+    """
+    Small LRU of values computed from a text, keyed on a digest of the text.
+
+    Stored replies can be megabytes of markup; keying on the text itself
+    would keep thousands of them alive for the life of the process.
+    """
+
+    def __init__(self, compute: Callable[[str], Any], max_entries: int = DIGEST_CACHE_SIZE):
+        self.compute = compute
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str) -> Any:
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = self.compute(text)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+def _encode_tokens(text: str) -> int:
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+_token_counts = DigestCache(_encode_tokens)
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return _token_counts(text)
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+    for call in message.get("tool_calls") or []:
+        tokens += count_tokens(call["function"]["name"]) + count_tokens(call["function"]["arguments"])
+    return tokens
+
+
+# Cached as JSON text so every caller gets its own, freely mutable messages
+_parts_replay = DigestCache(lambda parts: json.dumps(replay_messages(json.loads(parts))))
+
+
+def replay(message: Any) -> List[Dict[str, Any]]:
+    """Chat messages for a stored row: its structured parts if recorded, else its content."""
+    parts = getattr(message, "parts", None)
+    if parts:
+        return json.loads(_parts_replay(parts))
+    return [{"role": message.role, "content": message.content}]
+
+
+def row_tokens(message: Any) -> int:
+    parts = getattr(message, "parts", None)
+    if parts:
+        return sum(message_tokens(m) for m in replay(message))
+    return message_tokens({"content": message.content})
+
+
+def summarize_message(role: str, content: str) -> str:
+    """One-line extractive summary: tool runs, code and markup are dropped."""
+    text = _DETAILS_RE.sub(" [ran analysis code] ", content or "")
+    text = _CODE_RE.sub(" [code] ", text)
+    text = html.unescape(_TAG_RE.sub(" ", text))
+    text = _WS_RE.sub(" ", text).strip()
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS].rstrip() + "..."
+    return f"- {role.capitalize()}: {text}"
+
+
+@dataclass
+class HistoryWindow:
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    summary: Optional[str] = None
+    summary_upto_id: Optional[int] = None  # id of the last message folded into the summary
+
+
+class HistoryManager:
+    def __init__(self, max_tokens: int, summary_max_tokens: int):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+    def build(self, messages: Sequence[Any], system_prompt: str = "",
+              cached_summary: Optional[str] = None, cached_upto_id: Optional[int] = None) -> HistoryWindow:
+        """
+        Select the messages to replay.
+
+        `messages` are stored rows (with id, role and content) in
+        chronological order. A cached summary is reused and only extended with
+        messages newer than `cached_upto_id`.
+        """
+        if not messages:
+            return HistoryWindow()
+
+        start = self._window_start(messages, system_prompt)
+        recent = [replayed for m in messages[start:] for replayed in replay(m)]
+        older = messages[:start]
+        if not older:
+            return HistoryWindow(messages=recent)
+
+        upto_id = older[-1].id
+        if cached_summary and cached_upto_id is not None and cached_upto_id <= upto_id:
+            lines = cached_summary.split("\n")[1:]
+            new = [m for m in older if m.id > cached_upto_id]
+        else:
+            lines, new = [], older
+        lines.extend(summarize_message(m.role, m.content) for m in new)
+
+        # Keep the newest summary lines within the summary budget
+        used = count_tokens(SUMMARY_HEADER)
+        kept = []
+        for line in reversed(lines):
+            used += count_tokens(line) + 1
+            if used > self.summary_max_tokens:
+                break
+            kept.append(line)
+        summary = "\n".join([SUMMARY_HEADER] + kept[::-1])
+
+        return HistoryWindow(messages=recent, summary=summary, summary_upto_id=upto_id)
+
+    def is_complete(self, messages: Sequence[Any], system_prompt: str = "",
+                    cached_upto_id: Optional[int] = None) -> bool:
+        """
+        Whether `messages`, the newest rows of a longer conversation, already
+        give the same `build` result as the full history.
+
+        That holds once the replay budget is exhausted and the older rows
+        reach back to the cached summary or could fill the summary budget
+        on their own.
+        """
+        if not messages:
+            return False
+        start = self._window_start(messages, system_prompt)
+        if start == 0:
+            return False
+        if cached_upto_id is not None and messages[0].id <= cached_upto_id:
+            return True
+        return start >= self.summary_max_tokens // MIN_SUMMARY_LINE_TOKENS
+
+    def _window_start(self, messages: Sequence[Any], system_prompt: str) -> int:
+        budget = self.max_tokens - count_tokens(system_prompt) - self.summary_max_tokens
+        start = len(messages) - 1  # the latest message is always kept
+        used = row_tokens(messages[start])
+        while start > 0:
+            cost = row_tokens(messages[start - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+
+        # Begin the window on a user turn so the model never sees a dangling reply
+        while 0 < start < len(messages) - 1 and messages[start].role != "user":
+            start += 1
+        return start
+
+
+# Singleton instance
+history_manager = HistoryManager(
+    max_tokens=settings.HISTORY_MAX_TOKENS,
+    summary_max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+)
@@ -0,0 +1,162 @@
+"""
+Message Parts - Structured record of an assistant reply.
+
+Replies used to be stored only as the HTML/markdown streamed to the browser,
+and that markup was replayed to the LLM as plain assistant text: tokens were
+spent on `<details>` blocks and code fences, and the tool calls and results
+behind them were lost.
+
+Key features:
+- A reply is stored as parts: text, tool_call, tool_result and artifact
+  (a storage key, never a URL or markup)
+- `render_parts` produces the markup the chat stream shows; it is cached in
+  `Message.content` and can be rebuilt from the parts
+- `replay_messages` turns parts back into assistant/tool messages, so the
+  LLM sees its own earlier tool calls and their compact outputs
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from agent.uploads import artifact_markdown
+
+INTERRUPTED_TOOL_RESULT = "Tool call did not complete."
+
+
+class ReplyParts:
+    """Collects the events of one agent run into structured parts."""
+
+    def __init__(self):
+        self._parts: List[Dict[str, Any]] = []
+        self._text: List[str] = []  # chunks of the trailing text part
+
+    def add(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Record an agent event.
+
+        Returns the part the event adds (for text, just this chunk), or None
+        if the event is not part of the stored reply (status, errors).
+        """
+        kind = event.get("type")
+        if kind == "delta":
+            if not event.get("content"):
+                return None
+            self._text.append(event["content"])
+            return {"type": "text", "content": event["content"]}
+        if kind == "tool_code":
+            part = {"type": "tool_call", "id": event.get("tool_call_id", ""),
+                    "name": event.get("name", "run_code_capture"),
+                    "arguments": event.get("arguments") or json.dumps({"code": event["content"]})}
+        elif kind == "tool_output":
+            part = {"type": "tool_result", "tool_call_id": event.get("tool_call_id", ""),
+                    "content": event["content"]}
+        elif kind == "artifact" and event.get("key"):
+            part = {"type": "artifact", "key": event["key"], "filename": event["filename"]}
+            if event.get("deferred"):
+                part["deferred"] = True
+        else:
+            return None
+        self._close_text()
+        self._parts.append(part)
+        return part
+
+    @property
+    def parts(self) -> List[Dict[str, Any]]:
+        self._close_text()
+        return self._parts
+
+    def _close_text(self):
+        if not self._text:
+            return
+        text = "".join(self._text)
+        self._text = []
+        if self._parts and self._parts[-1]["type"] == "text":
+            self._parts[-1]["content"] += text
+        else:
+            self._parts.append({"type": "text", "content": text})
+
+
+def _displayed_code(part: Dict[str, Any]) -> str:
+    if part["name"] == "run_code_capture":
+        try:
+            return json.loads(part["arguments"]).get("code", "")
+        except (ValueError, AttributeError):
+            return part["arguments"]
+    return f"{part['name']}()"
+
+
+def render_part(part: Dict[str, Any]) -> str:
+    """Markup shown in the chat for one part."""
+    kind = part["type"]
+    if kind == "text":
+        return part["content"]
+    if kind == "tool_call":
+        return f"\n<details><summary>Executing Code</summary>\n\n```python\n{_displayed_code(part)}\n```\n"
+    if kind == "tool_result":
+        return f"\n**Output:**\n\n```\n{part['content']}\n```\n\n</details>\n"
+    if kind == "artifact":
+        # Import artifact service here to avoid circular imports
+        from backend.core.artifacts import artifact_service
+        md = artifact_markdown(part["filename"], artifact_service.get_artifact_url(part["key"]))
+        if md is None:
+            return ""
+        if part.get("deferred"):
+            # Upload finished after its tool block was closed; there is no details block to break out of
+            return f"\n\n{md}\n\n"
+        # Close the code execution details to show the artifact prominently
+        return f"\n</details>\n\n{md}\n\n<details><summary>Execution Output</summary>\n"
+    return ""
+
+
+def render_parts(parts: List[Dict[str, Any]]) -> str:
+    return "".join(render_part(part) for part in parts)
+
+
+def replay_messages(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Chat-completion messages for a stored reply.
+
+    Artifacts are left out; the tool result already names the generated
+    files. A call without a result (the stream was cut off) gets a
+    placeholder, since every tool call needs a response.
+    """
+    messages: List[Dict[str, Any]] = []
+    text: List[str] = []
+    calls: Dict[str, Dict[str, Any]] = {}  # unanswered calls by id
+    results: Dict[str, Dict[str, Any]] = {}  # tool messages of the current step by call id
+
+    def answer_open_calls():
+        for call_id, call in calls.items():
+            messages.append({"role": "tool", "tool_call_id": call_id, "name": call["name"],
+                             "content": INTERRUPTED_TOOL_RESULT})
+        calls.clear()
+
+    for part in parts:
+        kind = part["type"]
+        if kind == "text":
+            text.append(part["content"])
+        elif kind == "tool_call":
+            answer_open_calls()
+            results.clear()
+            messages.append({
+                "role": "assistant",
+                "content": "".join(text) or None,
+                "tool_calls": [{"id": part["id"], "type": "function",
+                                "function": {"name": part["name"], "arguments": part["arguments"]}}],
+            })
+            text = []
+            calls[part["id"]] = part
+        elif kind == "tool_result":
+            call_id = part["tool_call_id"]
+            if call_id in results:
+                # A tool can report more than once (an error, then its output)
+                results[call_id]["content"] += "\n" + part["content"]
+            elif call_id in calls:
+                results[call_id] = {"role": "tool", "tool_call_id": call_id,
+                                    "name": calls.pop(call_id)["name"], "content": part["content"]}
+                messages.append(results[call_id])
+
+    answer_open_calls()
+    if text:
+        messages.append({"role": "assistant", "content": "".join(text)})
+    return messages
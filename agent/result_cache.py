@@ -0,0 +1,185 @@
+"""
+Result Cache - Content-addressed cache of tool-code executions.
+
+Users often regenerate or re-ask a question, and the LLM then emits the same
+`run_code_capture` code against the same dataset again. Results are cached
+under a hash of the dataset version, the conversation and the normalized code
+AST, so a repeat returns immediately without re-executing.
+
+Key features:
+- Keys ignore formatting and comments (`ast.dump` of the parsed code)
+- Entries hold stdout, sanitized locals and the ArtifactService keys and
+  rendered events of the artifacts the run produced, never local file paths
+- Those keys belong to one conversation, so entries are scoped to it and
+  dropped when it is deleted
+- Bounded by TTL and an approximate byte budget (LRU eviction)
+- Code that reads randomness or the clock is never cached
+"""
+
+import ast
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from agent.models import ToolResult
+from core.config import settings
+from core.logger import logger
+
+# Names whose results change between runs; any use disables caching
+NONDETERMINISTIC_NAMES = {
+    "random", "rand", "randn", "randint", "random_sample", "choice", "shuffle",
+    "permutation", "default_rng", "uuid1", "uuid4",
+    "now", "today", "utcnow", "time", "time_ns", "perf_counter", "monotonic",
+}
+
+
+class _NondeterminismVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.found = False
+
+    def visit_Name(self, node):
+        if node.id in NONDETERMINISTIC_NAMES:
+            self.found = True
+
+    def visit_Attribute(self, node):
+        if node.attr in NONDETERMINISTIC_NAMES:
+            self.found = True
+        self.generic_visit(node)
+
+    def visit_alias(self, node):
+        if node.name.split(".")[-1] in NONDETERMINISTIC_NAMES:
+            self.found = True
+
+    def visit_Call(self, node):
+        # `df.sample()` is random unless seeded
+        if (isinstance(node.func, ast.Attribute) and node.func.attr == "sample"
+                and not any(kw.arg == "random_state" for kw in node.keywords)):
+            self.found = True
+        self.generic_visit(node)
+
+
+def is_deterministic(tree: ast.AST) -> bool:
+    visitor = _NondeterminismVisitor()
+    visitor.visit(tree)
+    return not visitor.found
+
+
+def cache_key(dataset_version: Optional[str], code: str, scope: Optional[str] = None) -> Optional[str]:
+    """
+    Return the cache key for running `code` on a dataset version, or None if uncacheable.
+
+    `scope` (the conversation id) keeps results, and the artifact keys they
+    hold, from being served to other conversations.
+    """
+    if not dataset_version:
+        return None
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    if not is_deterministic(tree):
+        return None
+    digest = hashlib.sha256()
+    digest.update(dataset_version.encode())
+    digest.update(b"\0")
+    digest.update((scope or "").encode())
+    digest.update(b"\0")
+    digest.update(ast.dump(tree).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedResult:
+    result: ToolResult  # artifacts hold ArtifactService keys
+    artifact_events: List[Dict[str, Any]] = field(default_factory=list)
+    artifact_msg: str = ""
+    scope: Optional[str] = None  # conversation that owns the artifact keys
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def nbytes(self) -> int:
+        size = len(self.result.stdout) + len(self.artifact_msg)
+        size += sum(len(k) + len(v) for k, v in self.result.locals.items())
+        size += sum(len(k) for k in self.result.artifacts)
+        size += sum(len(str(e.get("content", ""))) for e in self.artifact_events)
+        return size
+
+
+class ResultCache:
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created_at > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return CachedResult(
+            result=entry.result.model_copy(deep=True),
+            artifact_events=list(entry.artifact_events),
+            artifact_msg=entry.artifact_msg,
+            scope=entry.scope,
+            created_at=entry.created_at,
+        )
+
+    def put(self, key: str, entry: CachedResult):
+        size = entry.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+        logger.info(f"Cached tool result {key[:12]} ({size} bytes)")
+
+    def discard_scope(self, scope: str) -> int:
+        """Drop every entry of a conversation, e.g. once its artifacts are deleted."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry.scope == scope]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.nbytes
+
+
+# Singleton instance
+result_cache = ResultCache(
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+)
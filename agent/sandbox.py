@@ -0,0 +1,367 @@
+"""
+Sandbox Pool - Out-of-process execution of LLM-generated code.
+
+Code runs in a pool of warm worker processes instead of a thread of the API
+process, so CPU-heavy pandas work does not contend with the server on the GIL
+and a runaway job can be killed.
+
+Key features:
+- Workers are forked from a forkserver that already imported pandas, numpy,
+  matplotlib, plotly and seaborn, and build the preloaded execution namespace
+  (see executor.warm_namespace) before reporting ready
+- Datasets are attached from shared memory by reference (see shared_frames)
+- Per-job CPU-time limit (RLIMIT_CPU inside the worker) and wall-clock limit
+  (enforced by the parent, which kills the worker)
+- Workers are recycled after a number of jobs or once their peak RSS exceeds
+  a threshold
+- A worker that dies or hangs before reporting ready is killed and spawned
+  again; replacements keep retrying in the background, so a slot is never lost
+"""
+
+import asyncio
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from agent.models import ToolResult
+from agent.shared_frames import SharedFrameRef
+from core.config import settings
+from core.logger import logger
+
+SPAWN_ATTEMPTS = 3
+RESPAWN_DELAY_SECONDS = 1.0  # first background retry after a failed replacement, doubled up to the max
+RESPAWN_MAX_DELAY_SECONDS = 60.0
+
+WARM_MODULES = [
+    "agent.executor",
+    "agent.shared_frames",
+    "pandas",
+    "numpy",
+    "matplotlib.pyplot",
+    "plotly.express",
+    "seaborn",
+]
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _limit_cpu(seconds: int):
+    """Allow the next job `seconds` of CPU time; the kernel sends SIGXCPU past that."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, cpu_seconds: int):
+    """Worker loop: receive (code, locals, shared refs, output dir), run it, send back (ToolResult, peak RSS)."""
+    from agent.executor import import_timings, run_code_capture, warm_namespace
+    from agent.shared_frames import attach_frame
+
+    warm_namespace()
+    conn.send(("ready", dict(import_timings)))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        code, initial_locals, shared_refs, output_dir = job
+        _limit_cpu(cpu_seconds)
+        try:
+            for name, ref in shared_refs.items():
+                initial_locals[name] = attach_frame(ref)
+        except Exception as e:
+            conn.send((ToolResult(stdout="", error=f"Failed to attach dataset: {e}", locals={}, artifacts=[]),
+                       _peak_rss_bytes()))
+            continue
+        result = run_code_capture(code, initial_locals, output_dir)
+        conn.send((result, _peak_rss_bytes()))
+
+
+class WorkerSpawnError(RuntimeError):
+    """A sandbox worker exited or hung before reporting ready."""
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pool of pre-forked worker processes running `run_code_capture`.
+
+    Jobs queue for the next idle worker. With `size=0` the pool falls back to
+    running code on a thread of the current process.
+    """
+
+    def __init__(self, size: int, max_jobs_per_worker: int, max_rss_mb: int,
+                 cpu_seconds: int, wall_seconds: int, spawn_timeout: float = 120):
+        self.size = size
+        self.spawn_timeout = spawn_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: Dict[int, _Worker] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._ctx = None
+
+        self.jobs_run = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.recycled = 0
+        self.spawn_failures = 0
+        self.last_spawn_seconds = 0.0
+        self.import_timings: Dict[str, float] = {}
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
+
+    async def start(self):
+        if self.size <= 0:
+            # Code runs in this process; pay the import cost now rather than on the first request
+            from agent.executor import import_timings, warm_namespace
+            await asyncio.to_thread(warm_namespace)
+            self.import_timings = dict(import_timings)
+            return
+        if self.started:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            self._ctx = multiprocessing.get_context("forkserver")
+            self._ctx.set_forkserver_preload(WARM_MODULES)
+            # One thread per worker to wait on its pipe, plus spares for respawning
+            self._executor = ThreadPoolExecutor(max_workers=self.size * 2, thread_name_prefix="sandbox")
+
+            loop = asyncio.get_running_loop()
+            workers = await asyncio.gather(*(loop.run_in_executor(self._executor, self._spawn_with_retry)
+                                             for _ in range(self.size)), return_exceptions=True)
+            failed = [w for w in workers if isinstance(w, BaseException)]
+            if failed:
+                for worker in workers:
+                    if isinstance(worker, _Worker):
+                        self._retire(worker)
+                self._executor.shutdown(wait=False)
+                raise failed[0]
+            self._idle = asyncio.Queue()
+            for worker in workers:
+                self._idle.put_nowait(worker)
+        logger.info(f"Sandbox pool started with {self.size} workers")
+
+    async def shutdown(self):
+        if not self.started:
+            return
+        for worker in list(self._workers.values()):
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.kill()
+        self._workers.clear()
+        self._idle = None
+        self._executor.shutdown(wait=False)
+        logger.info("Sandbox pool shut down")
+
+    async def run(self, code: str, initial_locals: Dict[str, Any] = None,
+                  shared_refs: Optional[Dict[str, SharedFrameRef]] = None,
+                  output_dir: Optional[str] = None) -> ToolResult:
+        """
+        Run code in a worker.
+
+        Names in `shared_refs` are attached in the worker from shared memory
+        instead of pickling the matching entries of `initial_locals`. Artifacts
+        are written directly into `output_dir`, which must be on a filesystem
+        the workers share with this process.
+        """
+        if self.size <= 0:
+            from agent.executor import run_code_capture
+            return await asyncio.to_thread(run_code_capture, code, initial_locals, output_dir)
+
+        shared_refs = shared_refs or {}
+        # A file unlinked over the shared-frame budget is sent pickled instead
+        missing = [name for name, ref in shared_refs.items()
+                   if not os.path.exists(ref.path) and name in (initial_locals or {})]
+        if missing:
+            logger.info(f"Shared frames {missing} are no longer published, sending them pickled")
+            shared_refs = {name: ref for name, ref in shared_refs.items() if name not in missing}
+        job_locals = {k: v for k, v in (initial_locals or {}).items() if k not in shared_refs}
+
+        await self.start()
+        loop = asyncio.get_running_loop()
+        worker = await self._idle.get()
+        try:
+            result, peak_rss = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self._roundtrip, worker, (code, job_locals, shared_refs, output_dir)),
+                timeout=self.wall_seconds,
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Sandbox job exceeded {self.wall_seconds}s wall clock, killing worker {worker.pid}")
+            await self._release(worker, replace=True)
+            return ToolResult(stdout="", error=f"Execution timed out after {self.wall_seconds} seconds", locals={}, artifacts=[])
+        except (EOFError, OSError) as e:
+            self.crashes += 1
+            logger.warning(f"Sandbox worker {worker.pid} died during job: {e!r}")
+            await self._release(worker, replace=True)
+            return ToolResult(
+                stdout="",
+                error=f"Execution was terminated (CPU time limit of {self.cpu_seconds}s exceeded or worker crashed)",
+                locals={},
+                artifacts=[]
+            )
+        except BaseException:
+            # Cancelled (e.g. client disconnect) while the job may still be running:
+            # the worker cannot be handed out again, so replace it in the background
+            asyncio.ensure_future(self._release(worker, replace=True))
+            raise
+
+        self.jobs_run += 1
+        worker.jobs += 1
+        recycle = worker.jobs >= self.max_jobs_per_worker or peak_rss > self.max_rss_bytes
+        if recycle:
+            logger.info(f"Recycling sandbox worker {worker.pid} (jobs={worker.jobs}, peak_rss={peak_rss})")
+            self.recycled += 1
+            # Respawning waits for the new worker to warm up; don't make this request wait for it
+            asyncio.ensure_future(self._release(worker, replace=True))
+        else:
+            await self._release(worker)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "jobs_run": self.jobs_run,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "recycled": self.recycled,
+            "spawn_failures": self.spawn_failures,
+            "last_spawn_seconds": self.last_spawn_seconds,
+            "import_timings": self.import_timings,
+        }
+
+    def _spawn(self) -> _Worker:
+        start = time.perf_counter()
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.cpu_seconds),
+            daemon=True,
+            name="sandbox-worker",
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self._workers[process.pid] = worker
+
+        # Wait until the worker has its namespace warmed; the first spawn also pays for the forkserver preload
+        error = None
+        try:
+            if parent_conn.poll(self.spawn_timeout):
+                _, timings = parent_conn.recv()
+            else:
+                error = f"was not ready after {self.spawn_timeout}s"
+        except (EOFError, OSError) as e:
+            error = f"exited during startup ({e!r})"
+        if error:
+            self.spawn_failures += 1
+            self._retire(worker)
+            raise WorkerSpawnError(f"Sandbox worker {process.pid} {error}")
+        if not self.import_timings:
+            self.import_timings = timings
+        self.last_spawn_seconds = round(time.perf_counter() - start, 3)
+        logger.info(f"Sandbox worker {process.pid} ready in {self.last_spawn_seconds:.2f}s, import timings: {timings}")
+        return worker
+
+    def _spawn_with_retry(self) -> _Worker:
+        for attempt in range(1, SPAWN_ATTEMPTS + 1):
+            try:
+                return self._spawn()
+            except WorkerSpawnError as e:
+                logger.error(f"{e} (attempt {attempt}/{SPAWN_ATTEMPTS})")
+                if attempt == SPAWN_ATTEMPTS:
+                    raise
+
+    def _retire(self, worker: _Worker):
+        self._workers.pop(worker.pid, None)
+        worker.kill()
+
+    @staticmethod
+    def _roundtrip(worker: _Worker, job):
+        worker.conn.send(job)
+        return worker.conn.recv()
+
+    async def _release(self, worker: _Worker, replace: bool = False):
+        """
+        Return a worker to the idle queue, swapping it for a fresh one if asked.
+
+        Also called fire-and-forget, so it does not raise: a replacement that
+        cannot be started is retried with backoff until the pool shuts down.
+        """
+        if replace:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._retire, worker)
+            worker = await self._respawn()
+            if worker is None:
+                return
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+        else:
+            # The pool was shut down while the replacement was starting
+            self._retire(worker)
+
+    async def _respawn(self) -> Optional[_Worker]:
+        loop = asyncio.get_running_loop()
+        delay = RESPAWN_DELAY_SECONDS
+        while self.started:
+            try:
+                return await loop.run_in_executor(self._executor, self._spawn_with_retry)
+            except Exception as e:
+                logger.error(f"Failed to replace sandbox worker, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESPAWN_MAX_DELAY_SECONDS)
+        return None
+
+
+# Singleton instance
+sandbox_pool = SandboxPool(
+    size=settings.SANDBOX_WORKERS,
+    max_jobs_per_worker=settings.SANDBOX_MAX_JOBS_PER_WORKER,
+    max_rss_mb=settings.SANDBOX_MAX_RSS_MB,
+    cpu_seconds=settings.SANDBOX_CPU_SECONDS,
+    wall_seconds=settings.SANDBOX_WALL_SECONDS,
+    spawn_timeout=settings.SANDBOX_SPAWN_TIMEOUT_SECONDS,
+)
@@ -1,11 +1,70 @@
-def sanitize_locals(locals_dict):
+import reprlib
+
+# Per-value character budget for locals sent back to the LLM
+MAX_VALUE_CHARS = 500
+HEAD_ITEMS = 5
+
+_repr = reprlib.Repr()
+_repr.maxlist = _repr.maxtuple = _repr.maxset = _repr.maxfrozenset = HEAD_ITEMS
+_repr.maxdict = HEAD_ITEMS
+_repr.maxstring = MAX_VALUE_CHARS
+_repr.maxother = MAX_VALUE_CHARS
+
+
+def _truncate(text: str, budget: int) -> str:
+    if len(text) <= budget:
+        return text
+    return text[:budget] + f"... ({len(text) - budget} more chars)"
+
+
+def summarize_value(v, budget: int = MAX_VALUE_CHARS) -> str:
+    """
+    Cheap, bounded text summary of a value.
+
+    Frames and arrays are described by shape and dtypes instead of being
+    rendered, so wide or long intermediates never produce huge strings.
+    """
+    type_name = v.__class__.__name__
+    module = v.__class__.__module__ or ""
+
+    if module.startswith("pandas") and type_name == "DataFrame":
+        dtypes = ", ".join(f"{col}: {dtype}" for col, dtype in v.dtypes.items())
+        return _truncate(f"DataFrame shape={v.shape} dtypes={{{dtypes}}}", budget)
+
+    if module.startswith("pandas") and type_name == "Series":
+        head = v.head(HEAD_ITEMS).to_string()
+        return _truncate(f"Series name={v.name!r} length={len(v)} dtype={v.dtype}\n{head}", budget)
+
+    if module.startswith("numpy") and type_name == "ndarray":
+        head = _repr.repr(v.ravel()[:HEAD_ITEMS].tolist())
+        return _truncate(f"ndarray shape={v.shape} dtype={v.dtype} head={head}", budget)
+
+    if isinstance(v, (list, tuple, set, frozenset, dict)):
+        return _truncate(f"{type_name} len={len(v)}: {_repr.repr(v)}", budget)
+
+    if isinstance(v, (str, bytes, int, float, bool)) or v is None:
+        return _truncate(str(v), budget)
+
+    return _truncate(_repr.repr(v), budget)
+
+
+def sanitize_locals(locals_dict, skip=None):
+    """
+    Summarize sandbox locals for the tool message.
+
+    Entries in `skip` (the injected context, e.g. `df` and `output_dir`) are
+    left out as long as the code did not rebind them.
+    """
+    skip = skip or {}
     safe_locals = {}
 
     for k, v in locals_dict.items():
         if hasattr(v, "__module__") and v.__class__.__name__ == "module":
             continue
+        if k in skip and skip[k] is v:
+            continue
         try:
-            safe_locals[k] = str(v)
+            safe_locals[k] = summarize_value(v)
         except Exception:
             safe_locals[k] = "<unserializable>"
 
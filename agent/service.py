@@ -1,30 +1,42 @@
 import json
-import asyncio
+import functools
 import os
 import shutil
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from typing import List, Dict, Any, Optional, AsyncGenerator, Awaitable, Callable
 import traceback
 from datetime import datetime
 
 from core.client import get_client
-from agent.executor import TOOLS, run_code_capture
+from agent.executor import TOOLS
+from agent.sandbox import sandbox_pool
+from agent.shared_frames import SharedFrameRef
+from agent.result_cache import CachedResult, cache_key, result_cache
+from agent.uploads import ArtifactUploader, PendingArtifact, html_artifact_markdown
 from agent.prompts import SYSTEM_PROMPT_TEMPLATE, format_system_prompt
 from agent.models import ToolResult
 from core.config import settings
 from core.logger import logger
 from core.ratelimit import limiter, RateLimitExceeded
 
+
 class CSVAgent:
-    def __init__(self, system_prompt: str = "", context: Dict[str, Any] = None, session_id: str = None):
+    def __init__(self, system_prompt: str = "", context: Dict[str, Any] = None, session_id: str = None,
+                 shared_refs: Dict[str, SharedFrameRef] = None, user_id: str = "anonymous",
+                 dataset_version: str = None, report_provider: Callable[[], Awaitable[Any]] = None):
         self.client = get_client()
         self.messages: List[Dict[str, Any]] = []
         self.context = context or {}
+        self.shared_refs = shared_refs or {}  # context entries workers attach from shared memory
         self.session_id = session_id  # Required for artifact scoping
+        self.user_id = user_id  # Rate limits are per user
+        self.dataset_version = dataset_version  # Scopes cached tool results to the exact data
+        self.report_provider = report_provider  # Returns the cached profiling report, or None if not ready
         if system_prompt:
             self.messages.append({"role": "system", "content": system_prompt})
 
-    def add_message(self, role: str, content: str):
-        self.messages.append({"role": role, "content": content})
+    def add_message(self, role: str, content: Optional[str], **fields: Any):
+        """Append a chat message; `fields` carry tool_calls / tool_call_id for replayed tool turns."""
+        self.messages.append({"role": role, "content": content, **fields})
 
     async def run(self) -> AsyncGenerator[Dict[str, Any], None]:
         """
@@ -34,10 +46,23 @@ class CSVAgent:
         # Import artifact service here to avoid circular imports
         from backend.core.artifacts import artifact_service
         
+        uploads = ArtifactUploader(artifact_service, self.session_id or "default",
+                                   settings.ARTIFACT_UPLOAD_CONCURRENCY)
+        async for part in self._run_steps(artifact_service, uploads):
+            yield part
+        # Uploads still in flight are part of this response
+        async for event in uploads.drain():
+            yield event
+
+    async def _run_steps(self, artifact_service, uploads: ArtifactUploader) -> AsyncGenerator[Dict[str, Any], None]:
         steps = 0
         while steps < settings.MAX_STEPS:
+            # Artifacts committed since the last tool block closed
+            for event in uploads.ready(deferred=True):
+                yield event
+
             try:
-                limiter.acquire() 
+                await limiter.acquire(self.user_id, settings.MODEL_NAME)
             except RateLimitExceeded as e:
                 logger.warning("Rate limit exceeded")
                 yield {"type": "error", "content": f"Error: {str(e)}"}
@@ -113,91 +138,84 @@ class CSVAgent:
                     logger.info(f"Tool Call: {func_name} args={args_str}")
 
                     if func_name == "run_code_capture":
+                        staging_dir = None
                         try:
                             args = json.loads(args_str)
                             code_to_run = args.get("code", "")
                             
                             # Yield code first
-                            yield {"type": "tool_code", "content": code_to_run}
+                            yield {"type": "tool_code", "content": code_to_run, "tool_call_id": tool_call_data["id"],
+                                   "name": func_name, "arguments": args_str}
 
-                            # Run code execution in a separate thread
-                            result: ToolResult = await asyncio.to_thread(
-                                run_code_capture, 
-                                code_to_run, 
-                                initial_locals=self.context
-                            )
+                            # Identical code on the same dataset version returns the cached result;
+                            # entries are per conversation since they reference its artifact keys
+                            result_key = cache_key(self.dataset_version, code_to_run, scope=self.session_id)
+                            cached = result_cache.get(result_key) if result_key else None
+                            
+                            if cached:
+                                logger.info(f"Tool result served from cache ({result_key[:12]})")
+                                result: ToolResult = cached.result
+                            else:
+                                # Run code execution in a sandbox worker process, writing artifacts
+                                # straight into a staging directory that is committed to storage below
+                                staging_dir = artifact_service.create_staging_dir()
+                                result: ToolResult = await sandbox_pool.run(
+                                    code_to_run, 
+                                    initial_locals=self.context,
+                                    shared_refs=self.shared_refs,
+                                    output_dir=staging_dir
+                                )
                             
                             logger.debug(f"Tool Output: {result.stdout[:100] if result.stdout else '(empty)'}...")
                             
                             # Initialize artifact_msg outside the conditional to avoid reference errors
                             artifact_msg = ""
                             
-                            if result.error:
-                                yield {"type": "tool_output", "content": f"Error: {result.error}"}
+                            if cached:
+                                artifact_msg = cached.artifact_msg
+                                for event in cached.artifact_events:
+                                    yield event
+                            elif result.error:
+                                yield {"type": "tool_output", "content": f"Error: {result.error}",
+                                       "tool_call_id": tool_call_data["id"]}
                             else:
-                                # Process Artifacts using the new service
-                                artifacts_to_cleanup = []
-                                
+                                cacheable = result_key is not None
                                 for artifact_path in result.artifacts:
+                                    filename = os.path.basename(artifact_path)
                                     logger.info(f"[ARTIFACT LIFECYCLE] Processing artifact: {artifact_path}")
-                                    try:
-                                        filename = os.path.basename(artifact_path)
-                                        conversation_id = self.session_id or "default"
-                                        logger.info(f"[ARTIFACT LIFECYCLE] Filename={filename}, conversation_id={conversation_id}")
-                                        
-                                        # Save to permanent storage
-                                        logger.info(f"[ARTIFACT LIFECYCLE] Saving artifact to permanent storage...")
-                                        key = artifact_service.save_artifact(artifact_path, conversation_id)
-                                        logger.info(f"[ARTIFACT LIFECYCLE] Artifact saved with key: {key}")
-                                        url = artifact_service.get_artifact_url(key)
-                                        logger.info(f"[ARTIFACT LIFECYCLE] Artifact URL: {url}")
-                                        artifacts_to_cleanup.append(artifact_path)
-                                        
-                                        # Generate appropriate markdown based on file type
-                                        if filename.endswith(".png"):
-                                            md = f"\n![Generated Plot]({url})\n"
-                                            logger.info(f"[ARTIFACT LIFECYCLE] Generated PNG artifact markdown: {md}")
-                                            logger.info(f"[ARTIFACT LIFECYCLE] Yielding PNG artifact event")
-                                            yield {"type": "artifact", "content": md}
-                                            logger.info(f"[ARTIFACT LIFECYCLE] PNG artifact event yielded")
-                                            artifact_msg += f"\n[Generated File: {filename}]"
-                                            
-                                        elif filename.endswith(".html"):
-                                            md = f'\n<div class="interactive-plot" data-src="{url}" style="width:100%; height:600px;"></div>\n\n<a href="{url}" target="_blank" rel="noopener noreferrer">Open Full Report</a>\n'
-                                            logger.info(f"[ARTIFACT LIFECYCLE] Generated HTML artifact markdown (length={len(md)}): {md[:200]}...")
-                                            logger.info(f"[ARTIFACT LIFECYCLE] Yielding HTML artifact event")
-                                            yield {"type": "artifact", "content": md}
-                                            logger.info(f"[ARTIFACT LIFECYCLE] HTML artifact event yielded successfully")
-                                            artifact_msg += f"\n[Generated File: {filename}]"
-                                            
-                                        elif filename.endswith(".json"):
-                                            # Read JSON for LLM context
-                                            try:
-                                                with open(artifact_path, "r") as f:
-                                                    data = json.load(f)
-                                                    summary = self._extract_json_summary(data, filename)
-                                                    if summary:
-                                                        result.stdout += f"\n\n[System] PROFILING REPORT SUMMARY:\n{summary}\n"
-                                            except Exception as e:
-                                                logger.error(f"Failed to read JSON artifact: {e}")
-                                        else:
-                                            # Generic file - just note it was created
-                                            artifact_msg += f"\n[Generated File: {filename}]"
-                                            
-                                    except Exception as e:
-                                        logger.error(f"Failed to process artifact {artifact_path}: {e}", exc_info=True)
-                                        artifact_msg += f"\n[Error processing {filename}: {str(e)}]"
+                                    if filename.endswith(".json"):
+                                        # JSON reports are read for the LLM before the staged file is committed
+                                        try:
+                                            with open(artifact_path, "r") as f:
+                                                data = json.load(f)
+                                                summary = self._extract_json_summary(data, filename)
+                                                if summary:
+                                                    result.stdout += f"\n\n[System] PROFILING REPORT SUMMARY:\n{summary}\n"
+                                        except Exception as e:
+                                            logger.error(f"Failed to read JSON artifact: {e}")
+                                            cacheable = False
+                                    else:
+                                        artifact_msg += f"\n[Generated File: {filename}]"
+                                
+                                # Commit to permanent storage concurrently (rename locally, one streamed
+                                # upload on S3); keys are assigned up front so nothing below waits on it
+                                on_committed = None
+                                if cacheable:
+                                    on_committed = functools.partial(
+                                        self._cache_result, result_key, self.session_id,
+                                        result.model_copy(deep=True), artifact_msg
+                                    )
+                                uploads.submit(result.artifacts, staging_dir, on_committed)
+                                staging_dir = None  # removed by the uploader once its commits settle
                                 
-                                # Cleanup temp artifact files after upload
-                                for path in artifacts_to_cleanup:
-                                    try:
-                                        os.remove(path)
-                                        # Also try to remove the parent temp directory if empty
-                                        parent = os.path.dirname(path)
-                                        if parent and os.path.isdir(parent) and not os.listdir(parent):
-                                            os.rmdir(parent)
-                                    except Exception:
-                                        pass
+                                # Quick uploads are shown inside this tool block; slower ones are
+                                # released after the next LLM call has started
+                                async for event in uploads.wait(settings.ARTIFACT_INLINE_WAIT_SECONDS):
+                                    yield event
+
+                            # Nothing was committed from here (cache hit or error)
+                            if staging_dir:
+                                shutil.rmtree(staging_dir, ignore_errors=True)
 
                             self.messages.append({
                                 "role": "tool",
@@ -206,17 +224,57 @@ class CSVAgent:
                                 "content": json.dumps(result.model_dump())
                             })
 
-                            yield {"type": "tool_output", "content": result.stdout + artifact_msg}
+                            yield {"type": "tool_output", "content": result.stdout + artifact_msg,
+                                   "tool_call_id": tool_call_data["id"]}
                                 
                         except Exception as e:
                             logger.error(f"Tool Execution Error: {e}", exc_info=True)
+                            if staging_dir:
+                                shutil.rmtree(staging_dir, ignore_errors=True)
                             self.messages.append({
                                 "role": "tool",
                                 "tool_call_id": tool_call_data["id"],
                                 "name": func_name,
                                 "content": f"Error executing tool: {str(e)}"
                             })
-                            yield {"type": "tool_output", "content": f"System Error: {str(e)}"}
+                            yield {"type": "tool_output", "content": f"System Error: {str(e)}",
+                                   "tool_call_id": tool_call_data["id"]}
+
+                    elif func_name == "generate_profile_report":
+                        try:
+                            yield {"type": "tool_code", "content": "generate_profile_report()",
+                                   "tool_call_id": tool_call_data["id"], "name": func_name, "arguments": args_str}
+                            
+                            # Built once per dataset version by the profiling service, not in the sandbox
+                            report = await self.report_provider() if self.report_provider else None
+                            if report is None:
+                                output = ("The profiling report is still being generated in the background. "
+                                          "Continue the analysis with run_code_capture and request it again later.")
+                            else:
+                                url = artifact_service.get_artifact_url(report.html_key)
+                                yield {"type": "artifact", "content": html_artifact_markdown(url),
+                                       "key": report.html_key, "filename": "report.html"}
+                                summary = self._extract_json_summary(report.data, "report.json")
+                                output = f"[Generated File: report.html]\n\n[System] PROFILING REPORT SUMMARY:\n{summary}\n"
+                            
+                            self.messages.append({
+                                "role": "tool",
+                                "tool_call_id": tool_call_data["id"],
+                                "name": func_name,
+                                "content": output
+                            })
+                            yield {"type": "tool_output", "content": output, "tool_call_id": tool_call_data["id"]}
+                        
+                        except Exception as e:
+                            logger.error(f"Profile report error: {e}", exc_info=True)
+                            self.messages.append({
+                                "role": "tool",
+                                "tool_call_id": tool_call_data["id"],
+                                "name": func_name,
+                                "content": f"Error generating profile report: {str(e)}"
+                            })
+                            yield {"type": "tool_output", "content": f"System Error: {str(e)}",
+                                   "tool_call_id": tool_call_data["id"]}
             elif not full_content:
                  pass
             else:
@@ -224,6 +282,16 @@ class CSVAgent:
         
         yield {"type": "status", "content": "Max steps reached without final answer."}
 
+    @staticmethod
+    def _cache_result(result_key: str, scope: Optional[str], result: ToolResult, artifact_msg: str,
+                      batch: List[PendingArtifact]):
+        result_cache.put(result_key, CachedResult(
+            result=result.model_copy(update={"artifacts": [p.key for p in batch]}),
+            artifact_events=[p.event for p in batch if p.event],
+            artifact_msg=artifact_msg,
+            scope=scope,
+        ))
+
     def _extract_json_summary(self, data: dict, filename: str) -> str:
         """Extract a summary from JSON data (e.g., YData Profiling report)."""
         summary = []
@@ -0,0 +1,184 @@
+"""
+Shared Frames - Zero-copy DataFrame handoff to sandbox worker processes.
+
+Pickling `df` to a worker on every tool call would cost more than most of the
+computations run on it. Instead, datasets are published once as Arrow IPC
+files (in /dev/shm when available, or the dataset's own Arrow copy from
+ingest), and workers memory-map them read-only. The mapped pages are shared
+between all workers through the page cache.
+
+Workers keep the attached base frame and hand out copy-on-write shallow
+copies, so sandboxed code can still mutate its `df`: pandas copies the touched
+columns instead of writing into the read-only mapping.
+
+Published files count against SHARED_FRAMES_MAX_BYTES (/dev/shm is RAM);
+the least recently registered datasets are unlinked above it. Files
+referenced in place count too, since their owner is asked (through a
+`release` callback) not to delete them while they are registered.
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from core.config import settings
+from core.logger import logger
+from data.dataframe import write_columnar
+
+# Shallow copies are only safe to hand out with copy-on-write enabled
+pd.set_option("mode.copy_on_write", True)
+
+ATTACH_CACHE_SIZE = 4
+
+
+@dataclass(frozen=True)
+class SharedFrameRef:
+    """Picklable handle to a published dataset."""
+    key: str
+    path: str
+
+
+def _default_root() -> str:
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm/chat_with_csv"
+    return os.path.join(tempfile.gettempdir(), "chat_with_csv_frames")
+
+
+class SharedFrameRegistry:
+    """
+    Publishes datasets for workers to attach by reference.
+
+    Datasets are published per version (e.g. a checksum prefix). Only the
+    latest version of each dataset is kept; older files are unlinked, which is
+    safe while workers still have them mapped. Datasets are also dropped
+    least recently registered first once their files exceed `max_bytes`
+    (files written here are unlinked, files referenced in place released);
+    SandboxPool.run falls back to pickling a frame whose file is gone.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or _default_root()
+        self.max_bytes = settings.SHARED_FRAMES_MAX_BYTES if max_bytes is None else max_bytes
+        # dataset_id -> (path, owned, size, release), least recently registered first
+        self._published: "OrderedDict[str, Tuple[str, bool, int, Optional[Callable[[], None]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.evictions = 0
+
+    def register(self, dataset_id, version: str, df: pd.DataFrame,
+                 arrow_path: Optional[str] = None,
+                 release: Optional[Callable[[], None]] = None) -> SharedFrameRef:
+        """
+        Publish a dataset version and return its reference.
+
+        If the dataset already exists as an Arrow IPC file on local disk it is
+        referenced in place; otherwise the frame is written once to the shared
+        root. `release` is called once the registry no longer refers to
+        `arrow_path` (the dataset is replaced, evicted or cleared), e.g. to
+        unpin it in the cache that owns it.
+        """
+        key = f"{dataset_id}_{version}"
+        with self._lock:
+            if arrow_path:
+                path, owned = arrow_path, False
+            else:
+                path, owned = os.path.join(self.root, f"dataset_{key}.arrow"), True
+                if not os.path.exists(path):
+                    os.makedirs(self.root, exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    write_columnar(df, tmp_path)
+                    os.replace(tmp_path, path)
+                    logger.info(f"Published dataset {key} to shared memory at {path}")
+
+            previous = self._published.pop(dataset_id, None)
+            if previous:
+                self.current_bytes -= previous[2]
+                if previous[0] != path:
+                    self._unlink(previous[0], previous[1])
+                self._release(previous[3])
+            size = os.path.getsize(path)
+            self._published[dataset_id] = (path, owned, size, release)
+            self.current_bytes += size
+            self._evict(keep=dataset_id)
+        return SharedFrameRef(key=key, path=path)
+
+    def clear(self):
+        with self._lock:
+            for path, owned, _, release in self._published.values():
+                self._unlink(path, owned)
+                self._release(release)
+            self._published.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "datasets": len(self._published),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self, keep):
+        while self.current_bytes > self.max_bytes:
+            victim = next((d for d, entry in self._published.items() if d != keep and entry[2]), None)
+            if victim is None:
+                break
+            path, owned, size, release = self._published.pop(victim)
+            logger.info(f"Dropping shared frame of dataset {victim} ({size} bytes) over budget")
+            self._unlink(path, owned)
+            self._release(release)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    @staticmethod
+    def _unlink(path: str, owned: bool):
+        if owned and os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def _release(release: Optional[Callable[[], None]]):
+        if release is None:
+            return
+        try:
+            release()
+        except Exception as e:
+            logger.error(f"Failed to release shared frame file: {e}", exc_info=True)
+
+
+# Worker-side cache of attached frames: (path, inode, mtime) -> base frame
+_attached: "OrderedDict[Tuple[str, int, int], pd.DataFrame]" = OrderedDict()
+
+
+def attach_frame(ref: SharedFrameRef) -> pd.DataFrame:
+    """
+    Memory-map a published dataset and return a copy-on-write view of it.
+
+    Numeric columns without nulls are backed directly by the mapping; the
+    base frame stays cached in this process so later jobs skip even the
+    remaining conversions.
+    """
+    stat = os.stat(ref.path)
+    cache_key = (ref.path, stat.st_ino, stat.st_mtime_ns)
+    base = _attached.get(cache_key)
+    if base is None:
+        source = pa.memory_map(ref.path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        base = table.to_pandas(split_blocks=True)
+        _attached[cache_key] = base
+        while len(_attached) > ATTACH_CACHE_SIZE:
+            _attached.popitem(last=False)
+    else:
+        _attached.move_to_end(cache_key)
+    # The cached base keeps a reference, so any write through the view copies first
+    return base.copy(deep=False)
+
+
+# Singleton instance
+shared_frames = SharedFrameRegistry()
@@ -0,0 +1,152 @@
+"""
+Artifact Uploads - Concurrent artifact commits that overlap the agent loop.
+
+Artifacts of a tool call used to be uploaded one after another, and the next
+LLM request only started once the last one (plus a verification HEAD) was
+done. Commits now run concurrently and the agent moves on without waiting
+for slow ones.
+
+Key features:
+- Keys (and so URLs) are assigned before the upload starts, so the tool
+  message for the LLM never waits on storage
+- At most ARTIFACT_UPLOAD_CONCURRENCY commits per turn, on the shared
+  storage I/O pool
+- An artifact event is only released once its file is committed, so the
+  browser never requests a URL that does not exist yet
+- Events for uploads that finish after their tool block has closed are
+  flagged `deferred` and rendered outside the code details block
+- A staging directory is removed once every commit from it has settled
+"""
+
+import asyncio
+import os
+import shutil
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from core.logger import logger
+
+
+def html_artifact_markdown(url: str) -> str:
+    return f'\n<div class="interactive-plot" data-src="{url}" style="width:100%; height:600px;"></div>\n\n<a href="{url}" target="_blank" rel="noopener noreferrer">Open Full Report</a>\n'
+
+
+def artifact_markdown(filename: str, url: str) -> Optional[str]:
+    """Markdown shown to the user for an artifact, or None if it is only noted to the LLM."""
+    if filename.endswith(".png"):
+        return f"\n![Generated Plot]({url})\n"
+    if filename.endswith(".html"):
+        return html_artifact_markdown(url)
+    return None
+
+
+@dataclass
+class PendingArtifact:
+    filename: str
+    key: str
+    event: Optional[Dict[str, Any]]  # artifact event to release once committed
+    task: "asyncio.Future[str]" = field(repr=False, default=None)
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and (self.task.cancelled() or self.task.exception() is not None)
+
+
+class ArtifactUploader:
+    def __init__(self, service, conversation_id: str, concurrency: int):
+        self.service = service
+        self.conversation_id = conversation_id
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: List[PendingArtifact] = []
+        self._batches: List[asyncio.Future] = []
+
+    def submit(self, paths: List[str], staging_dir: Optional[str] = None,
+               on_committed: Callable[[List[PendingArtifact]], None] = None) -> List[PendingArtifact]:
+        """
+        Start committing staged files and return them with their assigned keys.
+
+        `on_committed` runs once every file in the batch is stored; the
+        staging directory is removed once they have all settled.
+        """
+        batch = []
+        for path in paths:
+            filename = os.path.basename(path)
+            key = self.service.new_key(filename, self.conversation_id)
+            md = artifact_markdown(filename, self.service.get_artifact_url(key))
+            pending = PendingArtifact(
+                filename=filename,
+                key=key,
+                event={"type": "artifact", "content": md, "key": key, "filename": filename} if md else None,
+            )
+            pending.task = asyncio.ensure_future(self._commit(path, key))
+            batch.append(pending)
+
+        settled = asyncio.gather(*(p.task for p in batch), return_exceptions=True)
+        settled.add_done_callback(lambda _: self._batch_settled(batch, staging_dir, on_committed))
+        self._batches.append(settled)
+        self._pending.extend(batch)
+        return batch
+
+    def ready(self, deferred: bool = False) -> List[Dict[str, Any]]:
+        """Events for uploads that have finished since the last call, without waiting."""
+        events = []
+        for pending in [p for p in self._pending if p.task.done()]:
+            self._pending.remove(pending)
+            event = self._event_for(pending)
+            if event:
+                events.append({**event, "deferred": True} if deferred else event)
+        return events
+
+    async def wait(self, timeout: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield events as uploads finish, for at most `timeout` seconds (None waits for all)."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._pending:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+            done, _ = await asyncio.wait([p.task for p in self._pending], timeout=remaining,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for event in self.ready():
+                yield event
+
+    async def drain(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Wait for every outstanding upload, yielding their events as deferred."""
+        if self._pending:
+            logger.info(f"[ARTIFACT LIFECYCLE] Waiting for {len(self._pending)} artifact upload(s) to finish")
+        while self._pending:
+            await asyncio.wait([p.task for p in self._pending], return_when=asyncio.FIRST_COMPLETED)
+            for event in self.ready(deferred=True):
+                yield event
+        if self._batches:
+            await asyncio.gather(*self._batches)
+            self._batches.clear()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _commit(self, path: str, key: str) -> str:
+        async with self._semaphore:
+            return await self.service.acommit_artifact(path, self.conversation_id, key=key)
+
+    def _event_for(self, pending: PendingArtifact) -> Optional[Dict[str, Any]]:
+        if pending.failed:
+            error = "cancelled" if pending.task.cancelled() else pending.task.exception()
+            logger.error(f"[ARTIFACT LIFECYCLE] Upload of {pending.filename} failed: {error}")
+            return {"type": "status", "content": f"Failed to save {pending.filename}: {error}"}
+        logger.info(f"[ARTIFACT LIFECYCLE] Artifact committed: {pending.key}")
+        return pending.event
+
+    def _batch_settled(self, batch: List[PendingArtifact], staging_dir: Optional[str],
+                       on_committed: Optional[Callable[[List[PendingArtifact]], None]]):
+        # Committed files were moved out; this drops anything left behind
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        if on_committed and not any(p.failed for p in batch):
+            try:
+                on_committed(batch)
+            except Exception as e:
+                logger.error(f"Artifact commit callback failed: {e}", exc_info=True)
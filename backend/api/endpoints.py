@@ -1,22 +1,25 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, RedirectResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List, Optional
-import pandas as pd
-import io
+from typing import Optional, Tuple
+import hashlib
 import json
 import os
-import shutil
+import tempfile
 import uuid
 from datetime import datetime
 
 from backend.core.session import session_manager
+from backend.core.message_writer import MessageWriter
+from agent.message_parts import render_part, render_parts
 from backend.core.database import get_session
 from backend.models import Dataset
 from backend.core.auth import get_user_id
 from backend.core.storage import storage
+from backend.core.ingest import TeeReader, ingest_dataset
 from fastapi import Depends
-from data.dataframe import load_csv
+from data.dataframe import CSVSniffer, read_preview
 
 router = APIRouter()
 
@@ -26,24 +29,53 @@ class ChatRequest(BaseModel):
 # UPLOAD_DIR is handled by storage service now
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_user_id)):
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), user_id: str = Depends(get_user_id)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
     
+    local_copy_path = None
+    stored_path = None
+    dataset_id = None
     try:
         # Generate unique filename for storage key
         file_ext = file.filename.split('.')[-1]
         unique_filename = f"{uuid.uuid4()}.{file_ext}"
         
-        # Save file to storage (S3 or local)
-        # Returns the path/key stored
-        stored_path = storage.upload_file(file.file, unique_filename)
+        # Tee the upload: storage consumes the stream while the sniffer sees every
+        # byte (format + preview sample) and a local working copy is written for
+        # the background ingest. Nothing is downloaded back from storage.
+        local_copy_path = os.path.join(tempfile.gettempdir(), unique_filename)
+        sniffer = CSVSniffer()
+        digest = hashlib.sha256()  # lets later downloads of the dataset be verified
+        with open(local_copy_path, "wb") as local_copy:
+            tee = TeeReader(file.file, sinks=[sniffer.feed, local_copy.write, digest.update])
+            # Save file to storage (S3 or local)
+            # Returns the path/key stored
+            stored_path = await storage.aupload_file(tee, unique_filename)
+        
+        try:
+            csv_format = sniffer.result()
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Could not decode CSV file with any supported encoding. Please ensure the file is properly encoded (UTF-8 recommended)."
+            )
+        
+        # Only the header and first rows are parsed on the request path
+        df = read_preview(bytes(sniffer.sample), csv_format, truncated=sniffer.truncated)
+        
+        cols = df.columns.tolist()
+        preview_data = df.to_dict(orient='records')
         
         # Create Dataset record in DB
         async for session in get_session():
             dataset = Dataset(
                 filename=file.filename,
                 file_path=stored_path, # S3 key or local path
+                checksum=digest.hexdigest(),
+                csv_encoding=csv_format.encoding,
+                csv_delimiter=csv_format.delimiter,
+                csv_has_header=csv_format.has_header,
                 uploaded_at=datetime.utcnow(),
                 user_id=user_id
             )
@@ -53,50 +85,12 @@ async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_u
             dataset_id = dataset.id
             break
         
-        # Load preview. For cloud storage, we might need to download it back or read bytes before upload
-        # But we already uploaded. Let's download to a temp buffer or just read the uploaded file if local
-        # Optimization: We could have read into memory before upload, but for huge files that's bad.
-        # Let's download it to a temp file for preview.
-        # Actually, for preview we just need head.
-        # To avoid re-downloading immediately, maybe we can read the file object before upload?
-        # But upload_file consumes it. 
-        # Let's just download it to a temp location for the preview generation.
-        
-        temp_preview_path = f"/tmp/{unique_filename}"
-        storage.download_file(stored_path, temp_preview_path)
-        
-        # Try multiple encodings for CSV files that aren't UTF-8
-        df = None
-        encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        last_error = None
-        
-        for encoding in encodings_to_try:
-            try:
-                df = pd.read_csv(temp_preview_path, encoding=encoding)
-                break  # Success!
-            except UnicodeDecodeError as e:
-                last_error = e
-                continue
-        
-        if df is None:
-            # Clean up temp file before raising
-            if os.path.exists(temp_preview_path):
-                os.remove(temp_preview_path)
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Could not decode CSV file with any supported encoding. Please ensure the file is properly encoded (UTF-8 recommended)."
-            )
-        
-        cols = df.columns.tolist()
-        preview_data = df.head().to_dict(orient='records')
-        
-        # Clean up temp file
-        if os.path.exists(temp_preview_path):
-            os.remove(temp_preview_path)
-        
         # Create session
         session_id = await session_manager.create_conversation(dataset_id=dataset_id, title=file.filename, user_id=user_id)
         
+        # Full parse and columnar conversion happen after the response is sent
+        background_tasks.add_task(ingest_dataset, dataset_id, local_copy_path, unique_filename, csv_format)
+        
         return JSONResponse({
             "sessionId": session_id,
             "filename": file.filename,
@@ -104,13 +98,28 @@ async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_u
             "preview": preview_data
         })
         
-    except HTTPException:
-        raise  # Re-raise HTTP exceptions as-is
     except Exception as e:
+        await _discard_upload(local_copy_path, None if dataset_id else stored_path)
+        if isinstance(e, HTTPException):
+            raise  # Re-raise HTTP exceptions as-is
         from core.logger import logger
         logger.error(f"Failed to process uploaded file: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
 
+async def _discard_upload(local_copy_path: Optional[str], stored_path: Optional[str]):
+    """
+    Remove what a failed upload left behind. The stored file is only passed
+    in while no Dataset row refers to it yet.
+    """
+    from core.logger import logger
+    if local_copy_path and os.path.exists(local_copy_path):
+        os.remove(local_copy_path)
+    if stored_path:
+        try:
+            await storage.adelete_file(stored_path)
+        except Exception as e:
+            logger.error(f"Failed to delete orphaned upload {stored_path}: {e}", exc_info=True)
+
 @router.post("/chat/{session_id}")
 async def chat(session_id: str, request: ChatRequest, user_id: str = Depends(get_user_id)):
     try:
@@ -127,12 +136,19 @@ async def chat(session_id: str, request: ChatRequest, user_id: str = Depends(get
     if not agent:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Save user message
-    await session_manager.save_message(session_id, "user", request.message)
+    # The user message is written before streaming starts, so it is kept even if
+    # the client disconnects before the first chunk
+    writer = MessageWriter(session_id)
+    writer.add("user", request.message)
+    try:
+        await writer.flush()
+    except Exception as e:
+        from core.logger import logger
+        logger.error(f"Failed to save message for conversation {session_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to save message")
     agent.add_message("user", request.message)
     
     async def generate():
-        full_response = ""
         try:
             async for part in agent.run():
                 # DON'T yield raw artifact events - they're processed and sent as delta below
@@ -141,41 +157,23 @@ async def chat(session_id: str, request: ChatRequest, user_id: str = Depends(get
                     json_part = json.dumps(part)
                     yield json_part + "\n"
                 
-                # Accumulate actual response content for saving
-                if part["type"] == "delta":
-                    full_response += part["content"]
-                elif part["type"] == "status":
-                    pass 
-                elif part["type"] == "tool_code":
-                    # We want the tool code to be in a details block
-                    code_html = f"\n<details><summary>Executing Code</summary>\n\n```python\n{part['content']}\n```\n"
-                    full_response += code_html
-                    yield json.dumps({"type": "delta", "content": code_html}) + "\n"
-                elif part["type"] == "artifact":
-                    # Close the code execution details to show artifact prominently
-                    # Important: Artifact content might contain HTML (iframe).
-                    from core.logger import logger
-                    logger.info(f"[ARTIFACT LIFECYCLE] Endpoint received artifact event: type={part['type']}")
-                    logger.info(f"[ARTIFACT LIFECYCLE] Artifact content (first 300 chars): {part['content'][:300] if part['content'] else 'EMPTY'}")
-                    artifact_html = f"\n</details>\n\n{part['content']}\n\n<details><summary>Execution Output</summary>\n"
-                    logger.info(f"[ARTIFACT LIFECYCLE] Generated artifact_html (first 300 chars): {artifact_html[:300]}")
-                    full_response += artifact_html
-                    logger.info(f"[ARTIFACT LIFECYCLE] Yielding artifact delta to client (length={len(artifact_html)})")
-                    yield json.dumps({"type": "delta", "content": artifact_html}) + "\n"
-                    logger.info(f"[ARTIFACT LIFECYCLE] Artifact delta yielded to client successfully")
-                elif part["type"] == "tool_output":
-                    output_html = f"\n**Output:**\n\n```\n{part['content']}\n```\n\n</details>\n"
-                    full_response += output_html
-                    yield json.dumps({"type": "delta", "content": output_html}) + "\n"
-            
-            # Save assistant response
-            if full_response:
-                await session_manager.save_message(session_id, "assistant", full_response)
+                # The reply is stored as structured parts; tool blocks and artifacts are
+                # streamed as rendered markup (code in a details block, artifacts outside it)
+                stored = await writer.append(part)
+                if stored and stored["type"] != "text":
+                    rendered = render_part(stored)
+                    if stored["type"] == "artifact":
+                        from core.logger import logger
+                        logger.info(f"[ARTIFACT LIFECYCLE] Yielding artifact delta to client for {stored['key']} (length={len(rendered)})")
+                    yield json.dumps({"type": "delta", "content": rendered}) + "\n"
                 
         except Exception as e:
             error_msg = f"Error: {str(e)}"
             yield json.dumps({"type": "error", "content": error_msg}) + "\n"
             # Optionally save error message as assistant response?
+        finally:
+            # Also runs when the client disconnects, so a partial reply is kept
+            await writer.close()
 
     return StreamingResponse(generate(), media_type="application/x-ndjson")
 
@@ -193,12 +191,20 @@ async def list_conversations(user_id: str = Depends(get_user_id)):
     ]
 
 @router.get("/conversations/{session_id}")
-async def get_conversation(session_id: str, user_id: str = Depends(get_user_id)):
-    result = await session_manager.get_conversation_details(session_id, user_id)
+async def get_conversation(session_id: str, limit: int = Query(50, ge=1, le=200),
+                           before: Optional[str] = None, user_id: str = Depends(get_user_id)):
+    """
+    Conversation metadata and the newest `limit` messages. Pass the returned
+    `next_cursor` as `before` to page further back.
+    """
+    try:
+        result = await session_manager.get_conversation_details(session_id, user_id, limit, before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     if not result:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    conversation, messages = result
+    conversation, messages, next_cursor = result
     
     return {
         "id": conversation.id,
@@ -208,24 +214,76 @@ async def get_conversation(session_id: str, user_id: str = Depends(get_user_id))
         "messages": [
             {
                 "role": m.role,
-                "content": m.content,
+                # Replies with parts are rendered on write; rebuild the cached markup if it is missing
+                "content": m.content or (render_parts(json.loads(m.parts)) if m.parts else ""),
                 "timestamp": m.timestamp
             }
             for m in messages
-        ]
+        ],
+        "next_cursor": next_cursor
     }
 
+@router.delete("/conversations")
+async def delete_all_conversations(user_id: str = Depends(get_user_id)):
+    """Delete the user's whole chat history, including artifacts."""
+    deleted = await session_manager.delete_conversations(user_id)
+    return {"status": "success", "deleted": deleted}
+
+@router.delete("/datasets/{dataset_id}/conversations")
+async def delete_dataset_conversations(dataset_id: int, user_id: str = Depends(get_user_id)):
+    """Delete the user's conversations about one dataset, including artifacts."""
+    deleted = await session_manager.delete_conversations(user_id, dataset_id=dataset_id)
+    return {"status": "success", "deleted": deleted}
+
 @router.delete("/conversations/{session_id}")
 async def delete_conversation(session_id: str, user_id: str = Depends(get_user_id)):
     await session_manager.delete_conversation(session_id, user_id)
     return {"status": "success", "message": "Conversation deleted"}
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end).
+    
+    Returns None when the whole object should be sent (no header, malformed
+    or multi-range requests); raises ValueError if the range is unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    if not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
 @router.get("/artifacts/{key:path}")
-async def get_artifact(key: str, user_id: str = Depends(get_user_id)):
+async def get_artifact(key: str, request: Request, user_id: str = Depends(get_user_id)):
     """
     Stream artifact content directly from storage.
     
     Key format: artifacts/{conversation_id}/{unique_id}_{filename}
+    
+    Artifacts are immutable, so responses carry a strong ETag derived from the
+    key, answer If-None-Match with 304 and support single byte ranges. With
+    ARTIFACT_PRESIGNED_URLS on S3 the owner is redirected to the bucket instead.
     """
     from backend.core.artifacts import artifact_service
     from core.logger import logger
@@ -237,19 +295,61 @@ async def get_artifact(key: str, user_id: str = Depends(get_user_id)):
         logger.warning(f"[ARTIFACT LIFECYCLE] Rejected request with directory traversal: {key}")
         raise HTTPException(status_code=400, detail="Invalid artifact key")
     
+    if artifact_service.presign_ttl:
+        # Offload the bytes to S3; the API only checks the key and its owner and signs
+        try:
+            artifact_service.check_key(key)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        if not await session_manager.owns_storage_key(key, user_id):
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        url = await artifact_service.aget_presigned_url(key)
+        logger.info(f"[ARTIFACT LIFECYCLE] Redirecting to presigned URL for {key}")
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+    
+    etag = artifact_service.etag(key)
+    headers = {
+        "Content-Disposition": f"inline; filename=\"{key.split('/')[-1]}\"",
+        "Cache-Control": "public, max-age=86400, immutable",  # Cache for 24 hours
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
     try:
         media_type = artifact_service.get_media_type(key)
         logger.info(f"[ARTIFACT LIFECYCLE] Determined media type: {media_type}")
-        logger.info(f"[ARTIFACT LIFECYCLE] Streaming artifact to client...")
         
+        local_path = artifact_service.local_path(key)
+        if local_path:
+            # Starlette handles Range/If-Range itself and hands the file to the server (pathsend) when supported
+            return FileResponse(local_path, media_type=media_type, headers=headers)
+        
+        size = await artifact_service.aget_artifact_size(key)
+        start, end, status_code = 0, size - 1, 200
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range == etag:
+            try:
+                byte_range = _parse_range(request.headers.get("range"), size)
+            except ValueError:
+                raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                                    headers={"Content-Range": f"bytes */{size}"})
+            if byte_range:
+                start, end = byte_range
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        
+        logger.info(f"[ARTIFACT LIFECYCLE] Streaming artifact to client (bytes {start}-{end}/{size})...")
         return StreamingResponse(
-            artifact_service.stream_artifact(key),
+            artifact_service.astream_artifact(key, start, end - start + 1),
+            status_code=status_code,
             media_type=media_type,
-            headers={
-                "Content-Disposition": f"inline; filename=\"{key.split('/')[-1]}\"",
-                "Cache-Control": "public, max-age=86400"  # Cache for 24 hours
-            }
+            headers=headers
         )
+    except HTTPException:
+        raise
     except FileNotFoundError:
         logger.error(f"[ARTIFACT LIFECYCLE] Artifact not found: {key}")
         raise HTTPException(status_code=404, detail="Artifact not found")
@@ -265,25 +365,54 @@ async def get_file_legacy(filename: str, user_id: str = Depends(get_user_id)):
     Legacy endpoint that redirects to the new artifact endpoint.
     Kept for backwards compatibility with old chat history.
     """
-    from fastapi.responses import RedirectResponse
+    from backend.core.artifacts import artifact_service
     
     # Security check
     if ".." in filename or "/" in filename:
         raise HTTPException(status_code=400, detail="Invalid filename")
     
+    if artifact_service.presign_ttl:
+        if not await session_manager.owns_storage_key(filename, user_id, allow_unowned=True):
+            raise HTTPException(status_code=404, detail="File not found")
+        return RedirectResponse(await artifact_service.aget_presigned_url(filename), status_code=307,
+                                headers={"Cache-Control": "no-store"})
+    
     # Try to find the artifact in storage (old format didn't have conversation scoping)
     # For legacy artifacts, we check the uploads directory directly
-    from backend.core.storage import storage
+    from backend.core.file_cache import dataset_file_cache
     
     try:
-        temp_path = f"/tmp/{filename}"
-        storage.download_file(filename, temp_path)
+        # Pinned until the response is sent, so eviction cannot delete it mid-transfer
+        cache_name = f"legacy_{filename}"
+        temp_path = await dataset_file_cache.fetch(filename, cache_name, pin=True)
         
         media_type = "application/octet-stream"
         if filename.endswith(".png"): media_type = "image/png"
         elif filename.endswith(".html"): media_type = "text/html"
         elif filename.endswith(".json"): media_type = "application/json"
         
-        return FileResponse(temp_path, media_type=media_type, filename=filename, content_disposition_type="inline")
+        return FileResponse(temp_path, media_type=media_type, filename=filename, content_disposition_type="inline",
+                            background=BackgroundTask(dataset_file_cache.unpin, cache_name))
     except Exception:
         raise HTTPException(status_code=404, detail="File not found")
+
+@router.get("/metrics")
+async def get_metrics():
+    """Process-level counters for the shared LLM client, database pool, sandbox pool and caches."""
+    from agent.result_cache import result_cache
+    from agent.sandbox import sandbox_pool
+    from agent.shared_frames import shared_frames
+    from backend.core.database import pool_stats
+    from backend.core.dataframe_cache import dataframe_cache
+    from backend.core.file_cache import dataset_file_cache
+    from core.client import client_stats
+
+    return {
+        "llm_client": client_stats(),
+        "database": pool_stats.snapshot(),
+        "sandbox": sandbox_pool.stats(),
+        "dataframe_cache": dataframe_cache.stats(),
+        "shared_frames": shared_frames.stats(),
+        "dataset_files": dataset_file_cache.stats(),
+        "result_cache": result_cache.stats(),
+    }
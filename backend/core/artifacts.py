@@ -2,17 +2,22 @@
 Artifact Service - Centralized handling of generated artifacts (plots, reports, etc.)
 
 This module provides a clean interface for storing and retrieving artifacts,
-with consistent behavior for both S3 and local storage backends.
+with consistent behavior across the S3, local and in-memory storage backends.
 """
 
+import hashlib
 import os
+import tempfile
+import threading
+import time
 import uuid
 import mimetypes
-from typing import Generator, Optional
-from io import BytesIO
+from collections import OrderedDict
+from typing import AsyncGenerator, Generator, Optional
 
-from core.logger import logger
+from backend.core.storage import astream, run_blocking, storage
 from core.config import settings
+from core.logger import logger
 
 
 class ArtifactService:
@@ -21,29 +26,33 @@ class ArtifactService:
     
     Key features:
     - Conversation-scoped storage keys to prevent collisions
+    - Staging directories the sandbox writes into directly, committed to
+      storage by a rename (local) or a single streamed upload (S3)
     - Direct streaming without temp file intermediaries
-    - Consistent API for S3 and local storage
+    - Consistent API for S3, local and in-memory storage
+    - Async variants that keep blocking I/O off the event loop
+    - Strong ETags derived from the (immutable) key, byte-range reads and
+      chunk sizes that grow with the object
+    - Optional presigned-URL offload on S3, with URLs cached per key until
+      shortly before they expire
     """
     
-    def __init__(self):
-        self.local_artifact_dir = "uploads/artifacts"
-        self.bucket_name = settings.AWS_BUCKET_NAME
-        
-        # Check if S3 is configured
-        if self.bucket_name and settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
-            import boto3
-            self.s3_client = boto3.client(
-                's3',
-                endpoint_url=settings.AWS_ENDPOINT_URL,
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-            )
-            self.mode = "s3"
-            logger.info("ArtifactService configured with S3")
-        else:
-            self.mode = "local"
-            os.makedirs(self.local_artifact_dir, exist_ok=True)
-            logger.info(f"ArtifactService configured with local storage: {self.local_artifact_dir}")
+    chunk_size = 64 * 1024  # smallest streaming chunk
+    max_chunk_size = 1024 * 1024
+    size_cache_entries = 1024
+    presign_margin_seconds = 60  # stop handing out a cached URL this long before it expires
+    
+    def __init__(self, backend=None, presign_ttl: Optional[int] = None):
+        # Artifacts share the dataset storage backend; locally they live under uploads/artifacts
+        self.backend = backend or storage.backend
+        self.mode = self.backend.mode
+        # Keys are never rewritten, so their sizes can be cached indefinitely
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._sizes_lock = threading.Lock()
+        # Presigned downloads are only possible when the backend can sign URLs (S3)
+        self.presign_ttl = presign_ttl if hasattr(self.backend, "presigned_url") else None
+        self._presigned: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (url, expires_at)
+        logger.info(f"ArtifactService configured with {self.mode} storage")
     
     def save_artifact(self, file_path: str, conversation_id: str) -> str:
         """
@@ -57,8 +66,7 @@ class ArtifactService:
             Storage key that can be used to retrieve the artifact
         """
         filename = os.path.basename(file_path)
-        unique_id = uuid.uuid4().hex[:8]
-        key = f"artifacts/{conversation_id}/{unique_id}_{filename}"
+        key = self.new_key(filename, conversation_id)
         
         # Get file size for logging
         file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
@@ -68,49 +76,74 @@ class ArtifactService:
         logger.info(f"[ARTIFACT LIFECYCLE] Storage mode: {self.mode}")
         logger.info(f"[ARTIFACT LIFECYCLE] Generated storage key: {key}")
         
-        if self.mode == "s3":
-            try:
-                from boto3.s3.transfer import TransferConfig
-                
-                # Configure for large file uploads
-                # Use multipart for files > 5MB, with reasonable timeouts
-                transfer_config = TransferConfig(
-                    multipart_threshold=5 * 1024 * 1024,  # 5MB
-                    max_concurrency=10,
-                    multipart_chunksize=5 * 1024 * 1024,  # 5MB chunks
-                    use_threads=True
-                )
-                
-                # Upload with config
-                self.s3_client.upload_file(
-                    file_path, 
-                    self.bucket_name, 
-                    key,
-                    Config=transfer_config
-                )
-                
-                # Verify upload succeeded by checking if object exists
-                try:
-                    self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
-                    logger.info(f"Uploaded artifact to S3: {key} (verified)")
-                except Exception as verify_err:
-                    logger.error(f"Upload verification failed for {key}: {verify_err}")
-                    raise RuntimeError(f"Upload verification failed: {verify_err}")
-                
-                return key
-            except Exception as e:
-                logger.error(f"Failed to upload artifact to S3: {e}")
-                raise
-        else:
-            # Local storage
-            dest_dir = os.path.join(self.local_artifact_dir, conversation_id)
-            os.makedirs(dest_dir, exist_ok=True)
-            dest_path = os.path.join(dest_dir, f"{unique_id}_{filename}")
-            
-            import shutil
-            shutil.copy2(file_path, dest_path)
-            logger.info(f"Saved artifact locally: {dest_path}")
-            return key  # Return consistent key format regardless of storage mode
+        try:
+            # put_file raises if the upload is not acknowledged, so no HEAD round-trip is needed
+            self.backend.put_file(file_path, key)
+        except Exception as e:
+            logger.error(f"Failed to upload artifact to {self.mode} storage: {e}")
+            raise
+        
+        logger.info(f"Saved artifact to {self.mode} storage: {key}")
+        return key
+    
+    async def asave_artifact(self, file_path: str, conversation_id: str) -> str:
+        """Non-blocking variant of save_artifact for async callers."""
+        return await run_blocking(self.save_artifact, file_path, conversation_id)
+    
+    def create_staging_dir(self) -> str:
+        """
+        Create a directory for the sandbox to write artifacts into.
+        
+        Locally it sits on the same filesystem as the storage root, so
+        committing an artifact is a rename. The caller removes it when done.
+        """
+        staging_root = self.backend.staging_root()
+        os.makedirs(staging_root, exist_ok=True)
+        return tempfile.mkdtemp(prefix="agent_artifacts_", dir=staging_root)
+    
+    def commit_artifact(self, file_path: str, conversation_id: str, key: Optional[str] = None) -> str:
+        """
+        Move a staged artifact to permanent storage, consuming the local file.
+        
+        Args:
+            key: Pre-assigned key from new_key, so the URL can be handed out
+                 before the upload finishes
+        
+        Returns:
+            Storage key that can be used to retrieve the artifact
+        """
+        filename = os.path.basename(file_path)
+        key = key or self.new_key(filename, conversation_id)
+        logger.info(f"[ARTIFACT LIFECYCLE] Committing {file_path} to {self.mode} storage as {key}")
+        self.backend.move_file(file_path, key)
+        return key
+    
+    async def acommit_artifact(self, file_path: str, conversation_id: str, key: Optional[str] = None) -> str:
+        """Non-blocking variant of commit_artifact."""
+        return await run_blocking(self.commit_artifact, file_path, conversation_id, key)
+    
+    def delete_conversation_artifacts(self, conversation_id: str) -> int:
+        """Delete every artifact stored under artifacts/{conversation_id}/."""
+        if not conversation_id or "/" in conversation_id or conversation_id in (".", ".."):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        prefix = f"artifacts/{conversation_id}/"
+        count = self.backend.delete_prefix(prefix)
+        # Deleted keys must not keep serving cached sizes or signed URLs
+        with self._sizes_lock:
+            for cache in (self._sizes, self._presigned):
+                for key in [k for k in cache if k.startswith(prefix)]:
+                    del cache[key]
+        logger.info(f"[ARTIFACT LIFECYCLE] Deleted {count} artifacts of conversation {conversation_id}")
+        return count
+    
+    async def adelete_conversation_artifacts(self, conversation_id: str) -> int:
+        """Non-blocking variant of delete_conversation_artifacts."""
+        return await run_blocking(self.delete_conversation_artifacts, conversation_id)
+    
+    @staticmethod
+    def new_key(filename: str, conversation_id: str) -> str:
+        unique_id = uuid.uuid4().hex[:8]
+        return f"artifacts/{conversation_id}/{unique_id}_{filename}"
     
     def get_artifact_url(self, key: str) -> str:
         """
@@ -137,53 +170,117 @@ class ArtifactService:
             Chunks of file content
         """
         logger.info(f"[ARTIFACT LIFECYCLE] stream_artifact called with key: {key}")
-        chunk_size = 8192
         total_bytes = 0
         
-        if self.mode == "s3":
-            try:
-                logger.info(f"[ARTIFACT LIFECYCLE] Fetching from S3 bucket={self.bucket_name}")
-                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
-                body = response['Body']
-                content_length = response.get('ContentLength', 'unknown')
-                logger.info(f"[ARTIFACT LIFECYCLE] S3 object retrieved, ContentLength={content_length}")
-                while True:
-                    chunk = body.read(chunk_size)
-                    if not chunk:
-                        break
-                    total_bytes += len(chunk)
-                    yield chunk
-                logger.info(f"[ARTIFACT LIFECYCLE] Finished streaming from S3, total bytes={total_bytes}")
-            except Exception as e:
-                logger.error(f"[ARTIFACT LIFECYCLE] Failed to stream artifact from S3: {e}")
-                raise FileNotFoundError(f"Artifact not found: {key}")
-        else:
-            # Local storage - map key back to file path
-            # Key format: artifacts/{conversation_id}/{uuid}_{filename}
-            parts = key.split('/', 2)  # ['artifacts', 'conv_id', 'uuid_filename']
-            if len(parts) == 3:
-                local_path = os.path.join(self.local_artifact_dir, parts[1], parts[2])
-            else:
-                logger.error(f"[ARTIFACT LIFECYCLE] Invalid artifact key format: {key}")
-                raise FileNotFoundError(f"Invalid artifact key: {key}")
-            
-            logger.info(f"[ARTIFACT LIFECYCLE] Local storage path: {local_path}")
-            
-            if not os.path.exists(local_path):
-                logger.error(f"[ARTIFACT LIFECYCLE] Local file does not exist: {local_path}")
-                raise FileNotFoundError(f"Artifact not found: {key}")
-            
-            file_size = os.path.getsize(local_path)
-            logger.info(f"[ARTIFACT LIFECYCLE] Local file exists, size={file_size} bytes")
-            
-            with open(local_path, 'rb') as f:
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    total_bytes += len(chunk)
-                    yield chunk
-            logger.info(f"[ARTIFACT LIFECYCLE] Finished streaming from local, total bytes={total_bytes}")
+        stream = self._open(key)
+        try:
+            while True:
+                chunk = stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                total_bytes += len(chunk)
+                yield chunk
+        finally:
+            stream.close()
+        logger.info(f"[ARTIFACT LIFECYCLE] Finished streaming from {self.mode}, total bytes={total_bytes}")
+    
+    async def astream_artifact(self, key: str, start: int = 0,
+                               length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+        """
+        Non-blocking variant of stream_artifact; every read runs on the storage I/O pool.
+        
+        Args:
+            start: First byte to send
+            length: Number of bytes to send (to the end if None); also sizes the chunks
+        """
+        logger.info(f"[ARTIFACT LIFECYCLE] astream_artifact called with key: {key}")
+        self.check_key(key)
+        chunk_size = self.chunk_size_for(length) if length is not None else self.chunk_size
+        async for chunk in astream(self.backend, key, chunk_size, start, length):
+            yield chunk
+    
+    def chunk_size_for(self, length: int) -> int:
+        """About 16 reads per response, within [chunk_size, max_chunk_size]."""
+        return max(self.chunk_size, min(self.max_chunk_size, length // 16))
+    
+    @staticmethod
+    def etag(key: str) -> str:
+        """Strong ETag for an artifact; keys are unique and never overwritten."""
+        return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+    
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of an artifact when storage is local, for zero-copy responses."""
+        self.check_key(key)
+        if self.mode != "local":
+            return None
+        path = self.backend.path_for(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Artifact not found: {key}")
+        return path
+    
+    def get_presigned_url(self, key: str) -> Optional[str]:
+        """
+        Short-lived direct download URL for a storage key, or None when
+        presigned downloads are disabled. Callers check ownership first.
+        """
+        if not self.presign_ttl:
+            return None
+        now = time.time()
+        with self._sizes_lock:
+            cached = self._presigned.get(key)
+            if cached and cached[1] - self.presign_margin_seconds > now:
+                self._presigned.move_to_end(key)
+                return cached[0]
+        url = self.backend.presigned_url(
+            key, self.presign_ttl, filename=key.split('/')[-1], content_type=self.get_media_type(key)
+        )
+        with self._sizes_lock:
+            self._presigned[key] = (url, now + self.presign_ttl)
+            self._presigned.move_to_end(key)
+            while len(self._presigned) > self.size_cache_entries:
+                self._presigned.popitem(last=False)
+        return url
+    
+    async def aget_presigned_url(self, key: str) -> Optional[str]:
+        """Non-blocking variant of get_presigned_url (credential refresh may do I/O)."""
+        return await run_blocking(self.get_presigned_url, key)
+    
+    def get_artifact_size(self, key: str) -> int:
+        self.check_key(key)
+        with self._sizes_lock:
+            size = self._sizes.get(key)
+            if size is not None:
+                self._sizes.move_to_end(key)
+                return size
+        size = self.backend.size(key)
+        with self._sizes_lock:
+            self._sizes[key] = size
+            while len(self._sizes) > self.size_cache_entries:
+                self._sizes.popitem(last=False)
+        return size
+    
+    async def aget_artifact_size(self, key: str) -> int:
+        """Non-blocking variant of get_artifact_size."""
+        return await run_blocking(self.get_artifact_size, key)
+    
+    def check_key(self, key: str):
+        """Raise FileNotFoundError unless `key` is a well-formed artifact key."""
+        # Key format: artifacts/{conversation_id}/{uuid}_{filename}
+        parts = key.split('/', 2)  # ['artifacts', 'conv_id', 'uuid_filename']
+        if len(parts) != 3 or parts[0] != "artifacts" or ".." in key.split('/'):
+            logger.error(f"[ARTIFACT LIFECYCLE] Invalid artifact key format: {key}")
+            raise FileNotFoundError(f"Invalid artifact key: {key}")
+    
+    def _open(self, key: str):
+        self.check_key(key)
+        try:
+            return self.backend.open_stream(key)
+        except FileNotFoundError:
+            logger.error(f"[ARTIFACT LIFECYCLE] Artifact does not exist: {key}")
+            raise
+        except Exception as e:
+            logger.error(f"[ARTIFACT LIFECYCLE] Failed to open artifact from {self.mode}: {e}")
+            raise FileNotFoundError(f"Artifact not found: {key}")
     
     def get_artifact_bytes(self, key: str) -> bytes:
         """
@@ -201,6 +298,10 @@ class ArtifactService:
             chunks.append(chunk)
         return b''.join(chunks)
     
+    async def aget_artifact_bytes(self, key: str) -> bytes:
+        """Non-blocking variant of get_artifact_bytes."""
+        return await run_blocking(self.get_artifact_bytes, key)
+    
     def get_media_type(self, key: str) -> str:
         """
         Determine the media type for an artifact based on its filename.
@@ -231,4 +332,6 @@ class ArtifactService:
 
 
 # Singleton instance
-artifact_service = ArtifactService()
+artifact_service = ArtifactService(
+    presign_ttl=settings.ARTIFACT_PRESIGNED_TTL_SECONDS if settings.ARTIFACT_PRESIGNED_URLS else None
+)
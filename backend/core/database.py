@@ -1,21 +1,153 @@
-from sqlmodel import SQLModel, create_engine
+import threading
+from typing import Any, Dict
+
+from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+from core.config import settings
+
+DATABASE_URL = settings.DATABASE_URL
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    Keyword arguments for create_async_engine, from Settings.
+
+    SQLite keeps SQLAlchemy's default pool; pool sizing only applies to
+    server databases.
+    """
+    parsed = make_url(url)
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if parsed.get_backend_name() == "sqlite":
+        return options
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    if parsed.get_driver_name() == "asyncpg" and settings.DB_STATEMENT_CACHE_SIZE is not None:
+        # asyncpg's own cache plus SQLAlchemy's prepared statement cache (both must be 0 for PgBouncer)
+        options["connect_args"] = {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+        options["url"] = parsed.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)}
+        )
+    return options
+
+
+class PoolStats:
+    """Connection pool counters, fed by pool events."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
 
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://postgres:postgres@db:5432/chat_db")
+        pool_events = engine.sync_engine
+        event.listen(pool_events, "connect", self._on_connect)
+        event.listen(pool_events, "checkout", self._on_checkout)
+        event.listen(pool_events, "checkin", self._on_checkin)
+        event.listen(pool_events, "invalidate", self._on_invalidate)
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        with self._lock:
+            stats = {
+                "pool": type(pool).__name__,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "invalidations": self.invalidations,
+            }
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + pool._max_overflow
+            stats.update(size=pool.size(), max_overflow=pool._max_overflow, idle=pool.checkedin(),
+                         overflow=pool.overflow(),
+                         utilization=round(stats["checked_out"] / capacity, 3) if capacity > 0 else None)
+        return stats
+
+
+_options = engine_options(DATABASE_URL)
+engine = create_async_engine(_options.pop("url", DATABASE_URL), **_options)
+pool_stats = PoolStats(engine)
+
+# Built once; sessions are cheap to create from it
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+def _add_missing_columns(conn, metadata=SQLModel.metadata):
+    """
+    create_all only creates missing tables, so columns added to existing
+    models are appended here.
+
+    New columns must be nullable or declare a `server_default`, which is
+    carried into the ALTER TABLE so existing rows are backfilled. A Python-side
+    `default=` only applies to rows inserted through the ORM; existing rows get
+    NULL, so such columns are added as nullable.
+    """
+    inspector = inspect(conn)
+    ddl_compiler = conn.dialect.ddl_compiler(conn.dialect, None)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+            default = ddl_compiler.get_column_default_string(column)
+            if default is not None:
+                ddl += f" DEFAULT {default}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            conn.execute(text(ddl))
+
+def _add_missing_indexes(conn):
+    """Like _add_missing_columns, for indexes declared after a table was created."""
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
 
 async def init_db():
     async with engine.begin() as conn:
         # await conn.run_sync(SQLModel.metadata.drop_all) # Be careful with this in production
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_add_missing_indexes)
 
 async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
     async with async_session() as session:
         yield session
@@ -0,0 +1,161 @@
+"""
+DataFrame Cache - Process-wide LRU cache of parsed datasets.
+
+Parsing a large CSV on every chat turn dominates request latency, so parsed
+frames are kept in memory keyed by dataset id and file checksum. The cache is
+bounded by an approximate byte budget and evicts least recently used entries.
+
+Frames are handed out as copy-on-write views: pandas' copy-on-write mode is
+enabled so that `df.copy(deep=False)` shares the underlying buffers with the
+cached frame, and any mutation done by sandboxed code copies the touched data
+instead of corrupting the cached original.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from core.config import settings
+from core.logger import logger
+
+# Required for safe shallow handoff of cached frames (default from pandas 3.0)
+pd.set_option("mode.copy_on_write", True)
+
+CacheKey = Tuple[int, str]
+
+_checksum_memo: Dict[Tuple[int, int, int, int], str] = {}
+_checksum_lock = threading.Lock()
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 checksum of a file.
+
+    Results are memoized on (inode, size, mtime) so an unchanged file is only
+    hashed once per process, including after it is renamed into place.
+    """
+    stat = os.stat(path)
+    stat_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _checksum_lock:
+        cached = _checksum_memo.get(stat_key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    checksum = digest.hexdigest()
+
+    with _checksum_lock:
+        _checksum_memo[stat_key] = checksum
+    return checksum
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Approximate in-memory size of a DataFrame, including object columns."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class DataFrameCache:
+    """
+    LRU cache of parsed DataFrames with a byte-size budget.
+
+    Key features:
+    - Keyed by (dataset_id, checksum) so a replaced file is never served stale
+    - Least recently used entries are evicted once the budget is exceeded
+    - Hit/miss/eviction counters for observability
+    - Copy-on-write handoff so callers cannot mutate the cached frame
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, dataset_id: int, checksum: str) -> Optional[pd.DataFrame]:
+        """
+        Return a copy-on-write view of the cached frame, or None on a miss.
+        """
+        key = (dataset_id, checksum)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            df = entry[0]
+        return df.copy(deep=False)
+
+    def put(self, dataset_id: int, checksum: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cache a frame and return a copy-on-write view of it.
+
+        Frames larger than the whole budget are not cached. Older versions of
+        the same dataset are dropped since they can no longer be requested.
+        """
+        size = frame_nbytes(df)
+        key = (dataset_id, checksum)
+
+        if size > self.max_bytes:
+            logger.info(f"Dataset {dataset_id} ({size} bytes) exceeds cache budget, not caching")
+            return df.copy(deep=False)
+
+        with self._lock:
+            for stale_key in [k for k in self._entries if k[0] == dataset_id and k != key]:
+                self._remove(stale_key)
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (df, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self._entries:
+                evicted_key = next(iter(self._entries))
+                self._remove(evicted_key)
+                self.evictions += 1
+                logger.info(f"Evicted dataset {evicted_key[0]} from DataFrame cache")
+
+        return df.copy(deep=False)
+
+    def invalidate(self, dataset_id: int):
+        """Drop every cached version of a dataset."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == dataset_id]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: CacheKey):
+        _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+
+# Singleton instance
+dataframe_cache = DataFrameCache(max_bytes=settings.DATAFRAME_CACHE_MAX_BYTES)
@@ -0,0 +1,208 @@
+"""
+Dataset File Cache - Bounded local directory of files downloaded from storage.
+
+Agents used to download datasets to `/tmp/dataset_{id}.*` and trusted any file
+at that path, so an interrupted download was parsed as valid data and the
+directory grew until the disk filled up.
+
+Key features:
+- Downloads go to a temporary name and are renamed into place, so a cached
+  file is always complete
+- Checksums recorded at upload are verified before a download is published
+  and when a cached file is first reused in a process
+- One download per file at a time; concurrent requests wait for it
+- Least recently used files are evicted above DATASET_CACHE_MAX_BYTES;
+  files pinned by a shared frame or a profiling job are skipped until unpinned
+- Hit/miss/eviction counters for /metrics
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from backend.core.dataframe_cache import file_checksum
+from backend.core.storage import storage
+from core.config import settings
+from core.logger import logger
+
+PARTIAL_SUFFIX = ".part"
+
+
+class ChecksumMismatch(IOError):
+    """A downloaded file does not match the checksum recorded for it."""
+
+
+class DatasetFileCache:
+    def __init__(self, root: str, max_bytes: int, storage_service=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.storage = storage_service or storage
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # name -> size, oldest first
+        self._verified: Dict[str, str] = {}  # name -> checksum verified in this process
+        self._pins: Dict[str, int] = {}  # name -> number of users that must not lose the file
+        self._lock = threading.Lock()
+        self._key_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.checksum_failures = 0
+        self._scan()
+
+    async def fetch(self, source_key: str, name: str, checksum: Optional[str] = None,
+                    pin: bool = False) -> str:
+        """
+        Return the local path of a stored file, downloading it if needed.
+
+        Args:
+            source_key: Storage path/key of the file
+            name: File name inside the cache (unique per stored file)
+            checksum: Expected SHA-256, if known; a mismatch is never cached
+            pin: Pin the file before returning it; the caller must `unpin` it
+        """
+        path = os.path.join(self.root, name)
+        lock = self._key_locks.get(name)
+        if lock is None:
+            lock = self._key_locks[name] = asyncio.Lock()
+
+        async with lock:
+            if await self._valid(name, path, checksum):
+                with self._lock:
+                    self.hits += 1
+                    self._entries.move_to_end(name)
+                    if pin:
+                        self._pin(name)
+                return path
+
+            with self._lock:
+                self.misses += 1
+            partial = f"{path}.{uuid.uuid4().hex[:8]}{PARTIAL_SUFFIX}"
+            logger.info(f"Downloading {source_key} to dataset cache as {name}")
+            try:
+                await self.storage.adownload_file(source_key, partial)
+                actual = await asyncio.to_thread(file_checksum, partial)
+                if checksum and actual != checksum:
+                    with self._lock:
+                        self.checksum_failures += 1
+                    raise ChecksumMismatch(f"Checksum mismatch for {source_key}: expected {checksum[:12]}, got {actual[:12]}")
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+
+            size = os.path.getsize(path)
+            with self._lock:
+                if name in self._entries:
+                    self.current_bytes -= self._entries.pop(name)
+                self._entries[name] = size
+                self.current_bytes += size
+                self._verified[name] = actual
+                if pin:
+                    self._pin(name)
+            self._evict(keep=name)
+            return path
+
+    def pin(self, name: str):
+        """Keep a cached file from being evicted until a matching `unpin`."""
+        with self._lock:
+            self._pin(name)
+
+    def unpin(self, name: str):
+        with self._lock:
+            count = self._pins.pop(name, 0) - 1
+            if count > 0:
+                self._pins[name] = count
+        # Eviction skipped while the file was pinned may be due now
+        self._evict(keep=None)
+
+    def discard(self, name: str):
+        """Drop a cached file, e.g. one that turned out to be unreadable."""
+        with self._lock:
+            self._remove(name)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "pinned": len(self._pins),
+                "checksum_failures": self.checksum_failures,
+            }
+
+    async def _valid(self, name: str, path: str, checksum: Optional[str]) -> bool:
+        with self._lock:
+            known = name in self._entries
+            verified = self._verified.get(name)
+        if not known or not os.path.exists(path):
+            with self._lock:
+                self._remove(name)
+            return False
+        if not checksum or verified == checksum:
+            return True
+        # Files adopted from a previous run are hashed once before being trusted
+        actual = await asyncio.to_thread(file_checksum, path)
+        if actual != checksum:
+            logger.warning(f"Cached {name} does not match its checksum, downloading again")
+            with self._lock:
+                self.checksum_failures += 1
+                self._remove(name)
+            return False
+        with self._lock:
+            self._verified[name] = actual
+        return True
+
+    def _evict(self, keep: str):
+        with self._lock:
+            while self.current_bytes > self.max_bytes:
+                name = next((n for n in self._entries if n != keep and n not in self._pins), None)
+                if name is None:
+                    break
+                logger.info(f"Evicting {name} from dataset cache")
+                self._remove(name)
+                self.evictions += 1
+
+    def _pin(self, name: str):
+        self._pins[name] = self._pins.get(name, 0) + 1
+
+    def _remove(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self.current_bytes -= size
+        self._verified.pop(name, None)
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+    def _scan(self):
+        """Adopt complete files left by a previous process and delete partial ones."""
+        os.makedirs(self.root, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.current_bytes += size
+        self._evict(keep=None)
+
+
+# Singleton instance
+dataset_file_cache = DatasetFileCache(
+    root=settings.DATASET_CACHE_DIR or os.path.join(tempfile.gettempdir(), "dataset_cache"),
+    max_bytes=settings.DATASET_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,132 @@
+"""
+Ingest - One-time processing of uploaded datasets.
+
+The upload stream is teed while it is sent to storage, so format detection,
+the preview and a local working copy come from a single pass over the bytes.
+The full parse then runs as a background job that converts the CSV once to a
+typed Arrow IPC file stored next to it and computes the schema profile used
+in the system prompt. Later agent rebuilds load the columnar copy instead of
+re-parsing text, and column dtypes stay the same across turns.
+"""
+
+import asyncio
+import io
+import json
+import os
+import tempfile
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+import pandas as pd
+
+from backend.core.database import get_session
+from backend.core.dataframe_cache import file_checksum
+from backend.core.storage import storage
+from backend.models import Dataset
+from core.logger import logger
+from data.dataframe import CSVFormat, read_csv, write_columnar
+from data.profile import profile_dataframe
+
+COLUMNAR_EXT = "arrow"
+
+
+def convert_to_columnar(df: pd.DataFrame, csv_filename: str) -> Optional[Tuple[str, str]]:
+    """
+    Convert a parsed dataset to Arrow IPC and store it next to the CSV.
+
+    Args:
+        df: DataFrame parsed from the uploaded CSV
+        csv_filename: Storage filename of the CSV (e.g. "{uuid}.csv")
+
+    Returns:
+        Stored path/key and SHA-256 of the columnar copy, or None if
+        conversion failed. Callers fall back to the CSV in that case.
+    """
+    stem = os.path.splitext(csv_filename)[0]
+    filename = f"{stem}.{COLUMNAR_EXT}"
+    temp_path = os.path.join(tempfile.gettempdir(), filename)
+
+    try:
+        write_columnar(df, temp_path)
+        checksum = file_checksum(temp_path)
+        with open(temp_path, "rb") as f:
+            stored_path = storage.upload_file(f, filename)
+        logger.info(f"Stored columnar copy of {csv_filename} at {stored_path}")
+        return stored_path, checksum
+    except Exception as e:
+        # e.g. object columns with mixed types that Arrow cannot represent
+        logger.warning(f"Columnar conversion failed for {csv_filename}, keeping CSV only: {e}")
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class TeeReader(io.RawIOBase):
+    """
+    Read-only, forward-only file wrapper that copies every chunk read by the
+    consumer (e.g. a storage upload) to a list of sinks.
+
+    It reports itself as non-seekable so uploaders read it sequentially
+    instead of seeking around for multipart uploads or retries.
+    """
+
+    def __init__(self, source: BinaryIO, sinks: List[Callable[[bytes], object]]):
+        self.source = source
+        self.sinks = sinks
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # Callers rewind defensively before reading; that is only a no-op here
+        if offset == 0 and whence == io.SEEK_SET and self._position == 0:
+            return 0
+        raise io.UnsupportedOperation("TeeReader is forward-only")
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.source.read(size)
+        if chunk:
+            self._position += len(chunk)
+            for sink in self.sinks:
+                sink(chunk)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+async def ingest_dataset(dataset_id: int, local_path: str, csv_filename: str, csv_format: CSVFormat):
+    """
+    Background job: parse the uploaded CSV once, profile it and store its
+    columnar copy.
+
+    Until this finishes, agents keep loading the CSV itself.
+    """
+    try:
+        df = await asyncio.to_thread(read_csv, local_path, csv_format)
+        profile = await asyncio.to_thread(profile_dataframe, df)
+        columnar = await asyncio.to_thread(convert_to_columnar, df, csv_filename)
+
+        async for session in get_session():
+            dataset = await session.get(Dataset, dataset_id)
+            if dataset:
+                dataset.profile_summary = json.dumps(profile)
+                if columnar:
+                    dataset.columnar_path, dataset.columnar_checksum = columnar
+                session.add(dataset)
+                await session.commit()
+            break
+    except Exception as e:
+        logger.error(f"Ingest failed for dataset {dataset_id}: {e}", exc_info=True)
+    finally:
+        if os.path.exists(local_path):
+            os.remove(local_path)
@@ -0,0 +1,141 @@
+"""
+Message Writer - Buffered persistence of one chat turn.
+
+The chat stream used to save the user message in its own session, build the
+reply with repeated string concatenation and save it in another session once
+the stream ended, so a cancelled stream or a client disconnect lost the reply.
+
+Key features:
+- Reply events are collected as structured parts (agent.message_parts);
+  text chunks are joined only when written, together with the parts'
+  rendered markup
+- The user message is written as soon as the turn starts; the reply is
+  inserted with the first flush, and later flushes update the same row
+- Flushes happen at most every MESSAGE_FLUSH_INTERVAL_SECONDS while
+  streaming, never once per chunk; a failed one does not interrupt the stream
+- `close()` writes whatever is buffered, and is safe to call from a
+  cancelled or disconnected stream
+- If the conversation is deleted mid-stream, the buffer is dropped instead
+  of writing rows that belong to no conversation
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from agent.message_parts import ReplyParts, render_parts
+from backend.core.database import get_session
+from backend.models import Conversation, Message
+from core.config import settings
+from core.logger import logger
+
+
+class MessageWriter:
+    def __init__(self, conversation_id: str, flush_interval: Optional[float] = None):
+        self.conversation_id = conversation_id
+        self.flush_interval = settings.MESSAGE_FLUSH_INTERVAL_SECONDS if flush_interval is None else flush_interval
+        self._pending: List[Message] = []  # complete messages not yet written
+        self._reply = ReplyParts()
+        self._reply_id: Optional[int] = None
+        self._dirty = False
+        self._deleted = False  # the conversation is gone; nothing more is written
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+
+    def add(self, role: str, content: str):
+        """Queue a complete message; it is written with the next flush."""
+        self._pending.append(Message(role=role, content=content, conversation_id=self.conversation_id))
+
+    async def append(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Record an agent event of the assistant reply, flushing if the interval
+        has passed. Returns the part it added (see ReplyParts.add).
+
+        A failed periodic flush is only logged: the buffer is kept for the
+        next flush, and the stream goes on. `close()` reports the final write.
+        """
+        part = self._reply.add(event)
+        if part is None:
+            return None
+        self._dirty = True
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Periodic save of conversation {self.conversation_id} failed, retrying later: {e}")
+        return part
+
+    @property
+    def parts(self) -> List[Dict[str, Any]]:
+        return self._reply.parts
+
+    async def flush(self):
+        """Write queued messages and the reply so far in one transaction."""
+        async with self._lock:
+            if self._deleted or (not self._pending and not self._dirty):
+                return
+            pending, self._pending = self._pending, []
+            dirty = self._dirty
+            if dirty:
+                parts = self.parts
+                values = {"content": render_parts(parts), "parts": json.dumps(parts)}
+            self._dirty = False
+            try:
+                async for session in get_session():
+                    # The conversation may have been deleted while the reply was streaming
+                    if await session.get(Conversation, self.conversation_id) is None:
+                        self._drop()
+                        return
+                    session.add_all(pending)
+                    reply = None
+                    if dirty and self._reply_id is None:
+                        reply = Message(role="assistant", conversation_id=self.conversation_id, **values)
+                        session.add(reply)
+                    elif dirty:
+                        await session.exec(update(Message).where(Message.id == self._reply_id).values(**values))
+                    await session.flush()
+                    await session.commit()
+                    if reply is not None:
+                        self._reply_id = reply.id
+            except IntegrityError:
+                # Deleted between the check and the insert (foreign key violation)
+                self._drop()
+                return
+            except Exception:
+                # Keep the buffer so the next flush retries
+                self._pending = pending + self._pending
+                self._dirty = self._dirty or dirty
+                raise
+            finally:
+                self._last_flush = time.monotonic()
+            self.flushes += 1
+
+    def _drop(self):
+        logger.warning(f"Conversation {self.conversation_id} was deleted; discarding its unsaved messages")
+        self._deleted = True
+        self._pending = []
+        self._dirty = False
+
+    async def close(self):
+        """
+        Write everything still buffered.
+
+        The flush runs in its own task, so a cancellation delivered to the
+        caller (e.g. a disconnected client) does not abandon the write.
+        """
+        try:
+            await asyncio.shield(asyncio.ensure_future(self._final_flush()))
+        except asyncio.CancelledError:
+            logger.info(f"Stream for conversation {self.conversation_id} cancelled; finishing message write")
+            raise
+
+    async def _final_flush(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to save messages for conversation {self.conversation_id}: {e}", exc_info=True)
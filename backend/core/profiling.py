@@ -0,0 +1,203 @@
+"""
+Profiling Service - Background, cached ydata_profiling reports.
+
+Building a ProfileReport takes minutes on large frames. Running it inside the
+sandbox held up the chat stream, and every "EDA" request rebuilt it from
+scratch. Reports are now built by a job queue, once per dataset version, and
+stored through ArtifactService.
+
+Key features:
+- One job per (dataset, version); concurrent requests await the same job
+- Runs in a separate process (or a thread with PROFILING_WORKERS=0)
+- Minimal mode and row sampling above PROFILING_FULL_MAX_ROWS rows
+- HTML and JSON keys are recorded on the Dataset row, so a finished report
+  is reused across conversations and restarts
+- Callers wait a bounded time; a job that is still running keeps going in
+  the background and the next request picks it up
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend.core.artifacts import artifact_service
+from backend.core.database import get_session
+from backend.models import Dataset
+from core.config import settings
+from core.logger import logger
+from data.dataframe import CSVFormat, load_columnar, read_csv
+
+JSON_CACHE_SIZE = 8
+
+
+@dataclass
+class ProfileReportResult:
+    html_key: str
+    json_key: str
+    data: Dict[str, Any] = field(default_factory=dict)  # parsed JSON report
+
+
+def _build_report(source_path: str, csv_format: Optional[CSVFormat], title: str, out_dir: str,
+                  full_max_rows: int, sample_rows: int) -> Tuple[str, str]:
+    """Worker: load the dataset file and write report.html and report.json to out_dir."""
+    from ydata_profiling import ProfileReport
+
+    if source_path.endswith(".arrow"):
+        df = load_columnar(source_path)
+    else:
+        df = read_csv(source_path, csv_format)
+
+    minimal = len(df) > full_max_rows
+    if len(df) > sample_rows:
+        df = df.sample(n=sample_rows, random_state=0)
+
+    report = ProfileReport(df, title=title, minimal=minimal, progress_bar=False)
+    html_path = os.path.join(out_dir, "report.html")
+    json_path = os.path.join(out_dir, "report.json")
+    report.to_file(html_path)
+    report.to_file(json_path)
+    return html_path, json_path
+
+
+class ProfilingService:
+    def __init__(self, workers: int, full_max_rows: int, sample_rows: int, wait_seconds: float):
+        self.workers = workers
+        self.full_max_rows = full_max_rows
+        self.sample_rows = sample_rows
+        self.wait_seconds = wait_seconds
+
+        self._jobs: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._json_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def get_report(self, dataset_id: int, version: str, source_path: str,
+                         csv_format: Optional[CSVFormat] = None,
+                         timeout: Optional[float] = None,
+                         release: Optional[Callable[[], None]] = None) -> Optional[ProfileReportResult]:
+        """
+        Return the report for a dataset version, starting its job if needed.
+
+        Returns None if the job does not finish within `timeout` seconds
+        (default PROFILING_WAIT_SECONDS); it keeps running in the background.
+        `release` is called once `source_path` is no longer needed: when a
+        job started here finishes, or right away if none was started.
+        """
+        job = None
+        try:
+            result = await self._stored_report(dataset_id, version)
+            if result is None:
+                key = (dataset_id, version)
+                task = self._jobs.get(key)
+                if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+                    # Only the latest version of a dataset is worth keeping
+                    for stale in [k for k in self._jobs if k[0] == dataset_id and k != key]:
+                        self._jobs.pop(stale)
+                    task = job = asyncio.ensure_future(self._run(dataset_id, version, source_path, csv_format))
+                    self._jobs[key] = task
+        finally:
+            if release is not None:
+                if job is None:
+                    release()
+                else:
+                    job.add_done_callback(lambda _: release())
+
+        if result is None:
+            timeout = self.wait_seconds if timeout is None else timeout
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"Profile report for dataset {dataset_id} still running after {timeout}s")
+                return None
+
+        result.data = await self._load_json(result.json_key)
+        return result
+
+    async def shutdown(self):
+        for task in self._jobs.values():
+            task.cancel()
+        self._jobs.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, dataset_id: int, version: str, source_path: str,
+                   csv_format: Optional[CSVFormat]) -> ProfileReportResult:
+        out_dir = artifact_service.create_staging_dir()
+        args = (source_path, csv_format, f"Dataset {dataset_id} Profiling Report", out_dir,
+                self.full_max_rows, self.sample_rows)
+        logger.info(f"Building profile report for dataset {dataset_id} (version {version[:12]})")
+        try:
+            if self.workers > 0:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+                    )
+                loop = asyncio.get_running_loop()
+                html_path, json_path = await loop.run_in_executor(self._executor, _build_report, *args)
+            else:
+                html_path, json_path = await asyncio.to_thread(_build_report, *args)
+
+            scope = f"datasets/{dataset_id}"
+            html_key, json_key = await asyncio.gather(
+                artifact_service.acommit_artifact(html_path, scope),
+                artifact_service.acommit_artifact(json_path, scope),
+            )
+            await self._store_report(dataset_id, version, html_key, json_key)
+            logger.info(f"Profile report for dataset {dataset_id} stored at {html_key}")
+            return ProfileReportResult(html_key=html_key, json_key=json_key)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next job
+            logger.error(f"Profiling worker died while building the report for dataset {dataset_id}")
+            self._executor = None
+            raise
+        except Exception as e:
+            logger.error(f"Profile report for dataset {dataset_id} failed: {e}", exc_info=True)
+            raise
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    async def _stored_report(self, dataset_id: int, version: str) -> Optional[ProfileReportResult]:
+        async for session in get_session():
+            dataset = await session.get(Dataset, dataset_id)
+            if dataset and dataset.profile_report_version == version and dataset.profile_json_key:
+                return ProfileReportResult(html_key=dataset.profile_report_key, json_key=dataset.profile_json_key)
+            return None
+
+    async def _store_report(self, dataset_id: int, version: str, html_key: str, json_key: str):
+        async for session in get_session():
+            dataset = await session.get(Dataset, dataset_id)
+            if dataset:
+                dataset.profile_report_version = version
+                dataset.profile_report_key = html_key
+                dataset.profile_json_key = json_key
+                session.add(dataset)
+                await session.commit()
+            break
+
+    async def _load_json(self, json_key: str) -> Dict[str, Any]:
+        data = self._json_cache.get(json_key)
+        if data is None:
+            raw = await artifact_service.aget_artifact_bytes(json_key)
+            data = await asyncio.to_thread(json.loads, raw)
+            self._json_cache[json_key] = data
+            while len(self._json_cache) > JSON_CACHE_SIZE:
+                self._json_cache.popitem(last=False)
+        else:
+            self._json_cache.move_to_end(json_key)
+        return data
+
+
+# Singleton instance
+profiling_service = ProfilingService(
+    workers=settings.PROFILING_WORKERS,
+    full_max_rows=settings.PROFILING_FULL_MAX_ROWS,
+    sample_rows=settings.PROFILING_SAMPLE_ROWS,
+    wait_seconds=settings.PROFILING_WAIT_SECONDS,
+)
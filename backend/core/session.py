@@ -1,15 +1,68 @@
+import asyncio
+import base64
+import functools
+import json
 import uuid
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, delete, or_
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from backend.core.artifacts import artifact_service
 from backend.core.database import get_session
+from backend.core.dataframe_cache import dataframe_cache, file_checksum
+from backend.core.file_cache import dataset_file_cache
+from backend.core.ingest import COLUMNAR_EXT
+from backend.core.profiling import profiling_service
 from backend.models import Conversation, Dataset, Message
 from agent.service import CSVAgent
+from agent.history import history_manager
+from agent.result_cache import result_cache
 from agent.prompts import format_system_prompt
-import pandas as pd
+from agent.sandbox import sandbox_pool
+from agent.shared_frames import shared_frames
+from data.dataframe import load_columnar, read_csv
+from data.profile import profile_dataframe
+from core.config import settings
+from core.logger import logger
 import os
 
+MessageCursor = Tuple[datetime, int]
+
+
+def encode_cursor(message: Message) -> str:
+    """Opaque keyset cursor pointing just before `message`."""
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> MessageCursor:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+async def message_page(session: AsyncSession, conversation_id: str, limit: int,
+                       before: Optional[MessageCursor] = None) -> Tuple[List[Message], bool]:
+    """
+    The `limit` newest messages older than `before`, in chronological order,
+    and whether older ones exist. Served by the (conversation_id, timestamp, id) index.
+    """
+    stmt = select(Message).where(Message.conversation_id == conversation_id)
+    if before:
+        timestamp, message_id = before
+        stmt = stmt.where(or_(Message.timestamp < timestamp,
+                              and_(Message.timestamp == timestamp, Message.id < message_id)))
+    stmt = stmt.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1)
+    rows = (await session.exec(stmt)).all()
+    return list(reversed(rows[:limit])), len(rows) > limit
+
+
 class SessionManager:
     async def create_conversation(self, dataset_id: int, title: str, user_id: str) -> str:
         async for session in get_session():
@@ -47,65 +100,95 @@ class SessionManager:
                 return None
 
             # 2. Load DataFrame (from storage)
-            # Fetch file from S3/Storage to local temp
-            from backend.core.storage import storage
-            
-            # We must use a unique temp path per dataset to avoid collisions but also maybe reuse if exists?
-            # For simplicity and statelessness (Railway), always download.
-            # Use /tmp for ephemeral storage
-            import os
-            
-            # Extract filename from path or just use dataset ID
-            temp_filename = f"dataset_{dataset.id}.csv"
-            temp_path = os.path.join("/tmp", temp_filename)
-            
-            # Download file only if it doesn't exist locally
-            if not os.path.exists(temp_path):
-                from core.logger import logger
-                logger.info(f"Downloading dataset {dataset.id} to {temp_path}")
-                storage.download_file(dataset.file_path, temp_path)
+            # Prefer the columnar copy written at ingest; older datasets only have the CSV
+            if dataset.columnar_path:
+                source_path, ext, loader = dataset.columnar_path, COLUMNAR_EXT, load_columnar
+                expected_checksum = dataset.columnar_checksum
             else:
-                from core.logger import logger
-                logger.info(f"Dataset {dataset.id} found in cache at {temp_path}")
+                source_path, ext = dataset.file_path, "csv"
+                loader = functools.partial(read_csv, fmt=dataset.csv_format())
+                expected_checksum = dataset.checksum
+            
+            # Local copies live in a bounded cache directory; downloads are atomic and verified.
+            # The file stays pinned (not evictable) while it is read here.
+            temp_filename = f"dataset_{dataset.id}.{ext}"
+            temp_path = await dataset_file_cache.fetch(source_path, temp_filename, expected_checksum, pin=True)
+            unpin = functools.partial(dataset_file_cache.unpin, temp_filename)
             
             try:
-                # Try multiple encodings for CSV files that aren't UTF-8
-                df = None
-                encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-                
-                for encoding in encodings_to_try:
-                    try:
-                        df = pd.read_csv(temp_path, encoding=encoding)
-                        break  # Success!
-                    except UnicodeDecodeError:
-                        continue
+                # Reuse an already parsed frame when the file has not changed
+                checksum = await asyncio.to_thread(file_checksum, temp_path)
+                df = dataframe_cache.get(dataset.id, checksum)
                 
                 if df is None:
-                    from core.logger import logger
-                    logger.error(f"Could not decode CSV file {temp_path} with any supported encoding")
-                    return None
+                    df = await asyncio.to_thread(loader, temp_path)
+                    df = dataframe_cache.put(dataset.id, checksum, df)
                     
                 cols = df.columns.tolist()
             except Exception as e:
-                from core.logger import logger
-                logger.error(f"Failed to read CSV file {temp_path}: {e}")
-                # If CSV is corrupt or some other error
+                logger.error(f"Failed to read dataset file {temp_path}: {e}")
+                # If the file is corrupt or some other error, do not serve it again
+                unpin()
+                dataset_file_cache.discard(temp_filename)
                 return None
 
-            # 3. Fetch recent messages
-            # For now, let's fetch all. In future, limit to last N.
-            msg_stmt = select(Message).where(Message.conversation_id == conversation_id).order_by(Message.timestamp)
-            msg_result = await session.exec(msg_stmt)
-            messages_db = msg_result.all()
-
-            # 4. Initialize Agent with session_id for artifact scoping
-            system_prompt = format_system_prompt(cols)
-            agent = CSVAgent(system_prompt=system_prompt, context={"df": df}, session_id=conversation_id)
+            # 3. Initialize Agent with session_id for artifact scoping
+            # Publish the frame once so sandbox workers can map it instead of unpickling it per call.
+            # A columnar file is mapped in place, and the registry keeps it pinned until it lets go of it.
+            shared_refs = {}
+            arrow_path = temp_path if ext == COLUMNAR_EXT and sandbox_pool.size > 0 else None
+            try:
+                if sandbox_pool.size > 0:
+                    shared_refs["df"] = await asyncio.to_thread(
+                        shared_frames.register, dataset.id, checksum[:16], df, arrow_path,
+                        unpin if arrow_path else None
+                    )
+            finally:
+                if not (arrow_path and "df" in shared_refs):
+                    unpin()
+            
+            # Datasets uploaded before profiling existed (or still ingesting) are profiled once here
+            if not dataset.profile_summary:
+                dataset.profile_summary = json.dumps(await asyncio.to_thread(profile_dataframe, df))
+                session.add(dataset)
+                await session.commit()
+            
+            system_prompt = format_system_prompt(cols, profile=dataset.profile())
+            agent = CSVAgent(system_prompt=system_prompt, context={"df": df}, session_id=conversation_id,
+                             shared_refs=shared_refs, user_id=user_id,
+                             dataset_version=f"{dataset.id}:{checksum}",
+                             report_provider=functools.partial(
+                                 self._profile_report, dataset, source_path, temp_filename,
+                                 expected_checksum, checksum, ext
+                             ))
+            
+            # 4. Replay history into agent, within the token budget
+            # Only the newest pages are read, until older messages cannot change the window
+            messages_db, has_more = await message_page(session, conversation_id, settings.HISTORY_PAGE_SIZE)
+            while has_more and not history_manager.is_complete(
+                    messages_db, system_prompt, conversation.history_summary_upto):
+                page, has_more = await message_page(session, conversation_id, settings.HISTORY_PAGE_SIZE,
+                                                    before=(messages_db[0].timestamp, messages_db[0].id))
+                messages_db = page + messages_db
             
-            # 5. Replay history into agent
             # We skip the system prompt as it's already added in __init__
-            for msg in messages_db:
-                agent.add_message(msg.role, msg.content)
+            window = history_manager.build(
+                messages_db,
+                system_prompt=system_prompt,
+                cached_summary=conversation.history_summary,
+                cached_upto_id=conversation.history_summary_upto,
+            )
+            if window.summary:
+                agent.add_message("system", window.summary)
+            for msg in window.messages:
+                agent.add_message(**msg)
+            
+            # Cache the summary so older turns are not re-summarized on every request
+            if window.summary_upto_id != conversation.history_summary_upto:
+                conversation.history_summary = window.summary
+                conversation.history_summary_upto = window.summary_upto_id
+                session.add(conversation)
+                await session.commit()
             
             return agent
             
@@ -119,13 +202,29 @@ class SessionManager:
             session.add(message)
             await session.commit()
 
+    @staticmethod
+    async def _profile_report(dataset: Dataset, source_path: str, cache_name: str,
+                              expected_checksum: Optional[str], checksum: str, ext: str):
+        # The cached file may have been evicted since the agent was built; the job keeps it pinned
+        path = await dataset_file_cache.fetch(source_path, cache_name, expected_checksum, pin=True)
+        return await profiling_service.get_report(
+            dataset.id, checksum, path, None if ext == COLUMNAR_EXT else dataset.csv_format(),
+            release=functools.partial(dataset_file_cache.unpin, cache_name)
+        )
+
     async def list_conversations(self, user_id: str):
         async for session in get_session():
             stmt = select(Conversation).where(Conversation.user_id == user_id).order_by(Conversation.created_at.desc())
             result = await session.exec(stmt)
             return result.all()
 
-    async def get_conversation_details(self, conversation_id: str, user_id: str):
+    async def get_conversation_details(self, conversation_id: str, user_id: str, limit: int,
+                                       before: Optional[str] = None):
+        """
+        The conversation and one page of its messages (newest first pages,
+        chronological within a page), plus the cursor of the next older page.
+        """
+        cursor = decode_cursor(before) if before else None
         async for session in get_session():
             stmt = select(Conversation).where(Conversation.id == conversation_id, Conversation.user_id == user_id)
             result = await session.exec(stmt)
@@ -133,30 +232,81 @@ class SessionManager:
             if not conversation:
                 return None
             
-            # Fetch messages
-            msg_stmt = select(Message).where(Message.conversation_id == conversation_id).order_by(Message.timestamp)
-            msg_result = await session.exec(msg_stmt)
-            messages = msg_result.all()
-            
-            
-            return conversation, messages
+            messages, has_more = await message_page(session, conversation_id, limit, cursor)
+            next_cursor = encode_cursor(messages[0]) if has_more else None
+            return conversation, messages, next_cursor
 
-    async def delete_conversation(self, conversation_id: str, user_id: str):
+    async def owns_storage_key(self, key: str, user_id: str, allow_unowned: bool = False) -> bool:
+        """
+        Whether a user may download a storage key.
+
+        Artifacts belong to their conversation (artifacts/{conversation_id}/...)
+        or dataset (artifacts/datasets/{id}/...), dataset files (the upload
+        and its columnar copy) to their uploader. Keys with no owner on record
+        are refused unless `allow_unowned` (the legacy /files route, whose
+        old artifacts were never recorded).
+        """
+        parts = key.split("/")
         async for session in get_session():
-            # Delete messages first (cascade usually handles this but let's be explicit/safe)
-            msg_stmt = select(Message).where(Message.conversation_id == conversation_id)
-            results = await session.exec(msg_stmt)
-            for msg in results.all():
-                await session.delete(msg)
-            
-            # Delete conversation
-            stmt = select(Conversation).where(Conversation.id == conversation_id, Conversation.user_id == user_id)
-            result = await session.exec(stmt)
-            conversation = result.first()
-            if conversation:
-                await session.delete(conversation)
-            
+            if parts[0] == "artifacts" and len(parts) >= 3:
+                if parts[1] == "datasets":
+                    dataset = await session.get(Dataset, int(parts[2])) if parts[2].isdigit() else None
+                    return dataset is not None and dataset.user_id == user_id
+                conversation = await session.get(Conversation, parts[1])
+                return conversation is not None and conversation.user_id == user_id
+            result = await session.exec(
+                select(Dataset.user_id).where(or_(Dataset.file_path == key, Dataset.columnar_path == key))
+            )
+            owners = result.all()
+            if not owners:
+                return allow_unowned
+            return user_id in owners
+        return False
+
+    async def delete_conversations(self, user_id: str, conversation_id: Optional[str] = None,
+                                   dataset_id: Optional[int] = None) -> int:
+        """
+        Delete a user's conversations, their messages and their artifacts.
+
+        Without filters the user's whole history is deleted. Rows go in two
+        set-based DELETE statements; artifacts are removed after the commit
+        with batched storage deletes. Returns the number of conversations.
+        """
+        conditions = [Conversation.user_id == user_id]
+        if conversation_id is not None:
+            conditions.append(Conversation.id == conversation_id)
+        if dataset_id is not None:
+            conditions.append(Conversation.dataset_id == dataset_id)
+
+        conversation_ids = []
+        async for session in get_session():
+            result = await session.exec(select(Conversation.id).where(*conditions))
+            conversation_ids = result.all()
+            if not conversation_ids:
+                return 0
+            owned = select(Conversation.id).where(*conditions)
+            await session.exec(delete(Message).where(Message.conversation_id.in_(owned)))
+            await session.exec(delete(Conversation).where(*conditions))
             await session.commit()
-            return True
+            break
+
+        # Cached tool results hold these conversations' artifact keys
+        for cid in conversation_ids:
+            result_cache.discard_scope(cid)
+
+        # A storage failure leaves orphaned files, never orphaned rows
+        results = await asyncio.gather(
+            *(artifact_service.adelete_conversation_artifacts(cid) for cid in conversation_ids),
+            return_exceptions=True,
+        )
+        for cid, outcome in zip(conversation_ids, results):
+            if isinstance(outcome, Exception):
+                logger.error(f"Failed to delete artifacts of conversation {cid}: {outcome}")
+        logger.info(f"Deleted {len(conversation_ids)} conversations of user {user_id}")
+        return len(conversation_ids)
+
+    async def delete_conversation(self, conversation_id: str, user_id: str):
+        await self.delete_conversations(user_id, conversation_id=conversation_id)
+        return True
 
 session_manager = SessionManager()
@@ -1,75 +1,378 @@
 import boto3
+import asyncio
+import functools
+import io
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, BinaryIO, Dict, Optional
 from botocore.exceptions import ClientError
 from fastapi import HTTPException
 from core.logger import logger
 from core.config import settings
 import shutil
 
-class StorageService:
+# Blocking storage calls (boto3, disk) run here so they never stall the event loop.
+# The pool is bounded so a burst of transfers cannot exhaust the default executor.
+_io_executor = ThreadPoolExecutor(max_workers=settings.STORAGE_IO_WORKERS, thread_name_prefix="storage-io")
+
+S3_DELETE_BATCH = 1000  # DeleteObjects limit
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking storage call on the bounded I/O pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
+
+
+class LocalStorageBackend:
+    """Blob store on the local filesystem. Keys are paths relative to `root`."""
+
+    mode = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def staging_root(self) -> str:
+        # Beside the root (same filesystem, so commits are renames) but outside the served directory
+        return os.path.abspath(self.root.rstrip("/") + "_staging")
+
+    def put_fileobj(self, file_obj: BinaryIO, key: str):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as buffer:
+            shutil.copyfileobj(file_obj, buffer)
+
+    def put_file(self, file_path: str, key: str):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy2(file_path, path)
+
+    def move_file(self, file_path: str, key: str):
+        """Commit a local file to `key`, consuming it (a rename on the same filesystem)."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(file_path, path)
+
+    def get_file(self, key: str, destination_path: str):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File {key} not found locally")
+        if path != destination_path:
+            shutil.copy2(path, destination_path)
+
+    def open_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File {key} not found locally")
+        stream = open(path, "rb")
+        if start:
+            stream.seek(start)
+        return stream
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self.path_for(key))
+        except OSError:
+            raise FileNotFoundError(f"File {key} not found locally")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every object under a directory-style prefix ("a/b/"); returns the count."""
+        path = self.path_for(prefix)
+        if not os.path.isdir(path):
+            return 0
+        count = sum(len(files) for _, _, files in os.walk(path))
+        shutil.rmtree(path, ignore_errors=True)
+        return count
+
+
+class S3StorageBackend:
+    """Blob store in an S3 (or S3-compatible) bucket."""
+
+    mode = "s3"
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.s3_client = boto3.client(
+            's3',
+            endpoint_url=settings.AWS_ENDPOINT_URL,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+        )
+
+    def put_fileobj(self, file_obj: BinaryIO, key: str):
+        self.s3_client.upload_fileobj(file_obj, self.bucket_name, key)
+
+    def put_file(self, file_path: str, key: str):
+        from boto3.s3.transfer import TransferConfig
+
+        # Configure for large file uploads
+        # Use multipart for files > 5MB, with reasonable timeouts
+        transfer_config = TransferConfig(
+            multipart_threshold=5 * 1024 * 1024,  # 5MB
+            max_concurrency=10,
+            multipart_chunksize=5 * 1024 * 1024,  # 5MB chunks
+            use_threads=True
+        )
+        self.s3_client.upload_file(file_path, self.bucket_name, key, Config=transfer_config)
+
+    def staging_root(self) -> str:
+        return tempfile.gettempdir()
+
+    def move_file(self, file_path: str, key: str):
+        """Stream a local file to `key`, then delete it."""
+        self.put_file(file_path, key)
+        os.remove(file_path)
+
+    def get_file(self, key: str, destination_path: str):
+        try:
+            self.s3_client.download_file(self.bucket_name, key, destination_path)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"File {key} not found in storage")
+            raise
+
+    def open_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"File {key} not found in storage")
+            raise
+        return response['Body']
+
+    def presigned_url(self, key: str, expires_in: int, filename: Optional[str] = None,
+                      content_type: Optional[str] = None) -> str:
+        """Signed GET URL for `key`; signing is local, no request is made."""
+        params = {"Bucket": self.bucket_name, "Key": key}
+        if content_type:
+            params["ResponseContentType"] = content_type
+        if filename:
+            params["ResponseContentDisposition"] = f'inline; filename="{filename}"'
+        return self.s3_client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+    def size(self, key: str) -> int:
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=key)['ContentLength']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"File {key} not found in storage")
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, key: str):
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every object under a prefix, in batches of up to 1000 keys per request."""
+        count = 0
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, PaginationConfig={"PageSize": S3_DELETE_BATCH}):
+            objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if not objects:
+                continue
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name, Delete={"Objects": objects, "Quiet": True}
+            )
+            errors = response.get("Errors", [])
+            if errors:
+                logger.error(f"Failed to delete {len(errors)} objects under {prefix}: {errors[:3]}")
+            count += len(objects) - len(errors)
+        return count
+
+
+class InMemoryStorageBackend:
+    """Process-local blob store, used as a stand-in for S3 in tests."""
+
+    mode = "memory"
+
     def __init__(self):
-        self.bucket_name = settings.AWS_BUCKET_NAME
-        self.local_upload_dir = "uploads"
-        
+        self.objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def put_fileobj(self, file_obj: BinaryIO, key: str):
+        data = file_obj.read()
+        with self._lock:
+            self.objects[key] = data
+
+    def put_file(self, file_path: str, key: str):
+        with open(file_path, "rb") as f:
+            self.put_fileobj(f, key)
+
+    def staging_root(self) -> str:
+        return tempfile.gettempdir()
+
+    def move_file(self, file_path: str, key: str):
+        self.put_file(file_path, key)
+        os.remove(file_path)
+
+    def get_file(self, key: str, destination_path: str):
+        with open(destination_path, "wb") as f:
+            f.write(self._get(key))
+
+    def open_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+        stream = io.BytesIO(self._get(key))
+        stream.seek(start)
+        return stream
+
+    def size(self, key: str) -> int:
+        return len(self._get(key))
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return key in self.objects
+
+    def delete(self, key: str):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self.objects if key.startswith(prefix)]
+            for key in keys:
+                del self.objects[key]
+        return len(keys)
+
+    def _get(self, key: str) -> bytes:
+        with self._lock:
+            if key not in self.objects:
+                raise FileNotFoundError(f"File {key} not found in memory storage")
+            return self.objects[key]
+
+
+def create_backend():
+    bucket_name = settings.AWS_BUCKET_NAME
+    backend = settings.STORAGE_BACKEND
+    if backend is None:
         # Check if S3 is configured
-        if self.bucket_name and settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
-            self.s3_client = boto3.client(
-                's3',
-                endpoint_url=settings.AWS_ENDPOINT_URL,
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-            )
-            self.mode = "s3"
-            logger.info(f"Storage configured with S3 bucket: {self.bucket_name}")
-        else:
-            self.mode = "local"
-            os.makedirs(self.local_upload_dir, exist_ok=True)
-            logger.info("Storage configured with Local Filesystem")
+        s3_configured = bucket_name and settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY
+        backend = "s3" if s3_configured else "local"
+
+    if backend == "s3":
+        logger.info(f"Storage configured with S3 bucket: {bucket_name}")
+        return S3StorageBackend(bucket_name)
+    if backend == "memory":
+        logger.info("Storage configured with in-memory backend")
+        return InMemoryStorageBackend()
+    logger.info("Storage configured with Local Filesystem")
+    return LocalStorageBackend("uploads")
+
+
+class StorageService:
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self.mode = self.backend.mode
 
     def upload_file(self, file_obj, filename: str) -> str:
         """
         Uploads a file to storage. Returns the stored path/key.
         """
+        # Reset file pointer just in case
+        file_obj.seek(0)
         if self.mode == "s3":
             try:
-                # Reset file pointer just in case
-                file_obj.seek(0)
-                self.s3_client.upload_fileobj(file_obj, self.bucket_name, filename)
+                self.backend.put_fileobj(file_obj, filename)
                 return filename
             except ClientError as e:
                 logger.error(f"S3 Upload Error: {e}")
                 raise HTTPException(status_code=500, detail="Failed to upload file to storage")
+        elif self.mode == "local":
+            # Local fallback stores the filesystem path rather than the key
+            self.backend.put_fileobj(file_obj, filename)
+            return self.backend.path_for(filename)
         else:
-            # Local fallback
-            file_path = os.path.join(self.local_upload_dir, filename)
-            with open(file_path, "wb") as buffer:
-                file_obj.seek(0)
-                shutil.copyfileobj(file_obj, buffer)
-            return file_path
+            self.backend.put_fileobj(file_obj, filename)
+            return filename
 
     def download_file(self, file_path: str, destination_path: str):
         """
         Downloads a file from storage to a local destination.
         """
-        if self.mode == "s3":
-            try:
-                # file_path in DB is just the key for S3
-                self.s3_client.download_file(self.bucket_name, file_path, destination_path)
-            except ClientError as e:
-                logger.error(f"S3 Download Error: {e}")
-                if e.response['Error']['Code'] == "404":
-                    raise FileNotFoundError(f"File {file_path} not found in storage")
-                raise e
-        else:
+        if self.mode == "local":
             # Local fallback
             # If the stored path is relative or absolute, handle it
             # In local mode, file_path stored in DB is likely "uploads/filename.csv"
-            # But if we switched modes, we might have issues. 
+            # But if we switched modes, we might have issues.
             # Assuming file_path is what was returned by upload_file.
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"File {file_path} not found locally")
-            
+
             if file_path != destination_path:
                 shutil.copy2(file_path, destination_path)
+        else:
+            # file_path in DB is just the key for S3
+            try:
+                self.backend.get_file(file_path, destination_path)
+            except ClientError as e:
+                logger.error(f"S3 Download Error: {e}")
+                raise
+
+    def delete_file(self, file_path: str):
+        """
+        Deletes a file returned by upload_file. Missing files are ignored.
+        """
+        if self.mode == "local":
+            # Local mode stores the filesystem path, as with download_file
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        else:
+            self.backend.delete(file_path)
+
+    async def aupload_file(self, file_obj, filename: str) -> str:
+        return await run_blocking(self.upload_file, file_obj, filename)
+
+    async def adownload_file(self, file_path: str, destination_path: str):
+        await run_blocking(self.download_file, file_path, destination_path)
+
+    async def adelete_file(self, file_path: str):
+        await run_blocking(self.delete_file, file_path)
+
+
+async def astream(backend, key: str, chunk_size: int, start: int = 0,
+                  length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+    """
+    Stream an object (or `length` bytes of it from `start`) from a storage
+    backend without blocking the event loop. Each read runs on the bounded I/O pool.
+    """
+    if length == 0:
+        return
+    end = None if length is None else start + length - 1
+    stream = await run_blocking(backend.open_stream, key, start, end)
+    remaining = length
+    try:
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await run_blocking(stream.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_blocking(stream.close)
+
 
 storage = StorageService()
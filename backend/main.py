@@ -34,11 +34,24 @@ os.makedirs("uploads", exist_ok=True)
 # Mount uploads directory to serve static files (reports, etc.)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-from backend.core.database import init_db
+from backend.core.database import engine, init_db
+from agent.sandbox import sandbox_pool
+from agent.shared_frames import shared_frames
+from core.client import close_client
+from backend.core.profiling import profiling_service
 
 @app.on_event("startup")
 async def on_startup():
     await init_db()
+    await sandbox_pool.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await sandbox_pool.shutdown()
+    shared_frames.clear()
+    await profiling_service.shutdown()
+    await close_client()
+    await engine.dispose()
 
 app.include_router(api_router, prefix="/api")
 
@@ -1,30 +1,65 @@
-from typing import Optional, List
+import json
+from typing import Any, Dict, Optional, List
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 
+from data.dataframe import CSVFormat
+
 class Dataset(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str
     file_path: str
+    columnar_path: Optional[str] = None  # Arrow IPC copy written at ingest
+    checksum: Optional[str] = None  # SHA-256 of the uploaded CSV, computed while it streams to storage
+    columnar_checksum: Optional[str] = None
+    # CSV format detected at upload, so later loads parse exactly once
+    csv_encoding: Optional[str] = None
+    csv_delimiter: Optional[str] = None
+    csv_has_header: Optional[bool] = None
+    profile_summary: Optional[str] = None  # JSON from data.profile.profile_dataframe
+    # Cached ydata_profiling report (artifact keys) and the dataset checksum it was built from
+    profile_report_version: Optional[str] = None
+    profile_report_key: Optional[str] = None
+    profile_json_key: Optional[str] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     user_id: str = Field(index=True)
     
     conversations: List["Conversation"] = Relationship(back_populates="dataset")
 
+    def csv_format(self) -> Optional[CSVFormat]:
+        if not self.csv_encoding:
+            return None
+        return CSVFormat(
+            encoding=self.csv_encoding,
+            delimiter=self.csv_delimiter or ",",
+            has_header=self.csv_has_header if self.csv_has_header is not None else True,
+        )
+
+    def profile(self) -> Optional[Dict[str, Any]]:
+        return json.loads(self.profile_summary) if self.profile_summary else None
+
 class Conversation(SQLModel, table=True):
     id: Optional[str] = Field(default=None, primary_key=True) # UUID
     title: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     dataset_id: Optional[int] = Field(default=None, foreign_key="dataset.id")
     user_id: str = Field(index=True)
+    # Summary of turns that fell out of the replay window, and the last message it covers
+    history_summary: Optional[str] = None
+    history_summary_upto: Optional[int] = None
     
     dataset: Optional[Dataset] = Relationship(back_populates="conversations")
     messages: List["Message"] = Relationship(back_populates="conversation")
 
 class Message(SQLModel, table=True):
+    # History is read newest-first per conversation by (timestamp, id) keyset
+    __table_args__ = (Index("ix_message_conversation_timestamp_id", "conversation_id", "timestamp", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     role: str # user, assistant, tool
-    content: str
+    content: str  # markup shown in the chat; for replies with parts, their cached render
+    parts: Optional[str] = None  # JSON list of structured reply parts (agent.message_parts)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     conversation_id: str = Field(foreign_key="conversation.id")
     
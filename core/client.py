@@ -1,8 +1,95 @@
-from openai import AsyncOpenAI
+"""
+LLM Client - Application-lifetime AsyncOpenAI client.
+
+All agents share one client, and with it one HTTP connection pool, so chat
+turns reuse warm keep-alive connections to the LLM endpoint instead of paying
+for a new TLS handshake each time.
+
+Key features:
+- Configurable connection limits and keep-alive expiry (LLM_* settings)
+- Closed cleanly from the FastAPI shutdown hook (`close_client`)
+- Connection-reuse metrics from httpcore trace events (`client_stats`)
+"""
+
+import threading
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
 from core.config import settings
+from core.logger import logger
+
+
+class ConnectionStats:
+    """Counts requests against newly opened connections to derive reuse."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    async def on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connections": reused,
+            "reuse_ratio": reused / self.requests if self.requests else 0.0,
+        }
 
-def get_client():
+
+_client: Optional[AsyncOpenAI] = None
+_client_lock = threading.Lock()
+_stats = ConnectionStats()
+
+
+def _build_client() -> AsyncOpenAI:
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=10.0),
+        event_hooks={"request": [_stats.on_request]},
+    )
     return AsyncOpenAI(
         api_key=settings.API_KEY,
         base_url="https://openrouter.ai/api/v1",
+        http_client=http_client,
     )
+
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+                logger.info("Created shared LLM client")
+    return _client
+
+
+async def close_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
+        logger.info(f"Closed shared LLM client: {client_stats()}")
+
+
+def client_stats() -> Dict[str, float]:
+    return _stats.snapshot()
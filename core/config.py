@@ -7,14 +7,66 @@ class Settings(BaseSettings):
     MODEL_NAME: str = "mistralai/devstral-2512:free"
     MAX_STEPS: int = 6
     LOG_LEVEL: str = "INFO"
-    RATE_LIMIT_CALLS: int = 10
-    RATE_LIMIT_PERIOD: int = 60
+    RATE_LIMIT_CALLS: int = 10  # calls per period, per user and model
+    RATE_LIMIT_PERIOD: int = 60  # seconds
+    RATE_LIMIT_MAX_WAIT: float = 10.0  # seconds a call may wait for a token before failing
+
+    # Database (pool settings are ignored for SQLite)
+    DATABASE_URL: str = "postgresql+asyncpg://postgres:postgres@db:5432/chat_db"
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds; replace connections before server/proxy idle timeouts
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: Optional[int] = None  # asyncpg prepared statements per connection; 0 behind PgBouncer
+
+    # LLM HTTP client (shared by all agents)
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_TIMEOUT: float = 120.0
     
     # Storage
     AWS_ACCESS_KEY_ID: Optional[str] = None
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     AWS_BUCKET_NAME: Optional[str] = None
     AWS_ENDPOINT_URL: Optional[str] = None
+    STORAGE_BACKEND: Optional[str] = None  # "s3", "local" or "memory"; auto-detected if unset
+    STORAGE_IO_WORKERS: int = 16
+    ARTIFACT_UPLOAD_CONCURRENCY: int = 4  # concurrent artifact commits per chat turn
+    ARTIFACT_INLINE_WAIT_SECONDS: float = 2.0  # longer uploads finish while the next LLM call runs
+    # S3 only: downloads redirect to short-lived presigned URLs instead of streaming through the API
+    ARTIFACT_PRESIGNED_URLS: bool = False
+    ARTIFACT_PRESIGNED_TTL_SECONDS: int = 900
+
+    # Sandbox (0 workers runs code on a thread of the API process)
+    SANDBOX_WORKERS: int = 2
+    SANDBOX_MAX_JOBS_PER_WORKER: int = 50
+    SANDBOX_MAX_RSS_MB: int = 2048
+    SANDBOX_CPU_SECONDS: int = 120
+    SANDBOX_WALL_SECONDS: int = 300
+    SANDBOX_SPAWN_TIMEOUT_SECONDS: int = 120  # a worker not ready by then is killed and spawned again
+
+    # Profiling reports (0 workers builds reports on a thread of the API process)
+    PROFILING_WORKERS: int = 1
+    PROFILING_FULL_MAX_ROWS: int = 50_000  # minimal mode above this
+    PROFILING_SAMPLE_ROWS: int = 200_000  # rows sampled for larger datasets
+    PROFILING_WAIT_SECONDS: float = 30.0  # how long a chat turn waits for a running report
+
+    # Conversation history replayed to the LLM
+    HISTORY_MAX_TOKENS: int = 12000
+    HISTORY_SUMMARY_MAX_TOKENS: int = 1000
+    HISTORY_PAGE_SIZE: int = 50  # messages read per query, newest first
+    MESSAGE_FLUSH_INTERVAL_SECONDS: float = 5.0  # partial replies are written at most this often while streaming
+
+    # Caching
+    DATAFRAME_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2GB
+    SHARED_FRAMES_MAX_BYTES: int = 1024 * 1024 * 1024  # 1GB of published frames in /dev/shm
+    RESULT_CACHE_TTL_SECONDS: int = 3600
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64MB
+    DATASET_CACHE_DIR: Optional[str] = None  # local copies of stored datasets; <tmp>/dataset_cache if unset
+    DATASET_CACHE_MAX_BYTES: int = 4 * 1024 * 1024 * 1024  # 4GB
     
     class Config:
         env_file = ".env"
@@ -1,34 +1,118 @@
-import time
+"""
+Rate Limiter - Per-user, per-model token buckets for LLM calls.
+
+Each (user, model) pair gets a bucket of `calls` tokens that refills
+continuously at `calls / period` tokens per second, so one heavy user cannot
+starve everyone else and short bursts wait briefly instead of failing.
+
+Key features:
+- asyncio-native: waiting callers sleep instead of blocking a thread
+- Optional bounded wait (`max_wait`, or `timeout` per call) before giving up
+- Pluggable bucket store: in-memory by default; a shared store (e.g. Redis)
+  implementing `RateLimitBackend` lets several API replicas share one quota
+"""
+
+import asyncio
 import threading
-from typing import Dict, Optional
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple
+
 
 class RateLimitExceeded(Exception):
-    pass
+    def __init__(self, message: str = "Rate limit exceeded. Please try again later.",
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for token buckets.
+
+    `take` must be atomic per key: shared-store implementations should run it
+    as a single server-side operation (e.g. a Lua script) so replicas cannot
+    both spend the last token.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, capacity: float, refill_rate: float) -> float:
+        """Take one token if available and return 0, otherwise return seconds until one is."""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    # Full buckets carry no state, so they are pruned once the table grows past this
+    PRUNE_THRESHOLD = 10_000
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, capacity: float, refill_rate: float) -> float:
+        with self._lock:
+            now = self.clock()
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / refill_rate
+            if len(self._buckets) > self.PRUNE_THRESHOLD:
+                self._prune(now, capacity, refill_rate)
+            return wait
+
+    def _prune(self, now: float, capacity: float, refill_rate: float):
+        self._buckets = {
+            key: (tokens, updated_at)
+            for key, (tokens, updated_at) in self._buckets.items()
+            if tokens + (now - updated_at) * refill_rate < capacity
+        }
+
 
 class RateLimiter:
-    def __init__(self, calls: int, period: int):
+    def __init__(self, calls: int, period: int, max_wait: float = 0.0,
+                 backend: Optional[RateLimitBackend] = None):
         self.calls = calls
         self.period = period
-        self.tokens = calls
-        self.last_update = time.time()
-        self.lock = threading.Lock()
-
-    def _replace_tokens(self):
-        now = time.time()
-        elapsed = now - self.last_update
-        if elapsed > self.period:
-            self.tokens = self.calls
-            self.last_update = now
-
-    def acquire(self):
-        with self.lock:
-            self._replace_tokens()
-            if self.tokens > 0:
-                self.tokens -= 1
+        self.max_wait = max_wait
+        self.backend = backend or InMemoryRateLimitBackend()
+
+    @property
+    def refill_rate(self) -> float:
+        return self.calls / self.period
+
+    async def acquire(self, user_id: str = "anonymous", model: str = "default",
+                      timeout: Optional[float] = None):
+        """
+        Take a token from the (user, model) bucket.
+
+        Waits up to `timeout` seconds (default `max_wait`) for a token to
+        refill, and raises RateLimitExceeded if none would arrive in time.
+        """
+        key = f"{user_id}:{model}"
+        timeout = self.max_wait if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            wait = await self.backend.take(key, self.calls, self.refill_rate)
+            if wait <= 0:
                 return True
-            else:
-                raise RateLimitExceeded("Rate limit exceeded. Please try again later.")
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(
+                    f"Rate limit exceeded. Please try again in {wait:.0f} seconds.",
+                    retry_after=wait,
+                )
+            await asyncio.sleep(wait)
+
 
 # Global limiter instance
 from .config import settings
-limiter = RateLimiter(calls=settings.RATE_LIMIT_CALLS, period=settings.RATE_LIMIT_PERIOD)
+limiter = RateLimiter(
+    calls=settings.RATE_LIMIT_CALLS,
+    period=settings.RATE_LIMIT_PERIOD,
+    max_wait=settings.RATE_LIMIT_MAX_WAIT,
+)
@@ -1,6 +1,175 @@
+import codecs
+import csv
+import io
+from dataclasses import dataclass
+from typing import Optional
+
 import pandas as pd
+import pyarrow as pa
+
+# In order of preference. Single-byte encodings accept any byte sequence,
+# so the list effectively ends at the first of them.
+SUPPORTED_ENCODINGS = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+SNIFF_SAMPLE_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ",;\t|"
+
+
+@dataclass
+class CSVFormat:
+    encoding: str = "utf-8"
+    delimiter: str = ","
+    has_header: bool = True
+
+    def read_csv_kwargs(self) -> dict:
+        return {
+            "encoding": self.encoding,
+            "sep": self.delimiter,
+            "header": 0 if self.has_header else None,
+        }
+
+
+class CSVSniffer:
+    """
+    Incrementally detects the encoding, delimiter and header row of a CSV.
+
+    Every fed byte goes through an incremental decoder per candidate encoding,
+    which is far cheaper than a parse and catches invalid bytes anywhere in the
+    file. Delimiter and header detection only look at the leading sample.
+    """
+
+    def __init__(self, encodings=SUPPORTED_ENCODINGS, sample_size: int = SNIFF_SAMPLE_BYTES):
+        self.sample_size = sample_size
+        self.sample = bytearray()
+        self._decoders = {enc: codecs.getincrementaldecoder(enc)() for enc in encodings}
+        self._alive = list(encodings)
+        self._seen = 0
+
+    def feed(self, chunk: bytes):
+        self._seen += len(chunk)
+        if len(self.sample) < self.sample_size:
+            self.sample.extend(chunk[:self.sample_size - len(self.sample)])
+
+        # Once the preferred candidate can no longer fail there is nothing to check
+        if self._alive and _accepts_any_bytes(self._alive[0]):
+            return
+
+        for enc in list(self._alive):
+            try:
+                self._decoders[enc].decode(chunk)
+            except UnicodeDecodeError:
+                self._alive.remove(enc)
+
+    @property
+    def truncated(self) -> bool:
+        """True if the stream was longer than the retained sample."""
+        return self._seen > len(self.sample)
+
+    def result(self) -> CSVFormat:
+        for enc in list(self._alive):
+            try:
+                self._decoders[enc].decode(b"", final=True)
+            except UnicodeDecodeError:
+                self._alive.remove(enc)
+        if not self._alive:
+            raise UnicodeDecodeError("sniff", bytes(self.sample[:1]), 0, 1, "no supported encoding matched")
+
+        fmt = CSVFormat(encoding=self._alive[0])
+
+        text = bytes(self.sample).decode(fmt.encoding, errors="ignore")
+        if self.truncated and "\n" in text:
+            # Drop the trailing partial line so the sniffer sees whole rows
+            text = text[:text.rindex("\n")]
+
+        sniffer = csv.Sniffer()
+        try:
+            fmt.delimiter = sniffer.sniff(text, delimiters=SNIFF_DELIMITERS).delimiter
+        except csv.Error:
+            pass
+        try:
+            fmt.has_header = sniffer.has_header(text) or not _has_numeric_field(text, fmt.delimiter)
+        except csv.Error:
+            pass
+        return fmt
+
+
+def _has_numeric_field(text: str, delimiter: str) -> bool:
+    """
+    csv.Sniffer votes "no header" for text-only files, so that verdict is only
+    trusted when the first row holds a number, which column names rarely are.
+    """
+    first_row = next(csv.reader(text.splitlines()[:1], delimiter=delimiter), [])
+    for field in first_row:
+        try:
+            float(field)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def _accepts_any_bytes(encoding: str) -> bool:
+    return codecs.lookup(encoding).name in ("latin-1", "iso8859-1")
+
+
+def sniff_csv(path: str, chunk_size: int = 1024 * 1024) -> CSVFormat:
+    sniffer = CSVSniffer()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sniffer.feed(chunk)
+    return sniffer.result()
+
+
+def read_csv(path: str, fmt: Optional[CSVFormat] = None, **kwargs) -> pd.DataFrame:
+    """Parse a CSV exactly once, sniffing its format first if unknown."""
+    if fmt is None:
+        fmt = sniff_csv(path)
+    df = pd.read_csv(path, **fmt.read_csv_kwargs(), **kwargs)
+    return _name_columns(df, fmt)
+
+
+def read_preview(sample: bytes, fmt: CSVFormat, nrows: int = 5, truncated: bool = True) -> pd.DataFrame:
+    """
+    Parse the header and first rows from the leading bytes of a CSV.
+
+    If the sample was cut off, the trailing partial line is dropped first.
+    """
+    if truncated and b"\n" in sample:
+        sample = sample[:sample.rindex(b"\n") + 1]
+    df = pd.read_csv(io.BytesIO(sample), nrows=nrows, **fmt.read_csv_kwargs())
+    return _name_columns(df, fmt)
+
+
+def _name_columns(df: pd.DataFrame, fmt: CSVFormat) -> pd.DataFrame:
+    if not fmt.has_header:
+        df.columns = [f"column_{i + 1}" for i in range(len(df.columns))]
+    return df
 
 
 def load_csv(file):
     df = pd.read_csv(file)
     return df, df.columns.tolist()
+
+
+def write_columnar(df: pd.DataFrame, path: str):
+    """
+    Write a DataFrame as an uncompressed Arrow IPC file.
+
+    Uncompressed IPC files can be memory-mapped on load, so reading them back
+    costs little more than the page faults for the columns actually touched.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def load_columnar(path: str) -> pd.DataFrame:
+    """
+    Load an Arrow IPC file written by `write_columnar`, memory-mapped.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
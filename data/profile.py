@@ -0,0 +1,80 @@
+"""
+Dataset Profile - Compact per-column schema summary.
+
+Computed once per dataset in the background after upload and stored on the
+`Dataset` row, so the system prompt can describe dtypes, nulls, cardinality,
+ranges and sample values up front instead of the agent spending tool calls on
+`df.info()` / `df.describe()`.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+MAX_PROFILE_COLUMNS = 100
+SAMPLE_VALUES = 3
+MAX_VALUE_CHARS = 40
+
+
+def _short(value: Any) -> str:
+    text = str(value)
+    if len(text) > MAX_VALUE_CHARS:
+        text = text[:MAX_VALUE_CHARS] + "..."
+    return text
+
+
+def profile_dataframe(df: pd.DataFrame) -> Dict[str, Any]:
+    """Return a JSON-serializable profile: row count plus per-column stats."""
+    columns: List[Dict[str, Any]] = []
+    for name in df.columns[:MAX_PROFILE_COLUMNS]:
+        series = df[name]
+        non_null = series.dropna()
+        column: Dict[str, Any] = {
+            "name": str(name),
+            "dtype": str(series.dtype),
+            "nulls": int(len(series) - len(non_null)),
+        }
+        try:
+            column["unique"] = int(non_null.nunique())
+        except TypeError:  # unhashable cells, e.g. lists
+            pass
+
+        is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if len(non_null) and (is_numeric or pd.api.types.is_datetime64_any_dtype(series)):
+            column["min"] = _short(non_null.min())
+            column["max"] = _short(non_null.max())
+
+        samples = []
+        for value in non_null.head(100):
+            text = _short(value)
+            if text not in samples:
+                samples.append(text)
+            if len(samples) == SAMPLE_VALUES:
+                break
+        column["samples"] = samples
+        columns.append(column)
+
+    return {
+        "rows": int(len(df)),
+        "columns": columns,
+        "omitted_columns": max(len(df.columns) - MAX_PROFILE_COLUMNS, 0),
+    }
+
+
+def format_profile(profile: Optional[Dict[str, Any]]) -> str:
+    """Render a profile as compact prompt lines, one per column."""
+    if not profile:
+        return ""
+    lines = [f"  - Rows: {profile['rows']}"]
+    for column in profile["columns"]:
+        stats = [f"nulls={column['nulls']}"]
+        if "unique" in column:
+            stats.append(f"unique={column['unique']}")
+        if "min" in column:
+            stats.append(f"min={column['min']}, max={column['max']}")
+        if column["samples"]:
+            stats.append("e.g. " + " | ".join(column["samples"]))
+        lines.append(f"  - {column['name']} ({column['dtype']}): " + ", ".join(stats))
+    if profile.get("omitted_columns"):
+        lines.append(f"  - ... {profile['omitted_columns']} more columns not profiled")
+    return "\n".join(lines)
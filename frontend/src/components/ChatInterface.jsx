@@ -116,8 +116,10 @@ const ChatInterface = ({ sessionId, initialData }) => {
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [datasetInfo, setDatasetInfo] = useState(initialData || {}); // Fallback state
+  const [olderCursor, setOlderCursor] = useState(null); // next_cursor for earlier history pages
   const messagesEndRef = useRef(null);
   const isFetched = useRef(false);
+  const isPrepending = useRef(false);
 
   // Fetch history if initialData is missing (which happens when clicking sidebar)
   useEffect(() => {
@@ -130,8 +132,9 @@ const ChatInterface = ({ sessionId, initialData }) => {
                 
                 const data = await response.json();
                 
-                // Set messages
+                // Set messages (the newest page; older pages load on demand)
                 setMessages(data.messages);
+                setOlderCursor(data.next_cursor);
                 
                 // Set dataset info basic (we don't get full preview from this endpoint yet, but maybe title)
                 setDatasetInfo({
@@ -151,7 +154,28 @@ const ChatInterface = ({ sessionId, initialData }) => {
     // Actually using key={sessionId} in App.jsx handles mount reset.
   }, [sessionId, initialData]);
 
+  const loadOlderMessages = async () => {
+    try {
+        const API_URL = import.meta.env.VITE_API_URL || '/api';
+        const params = new URLSearchParams({ before: olderCursor });
+        const response = await fetch(`${API_URL}/conversations/${sessionId}?${params}`, { credentials: 'include' });
+        if (!response.ok) throw new Error("Failed to load earlier messages");
+
+        const data = await response.json();
+        isPrepending.current = true;
+        setMessages(prev => [...data.messages, ...prev]);
+        setOlderCursor(data.next_cursor);
+    } catch (e) {
+        console.error("Error loading earlier messages", e);
+    }
+  };
+
   const scrollToBottom = () => {
+    // Keep the reader's position when earlier history is prepended
+    if (isPrepending.current) {
+        isPrepending.current = false;
+        return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   };
 
@@ -272,6 +296,12 @@ const ChatInterface = ({ sessionId, initialData }) => {
                 </div>
             )}
 
+            {olderCursor && (
+                <button type="button" className="btn" onClick={loadOlderMessages} style={{alignSelf: 'center', marginBottom: '1rem'}}>
+                    Load earlier messages
+                </button>
+            )}
+
             {messages.map((msg, idx) => (
                 <div key={idx} className={`message ${msg.role}`}>
                     <div style={{display: 'flex', alignItems: 'flex-start'}}>
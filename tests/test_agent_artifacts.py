@@ -1,6 +1,6 @@
 
 import asyncio
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 import os
 import json
 import sys
@@ -40,8 +40,8 @@ async def test_agent_handle_json_artifact():
         
         agent.client.chat.completions.create = mock_create
         
-        # Mock run_code_capture
-        with patch("agent.service.run_code_capture") as mock_run:
+        # Mock the sandbox pool that runs the code
+        with patch("agent.service.sandbox_pool.run", new_callable=AsyncMock) as mock_run:
             # Create a dummy json file
             with open("/tmp/test_report.json", "w") as f:
                 json.dump({"summary": "This is a test summary"}, f)
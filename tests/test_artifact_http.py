@@ -0,0 +1,178 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api.endpoints import _parse_range, router
+from backend.core.artifacts import ArtifactService, artifact_service
+from backend.core.file_cache import DatasetFileCache
+from backend.core.session import session_manager
+from backend.core.storage import InMemoryStorageBackend, LocalStorageBackend, S3StorageBackend, StorageService
+
+KEY = "artifacts/conv1/abcd1234_report.html"
+BODY = bytes(range(256)) * 40
+
+
+class TestParseRange(unittest.TestCase):
+    def test_forms(self):
+        self.assertEqual(_parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(_parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(_parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(_parse_range("bytes=990-2000", 1000), (990, 999))
+
+    def test_ignored_and_unsatisfiable(self):
+        self.assertIsNone(_parse_range(None, 1000))
+        self.assertIsNone(_parse_range("bytes=0-1,5-9", 1000))
+        self.assertIsNone(_parse_range("bytes=a-b", 1000))
+        self.assertIsNone(_parse_range("items=0-1", 1000))
+        with self.assertRaises(ValueError):
+            _parse_range("bytes=1000-", 1000)
+        with self.assertRaises(ValueError):
+            _parse_range("bytes=5-2", 1000)
+
+
+class ArtifactEndpointMixin:
+    def setUp(self):
+        self._backend = artifact_service.backend
+        self._mode = artifact_service.mode
+        artifact_service.backend = self.make_backend()
+        artifact_service.mode = artifact_service.backend.mode
+        artifact_service._sizes.clear()
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        artifact_service.backend = self._backend
+        artifact_service.mode = self._mode
+        artifact_service._sizes.clear()
+
+    def test_full_response_has_etag_and_length(self):
+        response = self.client.get(f"/api/artifacts/{KEY}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, BODY)
+        self.assertEqual(response.headers["etag"], artifact_service.etag(KEY))
+        self.assertEqual(response.headers["content-length"], str(len(BODY)))
+
+    def test_if_none_match_returns_304(self):
+        etag = artifact_service.etag(KEY)
+        response = self.client.get(f"/api/artifacts/{KEY}", headers={"If-None-Match": f"W/{etag}"})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_range_request(self):
+        response = self.client.get(f"/api/artifacts/{KEY}", headers={"Range": "bytes=100-199"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, BODY[100:200])
+        self.assertEqual(response.headers["content-range"], f"bytes 100-199/{len(BODY)}")
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(f"/api/artifacts/{KEY}", headers={"Range": f"bytes={len(BODY)}-"})
+        self.assertEqual(response.status_code, 416)
+
+    def test_missing_artifact(self):
+        response = self.client.get("/api/artifacts/artifacts/conv1/missing.png")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestStreamedArtifactEndpoint(ArtifactEndpointMixin, unittest.TestCase):
+    def make_backend(self):
+        backend = InMemoryStorageBackend()
+        backend.objects[KEY] = BODY
+        return backend
+
+    def test_stale_if_range_sends_whole_object(self):
+        response = self.client.get(f"/api/artifacts/{KEY}",
+                                   headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.content), len(BODY))
+
+
+class TestLocalArtifactEndpoint(ArtifactEndpointMixin, unittest.TestCase):
+    def make_backend(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        backend = LocalStorageBackend(self.tmp.name)
+        path = backend.path_for(KEY)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(BODY)
+        return backend
+
+
+def _local_s3_backend():
+    # Signing is done locally, so a MinIO-style endpoint needs no server for these tests
+    with mock.patch.multiple("backend.core.storage.settings", AWS_ENDPOINT_URL="http://127.0.0.1:9000",
+                             AWS_ACCESS_KEY_ID="minio", AWS_SECRET_ACCESS_KEY="minio123"):
+        return S3StorageBackend("artifacts-bucket")
+
+
+class TestLegacyFileEndpoint(unittest.TestCase):
+    def test_cached_file_is_pinned_until_sent(self):
+        backend = InMemoryStorageBackend()
+        backend.objects["old_plot.png"] = BODY
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DatasetFileCache(tmp, 10_000, StorageService(backend))
+            with mock.patch("backend.core.file_cache.dataset_file_cache", cache), \
+                    mock.patch.object(artifact_service, "presign_ttl", None), \
+                    mock.patch.object(cache, "unpin", wraps=cache.unpin) as unpin:
+                response = TestClient(app).get("/api/files/old_plot.png")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, BODY)
+            unpin.assert_called_once_with("legacy_old_plot.png")
+            self.assertEqual(cache.stats()["pinned"], 0)
+
+
+class TestPresignedArtifacts(unittest.TestCase):
+    def test_presigned_urls_are_cached_until_near_expiry(self):
+        service = ArtifactService(_local_s3_backend(), presign_ttl=300)
+        url = service.get_presigned_url(KEY)
+        self.assertTrue(url.startswith("http://127.0.0.1:9000/artifacts-bucket/" + KEY))
+        self.assertIn("response-content-type=text%2Fhtml", url)
+        self.assertEqual(service.get_presigned_url(KEY), url)
+
+        with mock.patch("backend.core.artifacts.time.time", return_value=10**10):
+            self.assertNotEqual(service.get_presigned_url(KEY), url)
+
+    def test_backends_without_signing_never_presign(self):
+        service = ArtifactService(InMemoryStorageBackend(), presign_ttl=300)
+        self.assertIsNone(service.presign_ttl)
+        self.assertIsNone(service.get_presigned_url(KEY))
+
+    def test_endpoint_redirects_owner_only(self):
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        client = TestClient(app, follow_redirects=False)
+        service = ArtifactService(_local_s3_backend(), presign_ttl=300)
+
+        with mock.patch("backend.core.artifacts.artifact_service", service), \
+                mock.patch.object(session_manager, "owns_storage_key", mock.AsyncMock(return_value=True)):
+            response = client.get(f"/api/artifacts/{KEY}")
+        self.assertEqual(response.status_code, 307)
+        self.assertIn("Signature=", response.headers["location"])
+
+        with mock.patch("backend.core.artifacts.artifact_service", service), \
+                mock.patch.object(session_manager, "owns_storage_key", mock.AsyncMock(return_value=False)):
+            response = client.get(f"/api/artifacts/{KEY}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_endpoint_presigns_only_artifact_keys(self):
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        client = TestClient(app, follow_redirects=False)
+        service = ArtifactService(_local_s3_backend(), presign_ttl=300)
+
+        with mock.patch("backend.core.artifacts.artifact_service", service), \
+                mock.patch.object(session_manager, "owns_storage_key", mock.AsyncMock(return_value=True)):
+            for key in ("uploads/c1/data.csv", "data.csv"):
+                self.assertEqual(client.get(f"/api/artifacts/{key}").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from core import client as llm_client
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSharedClient(unittest.TestCase):
+    @mock.patch.object(llm_client.settings, "API_KEY", "test-key")
+    def test_get_client_is_shared_and_closable(self):
+        first = llm_client.get_client()
+        self.assertIs(first, llm_client.get_client())
+
+        asyncio.run(llm_client.close_client())
+        self.assertIsNot(first, llm_client.get_client())
+        asyncio.run(llm_client.close_client())
+
+    def test_stats_count_reused_connections(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        stats = llm_client.ConnectionStats()
+
+        async def fetch_three():
+            async with httpx.AsyncClient(event_hooks={"request": [stats.on_request]}) as http:
+                for _ in range(3):
+                    await http.get(f"http://127.0.0.1:{server.server_address[1]}/")
+
+        try:
+            asyncio.run(fetch_three())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot["requests"], 3)
+        self.assertEqual(snapshot["connections_opened"], 1)
+        self.assertEqual(snapshot["reused_connections"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
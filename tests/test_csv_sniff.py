@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from backend.core.ingest import TeeReader
+from data.dataframe import CSVFormat, CSVSniffer, read_csv, read_preview, sniff_csv
+
+
+class TestCSVSniffer(unittest.TestCase):
+    def sniff_bytes(self, data: bytes, chunk_size: int = 7):
+        sniffer = CSVSniffer(sample_size=64)
+        for i in range(0, len(data), chunk_size):
+            sniffer.feed(data[i:i + chunk_size])
+        return sniffer.result()
+
+    def test_utf8_with_multibyte_split_across_chunks(self):
+        data = "name,city\nJosé,Zürich\nAnna,Köln\n".encode("utf-8")
+        fmt = self.sniff_bytes(data, chunk_size=3)
+        self.assertEqual(fmt.encoding, "utf-8")
+        self.assertEqual(fmt.delimiter, ",")
+        self.assertTrue(fmt.has_header)
+
+    def test_latin1_bytes_past_the_sample(self):
+        rows = "".join(f"row{i},{i}\n" for i in range(50))
+        data = ("name,value\n" + rows + "Jos\xe9,1\n").encode("latin-1")
+        fmt = self.sniff_bytes(data)
+        self.assertEqual(fmt.encoding, "latin-1")
+
+    def test_semicolon_delimiter(self):
+        fmt = self.sniff_bytes(b"a;b;c\n1;2;3\n4;5;6\n")
+        self.assertEqual(fmt.delimiter, ";")
+
+    def test_headerless_numeric_file(self):
+        fmt = self.sniff_bytes(b"1,2.5,3\n4,5.5,6\n7,8.5,9\n", chunk_size=100)
+        self.assertFalse(fmt.has_header)
+
+    def test_text_only_file_keeps_header(self):
+        fmt = self.sniff_bytes(b"name,city\nalice,paris\nbob,rome\n", chunk_size=100)
+        self.assertTrue(fmt.has_header)
+
+    def test_read_csv_uses_sniffed_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.csv")
+            with open(path, "wb") as f:
+                f.write("city;temp\nK\xf6ln;12\nWien;9\n".encode("latin-1"))
+            fmt = sniff_csv(path)
+            df = read_csv(path, fmt)
+            self.assertEqual(df.columns.tolist(), ["city", "temp"])
+            self.assertEqual(df.loc[0, "city"], "K\xf6ln")
+
+
+class TrickleReader(io.RawIOBase):
+    """Returns at most `step` bytes per read, like a slow socket."""
+
+    def __init__(self, data: bytes, step: int):
+        self.stream = io.BytesIO(data)
+        self.step = step
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        size = self.step if size is None or size < 0 else min(size, self.step)
+        return self.stream.read(size)
+
+
+class TestTeeReader(unittest.TestCase):
+    DATA = b"".join(f"row{i},{i}\n".encode() for i in range(2000))
+
+    def test_sinks_receive_every_byte(self):
+        first, second = bytearray(), bytearray()
+        tee = TeeReader(io.BytesIO(self.DATA), sinks=[first.extend, second.extend])
+        out = io.BytesIO()
+        shutil.copyfileobj(tee, out, length=1000)
+        self.assertEqual(out.getvalue(), self.DATA)
+        self.assertEqual(bytes(first), self.DATA)
+        self.assertEqual(bytes(second), self.DATA)
+        self.assertEqual(tee.tell(), len(self.DATA))
+
+    def test_readinto_over_partial_reads(self):
+        seen = bytearray()
+        tee = TeeReader(TrickleReader(self.DATA, step=7), sinks=[seen.extend])
+        buffer = bytearray(4096)
+        out = bytearray()
+        while True:
+            n = tee.readinto(buffer)
+            if not n:
+                break
+            self.assertLessEqual(n, 7)
+            out.extend(buffer[:n])
+        self.assertEqual(bytes(out), self.DATA)
+        self.assertEqual(bytes(seen), self.DATA)
+
+    def test_only_rewind_at_start_is_allowed(self):
+        tee = TeeReader(io.BytesIO(self.DATA), sinks=[])
+        self.assertEqual(tee.seek(0), 0)
+        tee.read(10)
+        with self.assertRaises(io.UnsupportedOperation):
+            tee.seek(0)
+
+
+class TestReadPreview(unittest.TestCase):
+    FMT = CSVFormat(encoding="utf-8", delimiter=",", has_header=True)
+
+    def test_truncated_sample_drops_partial_last_row(self):
+        sample = b"name,score\nalice,1\nbob,2\ncar"
+        df = read_preview(sample, self.FMT, truncated=True)
+        self.assertEqual(df["name"].tolist(), ["alice", "bob"])
+
+    def test_first_row_longer_than_the_sample(self):
+        # The 64 KB sample ends inside the first data row, so only the header is complete
+        sample = (b"name,notes\nalice," + b"x" * (64 * 1024))[:64 * 1024]
+        df = read_preview(sample, self.FMT, truncated=True)
+        self.assertEqual(df.columns.tolist(), ["name", "notes"])
+        self.assertEqual(len(df), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from backend.core import database
+from backend.core.database import PoolStats, engine_options
+
+
+class TestEngineOptions(unittest.TestCase):
+    def test_sqlite_keeps_default_pool(self):
+        options = engine_options("sqlite+aiosqlite:///chat.db")
+        self.assertFalse(options["echo"])
+        self.assertNotIn("pool_size", options)
+
+    def test_postgres_pool_and_statement_cache(self):
+        with mock.patch.multiple(database.settings, DB_POOL_SIZE=25, DB_MAX_OVERFLOW=5,
+                                 DB_STATEMENT_CACHE_SIZE=0):
+            options = engine_options("postgresql+asyncpg://u:p@db:5432/chat_db")
+        self.assertEqual(options["pool_size"], 25)
+        self.assertEqual(options["max_overflow"], 5)
+        self.assertEqual(options["connect_args"], {"statement_cache_size": 0})
+        self.assertEqual(options["url"].query["prepared_statement_cache_size"], "0")
+
+    def test_statement_cache_left_alone_by_default(self):
+        options = engine_options("postgresql+asyncpg://u:p@db:5432/chat_db")
+        self.assertNotIn("connect_args", options)
+
+
+class TestPoolStats(unittest.TestCase):
+    def test_counts_checkouts_and_peak(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 't.db')}")
+            stats = PoolStats(engine)
+
+            async def scenario():
+                async with engine.connect() as a, engine.connect() as b:
+                    await a.execute(text("select 1"))
+                    await b.execute(text("select 1"))
+                    during = stats.snapshot()
+                await engine.dispose()
+                return during
+
+            during = asyncio.run(scenario())
+
+        self.assertEqual(during["checked_out"], 2)
+        self.assertEqual(during["peak_checked_out"], 2)
+        self.assertEqual(stats.snapshot()["checked_out"], 0)
+        self.assertEqual(stats.checkouts, 2)
+        self.assertIn("utilization", during)
+
+
+class TestAddMissingColumns(unittest.TestCase):
+    def test_server_defaults_backfill_existing_rows(self):
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY)'))
+            conn.execute(text("INSERT INTO item (id) VALUES (1)"))
+
+        metadata = MetaData()
+        Table("item", metadata,
+              Column("id", Integer, primary_key=True),
+              Column("note", String, nullable=True),
+              Column("status", String, nullable=False, server_default="new"))
+        with engine.begin() as conn:
+            database._add_missing_columns(conn, metadata)
+            row = conn.execute(text("SELECT note, status FROM item")).one()
+            conn.execute(text("INSERT INTO item (id) VALUES (2)"))
+            inserted = conn.execute(text("SELECT status FROM item WHERE id = 2")).scalar_one()
+
+        self.assertEqual(tuple(row), (None, "new"))
+        self.assertEqual(inserted, "new")
+
+
+if __name__ == "__main__":
+    unittest.main()
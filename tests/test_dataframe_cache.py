@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from backend.core.dataframe_cache import DataFrameCache, file_checksum, frame_nbytes
+
+
+class TestDataFrameCache(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+
+    def test_hit_and_miss_counters(self):
+        cache = DataFrameCache(max_bytes=10 * 1024 * 1024)
+        self.assertIsNone(cache.get(1, "abc"))
+        cache.put(1, "abc", self.df)
+        self.assertIsNotNone(cache.get(1, "abc"))
+        self.assertIsNone(cache.get(1, "other"))
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_lru_eviction_respects_budget(self):
+        size = frame_nbytes(self.df)
+        cache = DataFrameCache(max_bytes=size * 2)
+        cache.put(1, "a", self.df)
+        cache.put(2, "b", self.df)
+        cache.get(1, "a")  # 1 is now most recently used
+        cache.put(3, "c", self.df)
+
+        self.assertIsNotNone(cache.get(1, "a"))
+        self.assertIsNone(cache.get(2, "b"))
+        self.assertLessEqual(cache.stats()["bytes"], size * 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_new_checksum_replaces_old_version(self):
+        cache = DataFrameCache(max_bytes=10 * 1024 * 1024)
+        cache.put(1, "v1", self.df)
+        cache.put(1, "v2", self.df)
+        self.assertIsNone(cache.get(1, "v1"))
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_mutating_handoff_does_not_corrupt_cache(self):
+        cache = DataFrameCache(max_bytes=10 * 1024 * 1024)
+        view = cache.put(1, "abc", self.df)
+        view.loc[0, "a"] = 100
+        view["c"] = 1
+
+        cached = cache.get(1, "abc")
+        self.assertEqual(cached.loc[0, "a"], 1)
+        self.assertNotIn("c", cached.columns)
+
+    def test_file_checksum_changes_with_content(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.csv")
+            with open(path, "w") as f:
+                f.write("a,b\n1,2\n")
+            first = file_checksum(path)
+            self.assertEqual(first, file_checksum(path))
+
+            with open(path, "w") as f:
+                f.write("a,b\n1,2\n3,4\n")
+            self.assertNotEqual(first, file_checksum(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
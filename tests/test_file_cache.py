@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+
+from backend.core.file_cache import ChecksumMismatch, DatasetFileCache
+from backend.core.storage import InMemoryStorageBackend, StorageService
+
+
+class CountingBackend(InMemoryStorageBackend):
+    def __init__(self):
+        super().__init__()
+        self.downloads = 0
+
+    def get_file(self, key, destination_path):
+        self.downloads += 1
+        super().get_file(key, destination_path)
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestDatasetFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "cache")
+        self.backend = CountingBackend()
+        self.backend.objects["a.csv"] = b"a\n" * 100
+        self.backend.objects["b.csv"] = b"b\n" * 100
+
+    def make_cache(self, max_bytes=10_000):
+        return DatasetFileCache(self.root, max_bytes, StorageService(self.backend))
+
+    def test_concurrent_fetches_download_once(self):
+        cache = self.make_cache()
+
+        async def fetch_many():
+            return await asyncio.gather(*(cache.fetch("a.csv", "dataset_1.csv", sha(b"a\n" * 100)) for _ in range(5)))
+
+        paths = asyncio.run(fetch_many())
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(self.backend.downloads, 1)
+        self.assertEqual(cache.stats()["hits"], 4)
+        with open(paths[0], "rb") as f:
+            self.assertEqual(f.read(), b"a\n" * 100)
+
+    def test_checksum_mismatch_is_not_cached(self):
+        cache = self.make_cache()
+        with self.assertRaises(ChecksumMismatch):
+            asyncio.run(cache.fetch("a.csv", "dataset_1.csv", sha(b"something else")))
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertEqual(cache.stats()["checksum_failures"], 1)
+
+    def test_lru_eviction_above_budget(self):
+        cache = self.make_cache(max_bytes=300)
+
+        async def scenario():
+            await cache.fetch("a.csv", "dataset_1.csv")
+            await cache.fetch("b.csv", "dataset_2.csv")
+
+        asyncio.run(scenario())
+        self.assertEqual(sorted(os.listdir(self.root)), ["dataset_2.csv"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], 300)
+
+    def test_pinned_file_is_not_evicted_until_unpinned(self):
+        cache = self.make_cache(max_bytes=300)
+
+        async def scenario():
+            await cache.fetch("a.csv", "dataset_1.csv", pin=True)
+            await cache.fetch("b.csv", "dataset_2.csv")
+
+        asyncio.run(scenario())
+        self.assertEqual(sorted(os.listdir(self.root)), ["dataset_1.csv", "dataset_2.csv"])
+        self.assertEqual(cache.stats()["pinned"], 1)
+
+        cache.unpin("dataset_1.csv")
+        self.assertEqual(os.listdir(self.root), ["dataset_2.csv"])
+        self.assertEqual(cache.stats()["pinned"], 0)
+        self.assertLessEqual(cache.stats()["bytes"], 300)
+
+    def test_restart_adopts_files_and_drops_partials(self):
+        os.makedirs(self.root)
+        with open(os.path.join(self.root, "dataset_1.csv"), "wb") as f:
+            f.write(b"corrupt")
+        with open(os.path.join(self.root, "dataset_2.csv.1234abcd.part"), "wb") as f:
+            f.write(b"half")
+
+        cache = self.make_cache()
+        self.assertEqual(os.listdir(self.root), ["dataset_1.csv"])
+
+        # The adopted file fails verification and is downloaded again
+        path = asyncio.run(cache.fetch("a.csv", "dataset_1.csv", sha(b"a\n" * 100)))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"a\n" * 100)
+        self.assertEqual(self.backend.downloads, 1)
+
+    def test_missing_source_raises_and_leaves_nothing(self):
+        cache = self.make_cache()
+        with self.assertRaises(FileNotFoundError):
+            asyncio.run(cache.fetch("missing.csv", "dataset_3.csv"))
+        self.assertEqual(os.listdir(self.root), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from types import SimpleNamespace
+
+from agent.history import DigestCache, HistoryManager, SUMMARY_HEADER, count_tokens
+
+
+def make_messages(n, size=400):
+    roles = ["user", "assistant"]
+    return [SimpleNamespace(id=i + 1, role=roles[i % 2], content=f"message {i} " + "x" * size)
+            for i in range(n)]
+
+
+class TestHistoryManager(unittest.TestCase):
+    def test_short_history_replayed_whole(self):
+        manager = HistoryManager(max_tokens=10000, summary_max_tokens=500)
+        window = manager.build(make_messages(4))
+        self.assertEqual(len(window.messages), 4)
+        self.assertIsNone(window.summary)
+
+    def test_long_history_windowed_within_budget(self):
+        manager = HistoryManager(max_tokens=1500, summary_max_tokens=300)
+        messages = make_messages(40)
+        window = manager.build(messages, system_prompt="prompt")
+
+        self.assertLess(len(window.messages), 40)
+        self.assertEqual(window.messages[0]["role"], "user")
+        self.assertEqual(window.messages[-1]["content"], messages[-1].content)
+        replayed = sum(count_tokens(m["content"]) for m in window.messages)
+        self.assertLessEqual(replayed + count_tokens(window.summary), 1500)
+
+        self.assertTrue(window.summary.startswith(SUMMARY_HEADER))
+        self.assertEqual(window.summary_upto_id, 40 - len(window.messages))
+
+    def test_summary_drops_tool_markup(self):
+        manager = HistoryManager(max_tokens=200, summary_max_tokens=200)
+        messages = [
+            SimpleNamespace(id=1, role="user", content="plot sales"),
+            SimpleNamespace(id=2, role="assistant",
+                            content="<details><summary>Code</summary>huge output</details>Sales rose in May."),
+            SimpleNamespace(id=3, role="user", content="y" * 2000),
+        ]
+        window = manager.build(messages)
+        self.assertIn("Sales rose in May.", window.summary)
+        self.assertNotIn("huge output", window.summary)
+
+    def test_cached_summary_is_extended_not_recomputed(self):
+        manager = HistoryManager(max_tokens=1500, summary_max_tokens=1000)
+        messages = make_messages(40)
+        first = manager.build(messages[:30])
+        last_summarized = f"message {first.summary_upto_id - 1} "
+        cached = first.summary.replace(last_summarized, "CACHED ")
+        second = manager.build(messages, cached_summary=cached, cached_upto_id=first.summary_upto_id)
+
+        self.assertIn("CACHED", second.summary)
+        self.assertGreater(second.summary_upto_id, first.summary_upto_id)
+
+    def test_complete_tail_builds_same_window(self):
+        manager = HistoryManager(max_tokens=1500, summary_max_tokens=60)
+        messages = make_messages(200, size=100)
+        cached = manager.build(messages[:150])
+        for cached_summary, cached_upto in [(None, None), (cached.summary, cached.summary_upto_id)]:
+            full = manager.build(messages, cached_summary=cached_summary, cached_upto_id=cached_upto)
+            for n in range(1, len(messages) + 1):
+                tail = messages[-n:]
+                if manager.is_complete(tail, cached_upto_id=cached_upto):
+                    self.assertLess(n, len(messages))
+                    self.assertEqual(manager.build(tail, cached_summary=cached_summary, cached_upto_id=cached_upto), full)
+                    break
+            else:
+                self.fail("no tail was complete")
+
+    def test_tail_within_budget_is_not_complete(self):
+        manager = HistoryManager(max_tokens=10000, summary_max_tokens=500)
+        self.assertFalse(manager.is_complete(make_messages(10)[-4:]))
+
+
+class TestDigestCache(unittest.TestCase):
+    def test_keeps_digests_not_texts(self):
+        calls = []
+        cache = DigestCache(lambda text: calls.append(text) or len(text), max_entries=2)
+        big = "x" * 100_000
+        self.assertEqual(cache(big), 100_000)
+        self.assertEqual(cache("x" * 100_000), 100_000)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(len(key) == 16 for key in cache._entries))
+
+        cache("a")
+        cache("b")
+        self.assertEqual(len(cache._entries), 2)
+        cache(big)
+        self.assertEqual(len(calls), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
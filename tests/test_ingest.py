@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend.core.ingest import COLUMNAR_EXT, ingest_dataset
+from backend.core.storage import InMemoryStorageBackend, StorageService
+from backend.models import Dataset
+from data.dataframe import load_columnar, read_csv, sniff_csv, write_columnar
+
+CSV = (
+    "name,score,ratio,active,joined\n"
+    "alice,10,0.5,True,2024-01-01\n"
+    "bob,,1.25,False,\n"
+    ",30,,True,2024-03-01\n"
+)
+
+
+class TestColumnarRoundtrip(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.csv_path = os.path.join(self.tmp.name, "data.csv")
+        with open(self.csv_path, "w") as f:
+            f.write(CSV)
+
+    def test_dtypes_nulls_and_index_survive(self):
+        df = read_csv(self.csv_path, sniff_csv(self.csv_path))
+        arrow_path = os.path.join(self.tmp.name, f"data.{COLUMNAR_EXT}")
+        write_columnar(df, arrow_path)
+        loaded = load_columnar(arrow_path)
+
+        pd.testing.assert_frame_equal(loaded, df)
+        self.assertEqual(loaded.dtypes.to_dict(), df.dtypes.to_dict())
+        self.assertEqual(loaded.isna().sum().to_dict(), {"name": 1, "score": 1, "ratio": 1, "active": 0, "joined": 1})
+        self.assertIsInstance(loaded.index, pd.RangeIndex)
+
+    def test_non_default_index_is_not_stored(self):
+        df = pd.DataFrame({"a": [1, 2, 3]}, index=[10, 20, 30])
+        arrow_path = os.path.join(self.tmp.name, f"indexed.{COLUMNAR_EXT}")
+        write_columnar(df, arrow_path)
+        loaded = load_columnar(arrow_path)
+        self.assertEqual(loaded.index.tolist(), [0, 1, 2])
+        self.assertEqual(loaded["a"].tolist(), [1, 2, 3])
+
+
+class TestIngestDataset(unittest.TestCase):
+    def test_records_columnar_copy_and_removes_local_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 't.db')}")
+            backend = InMemoryStorageBackend()
+            local_path = os.path.join(tmp, "upload.csv")
+            with open(local_path, "w") as f:
+                f.write(CSV)
+            fmt = sniff_csv(local_path)
+
+            async def get_session():
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    yield session
+
+            async def scenario():
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    dataset = Dataset(filename="data.csv", file_path="abc.csv", user_id="u1")
+                    session.add(dataset)
+                    await session.commit()
+                await ingest_dataset(dataset.id, local_path, "abc.csv", fmt)
+                async with AsyncSession(engine) as session:
+                    stored = await session.get(Dataset, dataset.id)
+                await engine.dispose()
+                return stored
+
+            with mock.patch("backend.core.ingest.get_session", get_session), \
+                    mock.patch("backend.core.ingest.storage", StorageService(backend)):
+                stored = asyncio.run(scenario())
+
+            self.assertFalse(os.path.exists(local_path))
+
+        self.assertEqual(stored.columnar_path, f"abc.{COLUMNAR_EXT}")
+        self.assertEqual(stored.columnar_checksum,
+                         hashlib.sha256(backend.objects[stored.columnar_path]).hexdigest())
+        self.assertIn("score", stored.profile_summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
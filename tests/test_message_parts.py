@@ -0,0 +1,89 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+from agent.history import HistoryManager, count_tokens
+from agent.message_parts import INTERRUPTED_TOOL_RESULT, ReplyParts, render_parts, replay_messages
+
+CODE = "print(df.score.sum())"
+EVENTS = [
+    {"type": "delta", "content": "Let me "},
+    {"type": "delta", "content": "check."},
+    {"type": "status", "content": "Running"},
+    {"type": "tool_code", "content": CODE, "tool_call_id": "call_1", "name": "run_code_capture",
+     "arguments": json.dumps({"code": CODE})},
+    {"type": "artifact", "content": "<img>", "key": "artifacts/c1/ab12_plot.png", "filename": "plot.png"},
+    {"type": "tool_output", "content": "19900\n[Generated File: plot.png]", "tool_call_id": "call_1"},
+    {"type": "delta", "content": "The total is 19900."},
+]
+
+
+def build(events):
+    reply = ReplyParts()
+    for event in events:
+        reply.add(event)
+    return reply.parts
+
+
+class TestReplyParts(unittest.TestCase):
+    def test_events_become_parts(self):
+        parts = build(EVENTS)
+        self.assertEqual([p["type"] for p in parts], ["text", "tool_call", "artifact", "tool_result", "text"])
+        self.assertEqual(parts[0]["content"], "Let me check.")
+        self.assertEqual(parts[2]["key"], "artifacts/c1/ab12_plot.png")
+
+    def test_render_matches_streamed_markup(self):
+        rendered = render_parts(build(EVENTS))
+        self.assertTrue(rendered.startswith("Let me check.\n<details><summary>Executing Code</summary>"))
+        self.assertIn(f"```python\n{CODE}\n```", rendered)
+        self.assertIn("![Generated Plot](/api/artifacts/artifacts/c1/ab12_plot.png)", rendered)
+        self.assertTrue(rendered.endswith("</details>\nThe total is 19900."))
+
+    def test_replay_is_structured_and_compact(self):
+        messages = replay_messages(build(EVENTS))
+        self.assertEqual(messages, [
+            {"role": "assistant", "content": "Let me check.", "tool_calls": [
+                {"id": "call_1", "type": "function",
+                 "function": {"name": "run_code_capture", "arguments": json.dumps({"code": CODE})}}]},
+            {"role": "tool", "tool_call_id": "call_1", "name": "run_code_capture",
+             "content": "19900\n[Generated File: plot.png]"},
+            {"role": "assistant", "content": "The total is 19900."},
+        ])
+        self.assertNotIn("<details>", json.dumps(messages))
+
+    def test_interrupted_call_is_answered_and_repeated_results_merged(self):
+        parts = build([
+            EVENTS[3],
+            {"type": "tool_output", "content": "Error: boom", "tool_call_id": "call_1"},
+            {"type": "tool_output", "content": "", "tool_call_id": "call_1"},
+            {"type": "tool_code", "content": "generate_profile_report()", "tool_call_id": "call_2",
+             "name": "generate_profile_report", "arguments": "{}"},
+        ])
+        messages = replay_messages(parts)
+        self.assertEqual([m["role"] for m in messages], ["assistant", "tool", "assistant", "tool"])
+        self.assertEqual(messages[1]["content"], "Error: boom\n")
+        self.assertEqual(messages[3]["content"], INTERRUPTED_TOOL_RESULT)
+        self.assertIn("generate_profile_report()", render_parts(parts))
+
+
+class TestPartsReplayInHistory(unittest.TestCase):
+    def test_rows_with_parts_replay_without_markup(self):
+        parts = build(EVENTS)
+        messages = [
+            SimpleNamespace(id=1, role="user", content="sum the scores?"),
+            SimpleNamespace(id=2, role="assistant", content=render_parts(parts), parts=json.dumps(parts)),
+        ]
+        window = HistoryManager(max_tokens=5000, summary_max_tokens=500).build(messages)
+        self.assertEqual([m["role"] for m in window.messages], ["user", "assistant", "tool", "assistant"])
+        replayed = sum(count_tokens(m.get("content") or "") for m in window.messages)
+        self.assertLess(replayed, count_tokens(messages[0].content) + count_tokens(messages[1].content))
+
+        # Replayed messages are the caller's own; changing them does not leak into later replays
+        window.messages[1]["tool_calls"][0]["function"]["arguments"] = "{}"
+        window.messages[1]["tool_calls"].append({"id": "bogus"})
+        again = HistoryManager(max_tokens=5000, summary_max_tokens=500).build(messages)
+        self.assertEqual(again.messages[1]["tool_calls"], replay_messages(parts)[0]["tool_calls"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from agent.models import ToolResult
+from agent.result_cache import CachedResult, ResultCache
+from backend.core.artifacts import ArtifactService
+from backend.core.message_writer import MessageWriter
+from backend.core.session import SessionManager, decode_cursor, encode_cursor, message_page
+from backend.core.storage import InMemoryStorageBackend
+from backend.models import Conversation, Dataset, Message
+
+
+class TestMessagePagination(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 't.db')}")
+
+    def run_with_session(self, scenario):
+        async def main():
+            async with self.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            async with AsyncSession(self.engine, expire_on_commit=False) as session:
+                session.add(Conversation(id="c1", title="t", user_id="u1"))
+                session.add(Conversation(id="c2", title="t", user_id="u1"))
+                base = datetime(2024, 1, 1)
+                # Pairs of messages share a timestamp, so the id breaks ties
+                for i in range(25):
+                    session.add(Message(role="user", content=f"m{i}", conversation_id="c1",
+                                        timestamp=base + timedelta(seconds=i // 2)))
+                session.add(Message(role="user", content="other", conversation_id="c2", timestamp=base))
+                await session.commit()
+                result = await scenario(session)
+            await self.engine.dispose()
+            return result
+
+        return asyncio.run(main())
+
+    def test_pages_walk_back_without_gaps_or_duplicates(self):
+        async def scenario(session):
+            pages = []
+            page, has_more = await message_page(session, "c1", 10)
+            pages.append(page)
+            while has_more:
+                page, has_more = await message_page(session, "c1", 10,
+                                                    before=decode_cursor(encode_cursor(page[0])))
+                pages.append(page)
+            return pages
+
+        pages = self.run_with_session(scenario)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        contents = [m.content for page in reversed(pages) for m in page]
+        self.assertEqual(contents, [f"m{i}" for i in range(25)])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+
+class TestConversationDeletion(unittest.TestCase):
+    def test_set_based_delete_by_conversation_dataset_and_user(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 't.db')}")
+            backend = InMemoryStorageBackend()
+
+            async def get_session():
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    yield session
+
+            async def counts():
+                async for session in get_session():
+                    conversations = (await session.exec(select(Conversation.id))).all()
+                    messages = (await session.exec(select(Message.conversation_id))).all()
+                    return sorted(conversations), len(messages)
+
+            async def scenario():
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                async for session in get_session():
+                    for cid, dataset_id, user in [("a", 1, "u1"), ("b", 2, "u1"), ("c", 2, "u1"), ("d", 2, "u2")]:
+                        session.add(Conversation(id=cid, title="t", user_id=user, dataset_id=dataset_id))
+                        for i in range(3):
+                            session.add(Message(role="user", content=str(i), conversation_id=cid))
+                        backend.objects[f"artifacts/{cid}/x_plot.png"] = b"png"
+                    await session.commit()
+
+                manager = SessionManager()
+                steps = [await manager.delete_conversations("u1", conversation_id="a"), await counts()]
+                steps += [await manager.delete_conversations("u1", dataset_id=2), await counts()]
+                steps += [await manager.delete_conversations("u2"), await counts()]
+                await engine.dispose()
+                return steps
+
+            cache = ResultCache(ttl_seconds=60, max_bytes=10_000)
+            cache.put("cached-run", CachedResult(
+                result=ToolResult(stdout="", locals={}, artifacts=["artifacts/a/x_plot.png"]), scope="a"))
+            with mock.patch("backend.core.session.get_session", get_session), \
+                    mock.patch("backend.core.session.artifact_service", ArtifactService(backend)), \
+                    mock.patch("backend.core.session.result_cache", cache):
+                steps = asyncio.run(scenario())
+
+        self.assertEqual(steps, [1, (["b", "c", "d"], 9), 2, (["d"], 3), 1, ([], 0)])
+        self.assertEqual(backend.objects, {})
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class TestStorageKeyOwnership(unittest.TestCase):
+    def test_only_recorded_owners_may_download(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 't.db')}")
+
+            async def get_session():
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    yield session
+
+            async def scenario():
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                async for session in get_session():
+                    session.add(Dataset(filename="a.csv", file_path="mine.csv", user_id="u1"))
+                    session.add(Dataset(filename="b.csv", file_path="theirs.csv", columnar_path="theirs.arrow",
+                                        user_id="u2"))
+                    await session.commit()
+
+                manager = SessionManager()
+                owns = [await manager.owns_storage_key(key, "u1") for key in
+                        ("mine.csv", "theirs.csv", "theirs.arrow", "unknown.csv", "artifacts/datasets/x/report.html")]
+                legacy = await manager.owns_storage_key("unknown.csv", "u1", allow_unowned=True)
+                await engine.dispose()
+                return owns, legacy
+
+            with mock.patch("backend.core.session.get_session", get_session):
+                owns, legacy = asyncio.run(scenario())
+
+        self.assertEqual(owns, [True, False, False, False, False])
+        self.assertTrue(legacy)
+
+
+class TestMessageWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 't.db')}")
+
+        async def get_session():
+            async with AsyncSession(self.engine, expire_on_commit=False) as session:
+                yield session
+
+        self.get_session = get_session
+        patcher = mock.patch("backend.core.message_writer.get_session", get_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_scenario(self, scenario):
+        async def main():
+            async with self.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            async with AsyncSession(self.engine) as session:
+                session.add(Conversation(id="c1", title="t", user_id="u1"))
+                await session.commit()
+            await scenario()
+            async with AsyncSession(self.engine) as session:
+                rows = (await session.exec(select(Message.role, Message.content).order_by(Message.id))).all()
+            await self.engine.dispose()
+            return [tuple(r) for r in rows]
+
+        return asyncio.run(main())
+
+    def test_turn_is_written_once_at_close(self):
+        writer = MessageWriter("c1", flush_interval=60)
+
+        async def scenario():
+            writer.add("user", "hi")
+            for chunk in ["Hel", "lo", "", "!"]:
+                await writer.append({"type": "delta", "content": chunk})
+            await writer.append({"type": "status", "content": "not stored"})
+            await writer.close()
+
+        rows = self.run_scenario(scenario)
+        self.assertEqual(rows, [("user", "hi"), ("assistant", "Hello!")])
+        self.assertEqual(writer.flushes, 1)
+
+    def test_periodic_flushes_update_the_same_reply(self):
+        writer = MessageWriter("c1", flush_interval=0)
+
+        async def scenario():
+            writer.add("user", "hi")
+            await writer.append({"type": "delta", "content": "a"})
+            await writer.append({"type": "delta", "content": "b"})
+            await writer.close()  # nothing new to write
+
+        rows = self.run_scenario(scenario)
+        self.assertEqual(rows, [("user", "hi"), ("assistant", "ab")])
+        self.assertEqual(writer.flushes, 2)
+
+    def test_partial_reply_survives_cancelled_stream(self):
+        writer = MessageWriter("c1", flush_interval=60)
+        streaming = asyncio.Event()
+
+        async def stream():
+            try:
+                writer.add("user", "hi")
+                await writer.append({"type": "delta", "content": "partial"})
+                streaming.set()
+                await asyncio.sleep(60)
+                await writer.append({"type": "delta", "content": " never"})
+            finally:
+                await writer.close()
+
+        async def scenario():
+            task = asyncio.ensure_future(stream())
+            await streaming.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        rows = self.run_scenario(scenario)
+        self.assertEqual(rows, [("user", "hi"), ("assistant", "partial")])
+
+    def test_failed_periodic_flush_does_not_end_the_stream(self):
+        writer = MessageWriter("c1", flush_interval=0)
+        calls = []
+
+        async def flaky_session():
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("db blip")
+            async for session in self.get_session():
+                yield session
+
+        async def scenario():
+            writer.add("user", "hi")
+            with mock.patch("backend.core.message_writer.get_session", flaky_session):
+                for chunk in ["a", "b", "c"]:
+                    await writer.append({"type": "delta", "content": chunk})
+                await writer.close()
+
+        rows = self.run_scenario(scenario)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(rows, [("user", "hi"), ("assistant", "abc")])
+
+    def test_deleted_conversation_is_not_written(self):
+        writer = MessageWriter("c1", flush_interval=0)
+
+        async def scenario():
+            writer.add("user", "hi")
+            await writer.flush()
+            async with AsyncSession(self.engine) as session:
+                await session.exec(delete(Message))
+                await session.exec(delete(Conversation))
+                await session.commit()
+            await writer.append({"type": "delta", "content": "orphan"})
+            await writer.close()
+
+        self.assertEqual(self.run_scenario(scenario), [])
+        self.assertEqual(writer.flushes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
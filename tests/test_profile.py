@@ -0,0 +1,44 @@
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from agent.prompts import format_system_prompt
+from data.profile import format_profile, profile_dataframe
+
+
+class TestDatasetProfile(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "price": [1.5, np.nan, 3.0, 2.0],
+            "city": ["Cairo", "Giza", "Cairo", None],
+            "when": pd.to_datetime(["2024-01-01", "2024-02-01", "2024-03-01", "2024-04-01"]),
+        })
+
+    def test_profile_stats(self):
+        profile = profile_dataframe(self.df)
+        json.dumps(profile)  # stored as JSON on the dataset row
+        price, city, when = profile["columns"]
+
+        self.assertEqual(profile["rows"], 4)
+        self.assertEqual(price["nulls"], 1)
+        self.assertEqual((price["min"], price["max"]), ("1.5", "3.0"))
+        self.assertEqual(city["unique"], 2)
+        self.assertEqual(city["samples"], ["Cairo", "Giza"])
+        self.assertNotIn("min", city)
+        self.assertTrue(when["min"].startswith("2024-01-01"))
+
+    def test_prompt_includes_profile(self):
+        prompt = format_system_prompt(list(self.df.columns), profile=profile_dataframe(self.df))
+        self.assertIn("Rows: 4", prompt)
+        self.assertIn("city (object): nulls=1, unique=2", prompt)
+        self.assertIn("{output_dir}", prompt)
+
+    def test_prompt_without_profile(self):
+        self.assertEqual(format_profile(None), "")
+        self.assertNotIn("Dataset profile", format_system_prompt(["a"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from backend.core import profiling
+from backend.core.artifacts import artifact_service
+from backend.core.storage import InMemoryStorageBackend
+
+
+def fake_build(source_path, csv_format, title, out_dir, full_max_rows, sample_rows):
+    time.sleep(0.2)
+    html_path, json_path = os.path.join(out_dir, "report.html"), os.path.join(out_dir, "report.json")
+    with open(html_path, "w") as f:
+        f.write("<html></html>")
+    with open(json_path, "w") as f:
+        json.dump({"alerts": ["a is constant"], "variables": {}}, f)
+    return html_path, json_path
+
+
+class TestProfilingService(unittest.TestCase):
+    def setUp(self):
+        self.stored = {}
+        patches = [
+            mock.patch.object(profiling, "_build_report", side_effect=fake_build),
+            mock.patch.object(artifact_service, "backend", InMemoryStorageBackend()),
+            mock.patch.object(profiling.ProfilingService, "_stored_report", self.stored_report),
+            mock.patch.object(profiling.ProfilingService, "_store_report", self.store_report),
+        ]
+        self.build = patches[0].start()
+        for p in patches[1:]:
+            p.start()
+        for p in patches:
+            self.addCleanup(p.stop)
+        self.service = profiling.ProfilingService(workers=0, full_max_rows=10, sample_rows=20, wait_seconds=5)
+
+    async def stored_report(self, dataset_id, version):
+        keys = self.stored.get((dataset_id, version))
+        return profiling.ProfileReportResult(*keys) if keys else None
+
+    async def store_report(self, dataset_id, version, html_key, json_key):
+        self.stored[(dataset_id, version)] = (html_key, json_key)
+
+    def test_concurrent_requests_share_one_job(self):
+        async def main():
+            return await asyncio.gather(*(self.service.get_report(1, "v1", "/tmp/d.csv") for _ in range(3)))
+
+        results = asyncio.run(main())
+        self.assertEqual(self.build.call_count, 1)
+        self.assertEqual(len({r.html_key for r in results}), 1)
+        self.assertEqual(results[0].data["alerts"], ["a is constant"])
+        self.assertTrue(results[0].html_key.startswith("artifacts/datasets/1/"))
+
+    def test_stored_report_is_reused(self):
+        asyncio.run(self.service.get_report(1, "v1", "/tmp/d.csv"))
+        fresh = profiling.ProfilingService(workers=0, full_max_rows=10, sample_rows=20, wait_seconds=5)
+        asyncio.run(fresh.get_report(1, "v1", "/tmp/d.csv"))
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_returns_none_while_job_is_running(self):
+        async def main():
+            first = await self.service.get_report(1, "v1", "/tmp/d.csv", timeout=0.01)
+            second = await self.service.get_report(1, "v1", "/tmp/d.csv", timeout=5)
+            return first, second
+
+        first, second = asyncio.run(main())
+        self.assertIsNone(first)
+        self.assertIsNotNone(second)
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_release_waits_for_the_job(self):
+        released = []
+
+        async def main():
+            await self.service.get_report(1, "v1", "/tmp/d.csv", timeout=0.01, release=lambda: released.append(1))
+            self.assertEqual(released, [])  # the job still reads the file
+            await self.service.get_report(1, "v1", "/tmp/d.csv", timeout=5, release=lambda: released.append(2))
+            self.assertEqual(released, [2, 1])
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from core.ratelimit import InMemoryRateLimitBackend, RateLimiter, RateLimitExceeded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(calls=2, period=10, backend=InMemoryRateLimitBackend(clock=self.clock))
+
+    def acquire(self, user="u1", model="m", timeout=0):
+        return asyncio.run(self.limiter.acquire(user, model, timeout=timeout))
+
+    def test_burst_then_reject(self):
+        self.acquire()
+        self.acquire()
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            self.acquire()
+        self.assertAlmostEqual(ctx.exception.retry_after, 5.0)
+
+    def test_bucket_refills_continuously(self):
+        self.acquire()
+        self.acquire()
+        self.clock.now = 5.0
+        self.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            self.acquire()
+
+    def test_buckets_are_per_user_and_model(self):
+        self.acquire("u1")
+        self.acquire("u1")
+        self.acquire("u2")
+        self.acquire("u1", model="other")
+
+    def test_bounded_wait_succeeds_when_token_arrives(self):
+        limiter = RateLimiter(calls=1, period=0.2, max_wait=1.0)
+
+        async def twice():
+            await limiter.acquire("u1")
+            await limiter.acquire("u1")
+
+        asyncio.run(twice())
+
+    def test_bounded_wait_times_out(self):
+        limiter = RateLimiter(calls=1, period=60, max_wait=0.1)
+
+        async def twice():
+            await limiter.acquire("u1")
+            await limiter.acquire("u1")
+
+        with self.assertRaises(RateLimitExceeded):
+            asyncio.run(twice())
+
+
+if __name__ == '__main__':
+    unittest.main()
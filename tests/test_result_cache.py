@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+from agent.models import ToolResult
+from agent.result_cache import CachedResult, ResultCache, cache_key
+
+
+def entry(stdout="out"):
+    return CachedResult(result=ToolResult(stdout=stdout, locals={"a": "1"}, artifacts=["artifacts/c/k_plot.png"]))
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_formatting_and_comments_do_not_change_key(self):
+        a = cache_key("1:abc", "x = df['a'].sum()\nprint(x)")
+        b = cache_key("1:abc", "# total\nx = df[ 'a' ].sum()\n\nprint( x )")
+        self.assertIsNotNone(a)
+        self.assertEqual(a, b)
+
+    def test_dataset_version_changes_key(self):
+        self.assertNotEqual(cache_key("1:abc", "print(1)"), cache_key("1:def", "print(1)"))
+
+    def test_conversation_scopes_key(self):
+        self.assertNotEqual(cache_key("1:abc", "print(1)", scope="c1"), cache_key("1:abc", "print(1)", scope="c2"))
+        self.assertEqual(cache_key("1:abc", "print(1)", scope="c1"), cache_key("1:abc", "print(1)", scope="c1"))
+
+    def test_random_and_clock_code_is_not_cached(self):
+        self.assertIsNone(cache_key("1:abc", "import numpy as np\nx = np.random.rand(3)"))
+        self.assertIsNone(cache_key("1:abc", "from datetime import datetime\nprint(datetime.now())"))
+        self.assertIsNone(cache_key("1:abc", "print(df.sample(5))"))
+        self.assertIsNotNone(cache_key("1:abc", "print(df.sample(5, random_state=0))"))
+
+    def test_unversioned_or_invalid_code_is_not_cached(self):
+        self.assertIsNone(cache_key(None, "print(1)"))
+        self.assertIsNone(cache_key("1:abc", "print("))
+
+
+class TestResultCache(unittest.TestCase):
+    def test_hit_returns_independent_copy(self):
+        cache = ResultCache(ttl_seconds=60, max_bytes=10_000)
+        cache.put("k", entry())
+        hit = cache.get("k")
+        hit.result.stdout += "changed"
+        self.assertEqual(cache.get("k").result.stdout, "out")
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_entries_expire(self):
+        cache = ResultCache(ttl_seconds=60, max_bytes=10_000)
+        cache.put("k", entry())
+        with mock.patch("agent.result_cache.time.monotonic", return_value=cache._entries["k"].created_at + 61):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_discard_scope_drops_only_that_conversation(self):
+        cache = ResultCache(ttl_seconds=60, max_bytes=10_000)
+        for key, scope in [("a", "c1"), ("b", "c1"), ("c", "c2")]:
+            item = entry()
+            item.scope = scope
+            cache.put(key, item)
+        self.assertEqual(cache.discard_scope("c1"), 2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c").scope, "c2")
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_size_budget_evicts_oldest(self):
+        cache = ResultCache(ttl_seconds=60, max_bytes=200)
+        cache.put("a", entry("x" * 100))
+        cache.put("b", entry("y" * 100))
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,5 +30,18 @@ class TestSandboxing(unittest.TestCase):
         self.assertIsNone(result.error)
         self.assertIn('{"a": 1}', result.stdout)
 
+    def test_preloaded_aliases_need_no_import(self):
+        code = "s = pd.Series(np.arange(3))\nprint(int(s.sum()))"
+        result = run_code_capture(code)
+        self.assertIsNone(result.error)
+        self.assertIn('3', result.stdout)
+
+    def test_lazy_module_imports_on_first_use(self):
+        from agent.executor import LazyModule, import_timings
+        lazy = LazyModule("json")
+        self.assertIn("not loaded", repr(lazy))
+        self.assertEqual(lazy.dumps([1]), "[1]")
+        self.assertIn("json", import_timings)
+
 if __name__ == '__main__':
     unittest.main()
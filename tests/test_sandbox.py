@@ -0,0 +1,169 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from agent.sandbox import SPAWN_ATTEMPTS, SandboxPool, WorkerSpawnError
+from agent.shared_frames import SharedFrameRegistry, attach_frame
+from data.dataframe import write_columnar
+
+
+class TestSandboxPool(unittest.TestCase):
+    def run_with_pool(self, coro_factory, **kwargs):
+        options = dict(size=1, max_jobs_per_worker=2, max_rss_mb=4096, cpu_seconds=30, wall_seconds=30)
+        options.update(kwargs)
+        pool = SandboxPool(**options)
+
+        async def main():
+            try:
+                return await coro_factory(pool)
+            finally:
+                await pool.shutdown()
+
+        return asyncio.run(main()), pool
+
+    def test_runs_code_with_dataframe_in_worker(self):
+        async def job(pool):
+            return await pool.run("total = int(df.a.sum())\nprint(total)", {"df": pd.DataFrame({"a": [1, 2, 3]})})
+
+        result, pool = self.run_with_pool(job)
+        self.assertIsNone(result.error)
+        self.assertEqual(result.stdout.strip(), "6")
+        self.assertEqual(result.locals.get("total"), "6")
+
+    def test_wall_clock_limit_kills_and_replaces_worker(self):
+        async def job(pool):
+            timed_out = await pool.run("while True:\n    pass", {})
+            after = await pool.run("print('alive')", {})
+            return timed_out, after
+
+        (timed_out, after), pool = self.run_with_pool(job, wall_seconds=1)
+        self.assertIn("timed out", timed_out.error)
+        self.assertEqual(after.stdout.strip(), "alive")
+        self.assertEqual(pool.timeouts, 1)
+
+    def test_worker_recycled_after_max_jobs(self):
+        async def job(pool):
+            for _ in range(3):
+                await pool.run("x = 1", {})
+
+        _, pool = self.run_with_pool(job, max_jobs_per_worker=2)
+        self.assertEqual(pool.recycled, 1)
+        self.assertEqual(pool.jobs_run, 3)
+
+    def test_workers_not_ready_in_time_are_killed(self):
+        pool = SandboxPool(size=1, max_jobs_per_worker=2, max_rss_mb=4096, cpu_seconds=30, wall_seconds=30,
+                           spawn_timeout=0.001)
+
+        with self.assertRaises(WorkerSpawnError):
+            asyncio.run(pool.start())
+        self.assertEqual(pool.spawn_failures, SPAWN_ATTEMPTS)
+        self.assertEqual(pool.stats()["workers"], 0)
+        self.assertFalse(pool.started)
+
+    def test_failed_replacement_is_retried_in_background(self):
+        async def job(pool):
+            await pool.start()
+            spawn = pool._spawn_with_retry
+            pool._spawn_with_retry = mock.Mock(side_effect=[WorkerSpawnError("boom"), spawn()])
+            timed_out = await pool.run("while True:\n    pass", {})
+            after = await pool.run("print('alive')", {})
+            return timed_out, after
+
+        with mock.patch("agent.sandbox.RESPAWN_DELAY_SECONDS", 0.01):
+            (timed_out, after), pool = self.run_with_pool(job, wall_seconds=1)
+        self.assertIn("timed out", timed_out.error)
+        self.assertEqual(after.stdout.strip(), "alive")
+
+
+class TestSharedFrames(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = SharedFrameRegistry(root=self.tmp.name)
+        self.df = pd.DataFrame({"a": np.arange(5), "b": list("abcde")})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_attach_is_zero_copy_and_mutation_safe(self):
+        ref = self.registry.register(1, "v1", self.df)
+        view = attach_frame(ref)
+        self.assertFalse(view["a"].values.flags.writeable)
+
+        view.loc[0, "a"] = 100
+        self.assertEqual(view.loc[0, "a"], 100)
+        self.assertEqual(attach_frame(ref).loc[0, "a"], 0)
+
+    def test_new_version_replaces_old_file(self):
+        old = self.registry.register(1, "v1", self.df)
+        new = self.registry.register(1, "v2", self.df)
+        self.assertFalse(os.path.exists(old.path))
+        self.assertTrue(os.path.exists(new.path))
+
+        self.registry.clear()
+        self.assertFalse(os.path.exists(new.path))
+
+    def test_lru_datasets_unlinked_over_budget(self):
+        first = self.registry.register(1, "v1", self.df)
+        self.registry.max_bytes = os.path.getsize(first.path) * 2
+        second = self.registry.register(2, "v1", self.df)
+        self.registry.register(1, "v1", self.df)  # dataset 1 is now the most recent
+        third = self.registry.register(3, "v1", self.df)
+
+        self.assertTrue(os.path.exists(first.path))
+        self.assertFalse(os.path.exists(second.path))
+        self.assertTrue(os.path.exists(third.path))
+        stats = self.registry.stats()
+        self.assertEqual((stats["datasets"], stats["evictions"]), (2, 1))
+        self.assertLessEqual(stats["bytes"], self.registry.max_bytes)
+
+    def test_in_place_files_are_released_when_dropped(self):
+        released = []
+        arrow_path = os.path.join(self.tmp.name, "cached.arrow")
+        write_columnar(self.df, arrow_path)
+        self.registry.register(1, "v1", self.df, arrow_path, lambda: released.append("v1"))
+        self.registry.register(1, "v2", self.df, arrow_path, lambda: released.append("v2"))
+        self.assertEqual(released, ["v1"])
+        self.assertTrue(os.path.exists(arrow_path))  # not ours to unlink
+
+        self.registry.max_bytes = 0
+        self.registry.register(2, "v1", self.df)
+        self.assertEqual(released, ["v1", "v2"])
+
+    def test_unpublished_frame_is_sent_pickled(self):
+        ref = self.registry.register(1, "v1", self.df)
+        self.registry.clear()
+        pool = SandboxPool(size=1, max_jobs_per_worker=10, max_rss_mb=4096, cpu_seconds=30, wall_seconds=30)
+
+        async def main():
+            try:
+                return await pool.run("print(int(df.a.sum()))", {"df": self.df}, shared_refs={"df": ref})
+            finally:
+                await pool.shutdown()
+
+        result = asyncio.run(main())
+        self.assertIsNone(result.error)
+        self.assertEqual(result.stdout.strip(), "10")
+
+    def test_worker_attaches_shared_frame(self):
+        ref = self.registry.register(1, "v1", self.df)
+        pool = SandboxPool(size=1, max_jobs_per_worker=10, max_rss_mb=4096, cpu_seconds=30, wall_seconds=30)
+
+        async def main():
+            try:
+                # The placeholder would fail the job if it were sent instead of the ref
+                return await pool.run("print(int(df.a.sum()))", {"df": None}, shared_refs={"df": ref})
+            finally:
+                await pool.shutdown()
+
+        result = asyncio.run(main())
+        self.assertIsNone(result.error)
+        self.assertEqual(result.stdout.strip(), "10")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from agent.executor import run_code_capture
+from agent.sanitize import MAX_VALUE_CHARS, sanitize_locals, summarize_value
+
+
+class TestSanitizeLocals(unittest.TestCase):
+    def test_dataframe_summarized_by_shape_and_dtypes(self):
+        df = pd.DataFrame({"a": np.arange(100_000), "b": ["x"] * 100_000})
+        summary = summarize_value(df)
+        self.assertIn("shape=(100000, 2)", summary)
+        self.assertIn("a: int64", summary)
+        self.assertLessEqual(len(summary), MAX_VALUE_CHARS + 50)
+
+    def test_sequences_show_length_and_head(self):
+        summary = summarize_value(list(range(10_000)))
+        self.assertTrue(summary.startswith("list len=10000"))
+        self.assertIn("0, 1, 2", summary)
+        self.assertNotIn("9999", summary)
+
+    def test_long_strings_are_truncated(self):
+        summary = summarize_value("x" * 10_000)
+        self.assertLess(len(summary), 10_000)
+        self.assertIn("more chars", summary)
+
+    def test_unchanged_injected_locals_are_skipped(self):
+        df = pd.DataFrame({"a": [1]})
+        result = sanitize_locals({"df": df, "n": 1}, skip={"df": df})
+        self.assertEqual(result, {"n": "1"})
+
+    def test_rebound_injected_local_is_reported(self):
+        result = run_code_capture("df = df.head(1)", {"df": pd.DataFrame({"a": [1, 2]})})
+        self.assertIn("df", result.locals)
+        self.assertNotIn("output_dir", result.locals)
+
+
+if __name__ == '__main__':
+    unittest.main()
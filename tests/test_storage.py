@@ -0,0 +1,192 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from botocore.stub import Stubber
+
+from backend.core.artifacts import ArtifactService
+from backend.core.storage import InMemoryStorageBackend, LocalStorageBackend, S3StorageBackend, StorageService
+
+
+class TestStorageBackends(unittest.TestCase):
+    def test_memory_upload_download_roundtrip(self):
+        storage = StorageService(InMemoryStorageBackend())
+        key = asyncio.run(storage.aupload_file(io.BytesIO(b"a,b\n1,2\n"), "data.csv"))
+        self.assertEqual(key, "data.csv")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = os.path.join(tmp, "out.csv")
+            asyncio.run(storage.adownload_file(key, dest))
+            with open(dest, "rb") as f:
+                self.assertEqual(f.read(), b"a,b\n1,2\n")
+
+    def test_memory_missing_file(self):
+        storage = StorageService(InMemoryStorageBackend())
+        with self.assertRaises(FileNotFoundError):
+            asyncio.run(storage.adownload_file("missing.csv", "/tmp/never_written.csv"))
+
+    def test_local_upload_returns_filesystem_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = StorageService(LocalStorageBackend(tmp))
+            path = storage.upload_file(io.BytesIO(b"x"), "data.csv")
+            self.assertEqual(path, os.path.join(tmp, "data.csv"))
+            self.assertTrue(os.path.exists(path))
+
+
+class TestArtifactServiceAsync(unittest.TestCase):
+    def test_save_and_stream_artifact(self):
+        service = ArtifactService(InMemoryStorageBackend())
+        service.chunk_size = 4
+
+        async def roundtrip(path):
+            key = await service.asave_artifact(path, "conv1")
+            chunks = [chunk async for chunk in service.astream_artifact(key)]
+            return key, chunks
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "plot.html")
+            with open(path, "wb") as f:
+                f.write(b"<html></html>")
+            key, chunks = asyncio.run(roundtrip(path))
+
+        self.assertTrue(key.startswith("artifacts/conv1/"))
+        self.assertTrue(key.endswith("_plot.html"))
+        self.assertEqual(b"".join(chunks), b"<html></html>")
+        self.assertGreater(len(chunks), 1)
+
+    def test_commit_moves_staged_artifact_without_copying(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            service = ArtifactService(LocalStorageBackend(os.path.join(tmp, "uploads")))
+            staging_dir = service.create_staging_dir()
+            staged = os.path.join(staging_dir, "plot.png")
+            with open(staged, "wb") as f:
+                f.write(b"png")
+            inode = os.stat(staged).st_ino
+
+            key = asyncio.run(service.acommit_artifact(staged, "conv1"))
+            stored = service.backend.path_for(key)
+
+            self.assertFalse(os.path.exists(staged))
+            self.assertEqual(os.stat(stored).st_ino, inode)
+            self.assertFalse(staging_dir.startswith(service.backend.root + os.sep))
+
+    def test_commit_to_object_storage_consumes_staged_file(self):
+        service = ArtifactService(InMemoryStorageBackend())
+        staging_dir = service.create_staging_dir()
+        staged = os.path.join(staging_dir, "report.html")
+        with open(staged, "wb") as f:
+            f.write(b"<html></html>")
+
+        key = service.commit_artifact(staged, "conv1")
+        os.rmdir(staging_dir)
+        self.assertEqual(service.backend.objects[key], b"<html></html>")
+
+    def test_concurrent_saves_do_not_serialize_on_event_loop(self):
+        class SlowBackend(InMemoryStorageBackend):
+            def __init__(self):
+                super().__init__()
+                self.intervals = []
+
+            def put_file(self, file_path, key):
+                start = time.monotonic()
+                time.sleep(0.2)
+                super().put_file(file_path, key)
+                self.intervals.append((start, time.monotonic()))
+
+        service = ArtifactService(SlowBackend())
+
+        async def save_many(path):
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            tick_task = asyncio.ensure_future(ticker())
+            keys = await asyncio.gather(*(service.asave_artifact(path, "conv1") for _ in range(8)))
+            tick_task.cancel()
+            return keys, ticks
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "report.json")
+            with open(path, "w") as f:
+                f.write("{}")
+            keys, ticks = asyncio.run(save_many(path))
+
+        self.assertEqual(len(set(keys)), 8)
+        self.assertEqual(len(service.backend.objects), 8)
+        # Every save was in flight at once, and the loop kept running meanwhile
+        starts, ends = zip(*service.backend.intervals)
+        self.assertLess(max(starts), min(ends))
+        self.assertGreater(ticks, 5)
+
+
+class TestDeletePrefix(unittest.TestCase):
+    def test_local_and_memory_delete_only_the_prefix(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for backend in (LocalStorageBackend(tmp), InMemoryStorageBackend()):
+                service = ArtifactService(backend)
+                for key in ("artifacts/c1/a_plot.png", "artifacts/c1/b_report.html", "artifacts/c10/c_plot.png"):
+                    backend.put_fileobj(io.BytesIO(b"x"), key)
+
+                self.assertEqual(service.delete_conversation_artifacts("c1"), 2)
+                self.assertFalse(backend.exists("artifacts/c1/a_plot.png"))
+                self.assertTrue(backend.exists("artifacts/c10/c_plot.png"))
+                self.assertEqual(service.delete_conversation_artifacts("c1"), 0)
+
+    def test_delete_drops_cached_sizes_and_urls(self):
+        service = ArtifactService(InMemoryStorageBackend())
+        for key in ("artifacts/c1/a_plot.png", "artifacts/c10/c_plot.png"):
+            service.backend.put_fileobj(io.BytesIO(b"xy"), key)
+            service.get_artifact_size(key)
+            service._presigned[key] = ("https://signed", float("inf"))
+
+        service.delete_conversation_artifacts("c1")
+        self.assertEqual(list(service._sizes), ["artifacts/c10/c_plot.png"])
+        self.assertEqual(list(service._presigned), ["artifacts/c10/c_plot.png"])
+
+    def test_delete_file_takes_upload_file_result(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for backend in (LocalStorageBackend(tmp), InMemoryStorageBackend()):
+                service = StorageService(backend)
+                stored = service.upload_file(io.BytesIO(b"a,b\n"), "data.csv")
+                service.delete_file(stored)
+                self.assertFalse(backend.exists("data.csv"))
+                service.delete_file(stored)  # already gone
+
+    def test_rejects_ids_that_widen_the_prefix(self):
+        service = ArtifactService(InMemoryStorageBackend())
+        for bad in ("", "..", "c1/../c2"):
+            with self.assertRaises(ValueError):
+                service.delete_conversation_artifacts(bad)
+
+    def test_s3_deletes_in_batches(self):
+        with mock.patch.multiple("backend.core.storage.settings", AWS_ENDPOINT_URL="http://127.0.0.1:9000",
+                                 AWS_ACCESS_KEY_ID="minio", AWS_SECRET_ACCESS_KEY="minio123"):
+            backend = S3StorageBackend("bucket")
+
+        keys = [f"artifacts/c1/{i}_plot.png" for i in range(3)]
+        with Stubber(backend.s3_client) as stub:
+            stub.add_response("list_objects_v2",
+                              {"Contents": [{"Key": k} for k in keys[:2]], "IsTruncated": True,
+                               "NextContinuationToken": "t"},
+                              {"Bucket": "bucket", "Prefix": "artifacts/c1/", "MaxKeys": 1000})
+            stub.add_response("delete_objects", {},
+                              {"Bucket": "bucket", "Delete": {"Objects": [{"Key": k} for k in keys[:2]], "Quiet": True}})
+            stub.add_response("list_objects_v2", {"Contents": [{"Key": keys[2]}], "IsTruncated": False},
+                              {"Bucket": "bucket", "Prefix": "artifacts/c1/", "MaxKeys": 1000,
+                               "ContinuationToken": "t"})
+            stub.add_response("delete_objects", {"Errors": [{"Key": keys[2], "Code": "AccessDenied"}]},
+                              {"Bucket": "bucket", "Delete": {"Objects": [{"Key": keys[2]}], "Quiet": True}})
+            self.assertEqual(backend.delete_prefix("artifacts/c1/"), 2)
+            stub.assert_no_pending_responses()
+
+
+if __name__ == '__main__':
+    unittest.main()
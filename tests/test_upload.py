@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api.endpoints import router
+from backend.core.storage import InMemoryStorageBackend, StorageService
+
+
+async def failing_session():
+    raise RuntimeError("database unavailable")
+    yield
+
+
+class TestFailedUploadCleanup(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.backend = InMemoryStorageBackend()
+        for patcher in [
+            mock.patch("backend.api.endpoints.storage", StorageService(self.backend)),
+            mock.patch("backend.api.endpoints.tempfile.gettempdir", return_value=self.tmp.name),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        self.client = TestClient(app)
+
+    def upload(self, data: bytes):
+        return self.client.post("/api/upload", files={"file": ("t.csv", data, "text/csv")})
+
+    def test_database_failure_removes_stored_and_local_copies(self):
+        with mock.patch("backend.api.endpoints.get_session", failing_session):
+            response = self.upload(b"a,b\n1,2\n")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.backend.objects, {})
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_unparseable_file_removes_stored_and_local_copies(self):
+        response = self.upload(b"")
+        self.assertGreaterEqual(response.status_code, 400)
+        self.assertEqual(self.backend.objects, {})
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from agent.uploads import ArtifactUploader
+from backend.core.artifacts import ArtifactService
+from backend.core.storage import InMemoryStorageBackend
+
+
+class GatedBackend(InMemoryStorageBackend):
+    """Blocks uploads of files named slow_* until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def put_file(self, file_path, key):
+        if os.path.basename(file_path).startswith("slow_"):
+            self.release.wait(5)
+        super().put_file(file_path, key)
+
+
+def _stage(service, names):
+    staging_dir = service.create_staging_dir()
+    paths = []
+    for name in names:
+        path = os.path.join(staging_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"data")
+        paths.append(path)
+    return staging_dir, paths
+
+
+class TestArtifactUploader(unittest.TestCase):
+    def test_fast_uploads_are_released_while_slow_one_continues(self):
+        backend = GatedBackend()
+        service = ArtifactService(backend)
+
+        async def scenario():
+            uploader = ArtifactUploader(service, "conv1", concurrency=4)
+            staging_dir, paths = _stage(service, ["fast.png", "slow_report.html"])
+            committed = []
+            batch = uploader.submit(paths, staging_dir, on_committed=committed.append)
+            inline = [event async for event in uploader.wait(timeout=0.5)]
+            still_pending = uploader.pending
+            backend.release.set()
+            deferred = [event async for event in uploader.drain()]
+            return batch, inline, still_pending, deferred, committed, staging_dir
+
+        batch, inline, still_pending, deferred, committed, staging_dir = asyncio.run(scenario())
+
+        # URLs are known before the upload finishes
+        self.assertIn(batch[0].key, inline[0]["content"])
+        self.assertEqual(len(inline), 1)
+        self.assertNotIn("deferred", inline[0])
+        self.assertEqual(still_pending, 1)
+        self.assertEqual(len(deferred), 1)
+        self.assertTrue(deferred[0]["deferred"])
+        self.assertIn(batch[1].key, deferred[0]["content"])
+        self.assertEqual(committed, [batch])
+        self.assertTrue(backend.exists(batch[1].key))
+        self.assertFalse(os.path.exists(staging_dir))
+
+    def test_failed_upload_reports_status_and_skips_callback(self):
+        class FailingBackend(InMemoryStorageBackend):
+            def move_file(self, file_path, key):
+                raise OSError("disk full")
+
+        service = ArtifactService(FailingBackend())
+
+        async def scenario():
+            uploader = ArtifactUploader(service, "conv1", concurrency=2)
+            staging_dir, paths = _stage(service, ["plot.png"])
+            committed = []
+            uploader.submit(paths, staging_dir, on_committed=committed.append)
+            events = [event async for event in uploader.drain()]
+            return events, committed, staging_dir
+
+        events, committed, staging_dir = asyncio.run(scenario())
+
+        self.assertEqual(events[0]["type"], "status")
+        self.assertIn("disk full", events[0]["content"])
+        self.assertEqual(committed, [])
+        self.assertFalse(os.path.exists(staging_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()